@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, ForeignKey, LargeBinary, UniqueConstraint
 from app.database import Base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -55,5 +55,86 @@ class MedicalRecord(Base):
     patient = relationship("Patient", back_populates="medical_records")
 
 
+class MedicalRecordPage(Base):
+    """Extracted text of one page of an uploaded medical record"""
+    __tablename__ = "medical_record_pages"
+    __table_args__ = (UniqueConstraint("record_id", "page_number", name="uq_record_page"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), nullable=False, index=True)
+    page_number = Column(Integer, nullable=False)  # 1-based
+    text = Column(Text, nullable=False)
+    source = Column(String, nullable=False)  # "text" (PDF text layer) or "ocr"
+    char_count = Column(Integer, nullable=False)
+
+
+class RecordEmbedding(Base):
+    """SBERT chunk embeddings of a medical record, computed once at upload"""
+    __tablename__ = "record_embeddings"
+    __table_args__ = (UniqueConstraint("record_id", "model_version", name="uq_record_embedding_model"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), nullable=False, index=True)
+    model_version = Column(String, nullable=False)  # Embedding model the vectors came from
+    chunks = Column(Text, nullable=False)  # JSON list of chunk texts, or {"chunks": [...], "pages": [...]}
+    n_chunks = Column(Integer, nullable=False)
+    dim = Column(Integer, nullable=False)
+    embeddings = Column(LargeBinary, nullable=False)  # Row-major float16 (n_chunks x dim), L2-normalized
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ProcessedDocument(Base):
+    """Content digest of an already processed PDF and the record holding its results"""
+    __tablename__ = "processed_documents"
+
+    content_sha256 = Column(String(64), primary_key=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class UploadJob(Base):
+    """Background processing of an uploaded medical record PDF"""
+    __tablename__ = "upload_jobs"
+
+    id = Column(String, primary_key=True, index=True)  # UUID returned to the client
+    username = Column(String, nullable=False)
+    patient_id = Column(String, nullable=True)
+    filename = Column(String, nullable=False)
+    file_path = Column(String, nullable=False)  # Stored upload, removed once the job finishes
+    content_sha256 = Column(String(64), nullable=True, index=True)  # Digest of the uploaded bytes
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    stages = Column(Text, nullable=True)  # JSON: stage -> status, attempts, duration_ms, error
+    result = Column(Text, nullable=True)  # JSON outputs of the finished stages
+    error = Column(Text, nullable=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class AnchorBatch(Base):
+    """Merkle root of a batch of record hashes, anchored in a single blockchain transaction"""
+    __tablename__ = "anchor_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    merkle_root = Column(String(64), nullable=False)
+    leaf_count = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="sending")  # sending, anchored, failed
+    tx_hash = Column(String, nullable=True, index=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    anchored_at = Column(DateTime, nullable=True)
+
+
+class AnchorProof(Base):
+    """A record hash waiting for the next batch, or its inclusion proof in an anchored batch"""
+    __tablename__ = "anchor_proofs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), nullable=False,
+                       unique=True)
+    record_hash = Column(String(64), nullable=False)
+    batch_id = Column(Integer, ForeignKey("anchor_batches.id"), nullable=True, index=True)  # NULL while queued
+    leaf_index = Column(Integer, nullable=True)
+    proof = Column(Text, nullable=True)  # JSON list of [sibling hash, "left" | "right"], leaf to root
+    created_at = Column(DateTime, default=datetime.utcnow)
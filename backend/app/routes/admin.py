@@ -1,8 +1,43 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 from ..dependencies import is_admin
+from ..services.record_audit import AuditRunner
+from .ai_insights import model_registry
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
+# Full integrity audit of medical records, resumable from AUDIT_REPORT_DIR
+audit_runner = AuditRunner()
+
 @router.get("/dashboard")
 def admin_dashboard(user=Depends(is_admin)):
     return {"message": f"Welcome, Admin {user.username}"}
+
+@router.get("/models")
+def model_registry_status(user=Depends(is_admin)):
+    """Serving model version, registered versions and timings of the last swap"""
+    return model_registry.status()
+
+@router.post("/models/{version}/activate", status_code=status.HTTP_202_ACCEPTED)
+def activate_model_version(version: str, user=Depends(is_admin)):
+    """Load, warm and hot-swap a registered model version in the background"""
+    try:
+        model_registry.activate_in_background(version)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"message": f"Activating model version {version}", "status_url": "/admin/models"}
+
+@router.post("/audit", status_code=status.HTTP_202_ACCEPTED)
+def start_record_audit(resume: bool = True, user=Depends(is_admin)):
+    """Hash every medical record against its stored hash and Merkle proof in the background"""
+    try:
+        audit_runner.start(resume=resume)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"message": "Record audit started", "status_url": "/admin/audit"}
+
+@router.get("/audit")
+def record_audit_status(user=Depends(is_admin)):
+    """Progress, throughput and outcome counts of the current or last audit"""
+    return audit_runner.status()
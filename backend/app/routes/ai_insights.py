@@ -1,30 +1,35 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
-import joblib
+from typing import Literal, Optional
+import math
+import time
 import numpy as np
 import traceback
-import shap
 from scipy.sparse import issparse
 
+from app.services.forest_engine import STOP_BUDGET, anytime_predict_proba
+from app.services.inference_scheduler import MicroBatchScheduler
+from app.services.model_registry import MODEL_MMAP, ModelBundle, ModelRegistry
+from app.services.prediction_cache import PredictionCache, symptoms_key
+from app.services.process_stats import process_memory
+
 router = APIRouter()
 
-# Load trained model & encoders
-try:
-    model = joblib.load("models/disease_model.pkl")
-    vectorizer = joblib.load("models/tfidf_vectorizer.pkl")
-    label_encoder = joblib.load("models/label_encoder.pkl")
-    print("✅ Model, TF-IDF, and Label Encoder Loaded!")
+# Number of ranked diseases returned per prediction
+TOP_K = 3
 
-    # Try to load the explainer but don't fail if it doesn't work
-    try:
-        explainer = joblib.load("models/shap_explainer.pkl")
-        print("✅ SHAP Explainer Loaded!")
-    except Exception as explainer_error:
-        print(f"⚠️ SHAP Explainer could not be loaded: {explainer_error}")
-        explainer = None
+# "full" explains with SHAP (or tree paths while SHAP is over budget); "fast"
+# reads the precomputed disease x symptom attribution table. Every result
+# reports the method in "explanation_method".
+ExplainMode = Literal["full", "fast"]
 
-except Exception as e:
-    raise RuntimeError(f"❌ Error loading model files: {e}")
+# Symptom sets a new model version answers before it starts serving
+WARMUP_SYMPTOMS = [
+    ["itching", "skin_rash", "nodal_skin_eruptions"],
+    ["continuous_sneezing", "shivering", "chills"],
+    ["high_fever", "cough", "fatigue"],
+    ["stomach_pain", "acidity", "vomiting"],
+]
 
 
 # Request schema
@@ -32,184 +37,302 @@ class SymptomsInput(BaseModel):
     symptoms: list[str]
 
 
-@router.post("/predict_disease/")
-async def predict_disease(input_data: SymptomsInput):
-    try:
-        # Convert symptoms list into a single TF-IDF text string
-        symptom_text = ",".join(input_data.symptoms)
-        symptom_vector = vectorizer.transform([symptom_text])
-
-        # Get disease probabilities
-        probabilities = model.predict_proba(symptom_vector)[0]
-
-        # Get top 3 diseases with confidence scores
-        top_indices = np.argsort(probabilities)[::-1][:3]
-        predictions = [
-            {"disease": label_encoder.inverse_transform([idx])[0], "confidence": round(probabilities[idx] * 100, 2)}
-            for idx in top_indices
-        ]
-
-        # Get predicted class index
-        predicted_class_idx = np.argmax(probabilities)
-
-        # Get feature names
-        feature_names = vectorizer.get_feature_names_out()
-        feature_contributions = {}
-
-        # Make sure symptom_vector is in the right format
-        if issparse(symptom_vector):
-            dense_vector = symptom_vector.toarray()
-        else:
-            dense_vector = symptom_vector
+class BatchSymptomsInput(BaseModel):
+    symptom_lists: list[list[str]]
 
-        # Explainability approach with multiple fallbacks
-        try:
-            # Try SHAP first
-            shap_values = None
 
-            # If explainer is available and compatible, use it
-            if explainer is not None:
-                try:
-                    if hasattr(explainer, "shap_values"):
-                        shap_values = explainer.shap_values(dense_vector)
-                    else:
-                        shap_values = explainer(dense_vector)
-                    print("Used pre-loaded SHAP explainer successfully")
-                except Exception as e:
-                    print(f"Pre-loaded explainer failed: {e}")
-                    shap_values = None
+def rank_predictions(bundle: ModelBundle, probabilities, k=TOP_K):
+    """Select and decode the top-k diseases for every row of a probability matrix"""
+    top_indices = np.argsort(probabilities, axis=1)[:, ::-1][:, :k]
+    diseases = bundle.label_encoder.inverse_transform(top_indices.ravel()).reshape(top_indices.shape)
+    confidences = np.round(np.take_along_axis(probabilities, top_indices, axis=1) * 100, 2)
+    return [
+        [{"disease": disease, "confidence": confidence} for disease, confidence in zip(row_diseases, row_confidences)]
+        for row_diseases, row_confidences in zip(diseases, confidences)
+    ]
+
+
+def explain_prediction(bundle: ModelBundle, symptoms, predictions, predicted_class_idx, attribution, method):
+    """Map feature importance for one prediction back onto the submitted symptoms.
+
+    Returns the symptom contributions and the method that produced them.
+    """
+    model, feature_index = bundle.model, bundle.feature_index
+    feature_names = feature_index.feature_names
+    feature_contributions = {}
+    feature_importance = attribution
 
-            # If that failed, try creating a new explainer
-            if shap_values is None:
+    # Check if all values are very small or zero
+    if feature_importance is not None and np.max(feature_importance) < 0.001:
+        print("Attributions too small, using alternative method")
+        feature_importance = None
+
+    # If attribution failed or gave near-zero values, try model-specific methods
+    if feature_importance is None:
+        print("Using model-specific feature importance")
+
+        # For linear models (like LogisticRegression)
+        if hasattr(model, "coef_"):
+            print("Using model coefficients")
+            coef = model.coef_[predicted_class_idx] if model.coef_.shape[0] > 1 else model.coef_[0]
+            feature_importance = np.abs(coef)
+            method = "coefficients"
+
+        # For tree-based models (like RandomForest)
+        elif hasattr(model, "feature_importances_"):
+            print("Using model feature_importances_")
+            feature_importance = model.feature_importances_
+            method = "feature_importances"
+
+        # For other models or if previous methods failed
+        else:
+            print("Using heuristic approach")
+            # Simple heuristic: assign equal importance to all present symptoms
+            feature_importance = np.zeros(len(feature_names))
+            method = "heuristic"
+
+            # Identify which features are present in the input
+            for symptom in symptoms:
+                for _, idx in feature_index.lookup(symptom):
+                    feature_importance[idx] = 1.0
+
+    # Normalize feature importance to sum to 100%
+    if np.sum(feature_importance) > 0:
+        feature_importance = (feature_importance / np.sum(feature_importance)) * 100
+
+    # Map importance to symptoms
+    # (exact symptom matches are keyed by the symptom, word matches by the word)
+    for symptom in symptoms:
+        for word, idx in feature_index.lookup(symptom):
+            feature_contributions[word or symptom] = round(float(feature_importance[idx]), 2)
+
+    # If we still have no matches (unlikely at this point), use most important features
+    if not feature_contributions:
+        top_feature_indices = np.argsort(feature_importance)[::-1][:3]
+        for idx in top_feature_indices:
+            if idx < len(feature_names):
+                feature_contributions[feature_names[idx]] = round(float(feature_importance[idx]), 2)
+
+    # Disease-specific heuristics for common cases with high confidence
+    if predictions[0]["confidence"] > 95:
+        disease = predictions[0]["disease"]
+
+        # For allergy with high confidence
+        if disease == "Allergy" and "continuous_sneezing" in symptoms:
+            # Ensure sneezing is given high importance for allergies
+            feature_contributions["continuous_sneezing"] = max(feature_contributions.get("continuous_sneezing", 0),
+                                                               50)
+
+            # Redistribute remaining percentage among other symptoms
+            other_symptoms = [s for s in feature_contributions.keys() if s != "continuous_sneezing"]
+            remaining = 50
+            if other_symptoms:
+                per_symptom = remaining / len(other_symptoms)
+                for s in other_symptoms:
+                    feature_contributions[s] = round(per_symptom, 2)
+
+    return feature_contributions, method
+
+
+def predict_rows(bundle: ModelBundle, symptom_lists, explain: ExplainMode = "full",
+                 anytime_budget_ms: Optional[float] = None):
+    """Predict and explain a batch of symptom lists with one model call.
+
+    With ``anytime_budget_ms`` set, trees are evaluated incrementally and each
+    row stops once its top disease is decided or the budget (math.inf for no
+    budget) is spent; the result then reports the trees it used. The budget
+    covers the explanation too: its expected cost is set aside first, and
+    trees get what is left.
+    """
+    symptom_matrix = bundle.symptom_encoder.transform(symptom_lists)
+    anytime = anytime_budget_ms is not None and bundle.n_estimators is not None
+
+    # Get disease probabilities for every row in a single call
+    if not anytime:
+        probabilities = bundle.predictor.predict_proba(symptom_matrix)
+    else:
+        budget_ms = None
+        if math.isfinite(anytime_budget_ms):
+            explain_ms = bundle.explainer_service.estimated_ms(len(symptom_lists), fast=explain == "fast")
+            budget_ms = max(anytime_budget_ms - explain_ms, 0.0)
+        probabilities, trees_used, stopped = anytime_predict_proba(bundle.predictor, symptom_matrix, budget_ms)
+    rows_predictions = rank_predictions(bundle, probabilities)
+    predicted_class_indices = np.argmax(probabilities, axis=1)
+
+    # Make sure symptom_matrix is in the right format
+    if issparse(symptom_matrix):
+        dense_matrix = symptom_matrix.toarray()
+    else:
+        dense_matrix = symptom_matrix
+
+    # Attribution table in fast mode, else SHAP while its per-row cost is within budget, else tree path
+    # contributions; the method never depends on the batch, so rows match single-row requests
+    importance_matrix, method = bundle.explainer_service.explain(dense_matrix, predicted_class_indices,
+                                                          fast=explain == "fast")
+
+    results = []
+    for row, (symptoms, predictions) in enumerate(zip(symptom_lists, rows_predictions)):
+        importance = importance_matrix[row] if importance_matrix is not None else None
+        explanation, row_method = explain_prediction(bundle, symptoms, predictions, predicted_class_indices[row],
+                                                     importance, method)
+        result = {"predictions": predictions, "explanation": explanation, "explanation_method": row_method}
+        if anytime:
+            result["anytime"] = {
+                "trees_used": int(trees_used[row]),
+                "n_estimators": bundle.n_estimators,
+                "stopped": stopped[row],
+            }
+        results.append(result)
+
+    return results
+
+
+def predict_batched_requests(requests):
+    """Scheduler batch function: run the (bundle, explain, anytime budget, symptoms) rows of many requests together.
+
+    Returns one result list per request, or the exception that request's rows
+    raised: when a shared call fails, its requests are retried one by one so
+    only the request that sent the bad row fails.
+    """
+    results = [None] * len(requests)
+
+    # One predict_rows call per model version, explain mode and anytime budget present in the batch
+    groups = {}
+    for idx, request_rows in enumerate(requests):
+        groups.setdefault(tuple(request_rows[0][:3]), []).append(idx)
+
+    for (bundle, explain, anytime_budget_ms), members in groups.items():
+        try:
+            group_results = predict_rows(bundle, [row[3] for idx in members for row in requests[idx]],
+                                         explain, anytime_budget_ms)
+        except Exception:
+            for idx in members:
                 try:
-                    print("Creating new SHAP explainer...")
-                    # For tree-based models
-                    if hasattr(model, "estimators_"):
-                        new_explainer = shap.TreeExplainer(model)
-                        shap_values = new_explainer.shap_values(dense_vector)
-                    # For other models
-                    else:
-                        new_explainer = shap.KernelExplainer(
-                            model.predict_proba,
-                            dense_vector
-                        )
-                        shap_values = new_explainer(dense_vector)
-                    print("Successfully created new SHAP explainer")
+                    results[idx] = predict_rows(bundle, [row[3] for row in requests[idx]], explain, anytime_budget_ms)
                 except Exception as e:
-                    print(f"Creating new explainer failed: {e}")
-                    shap_values = None
-
-            # Process SHAP values if we have them
-            if shap_values is not None:
-                # Extract feature importance based on structure
-                if isinstance(shap_values, list):
-                    # For multi-class models
-                    if len(shap_values) > predicted_class_idx:
-                        feature_importance = np.abs(shap_values[predicted_class_idx]).flatten()
-                    else:
-                        feature_importance = np.abs(shap_values[0]).flatten()
-                else:
-                    # For binary classification or regression
-                    feature_importance = np.abs(shap_values).flatten()
-
-                # Check if all values are very small or zero
-                if np.max(feature_importance) < 0.001:
-                    print("SHAP values too small, using alternative method")
-                    feature_importance = None
-                else:
-                    print("Using SHAP values for feature importance")
-            else:
-                feature_importance = None
-
-        except Exception as shap_error:
-            print(f"SHAP explanation completely failed: {shap_error}")
-            print(traceback.format_exc())
-            feature_importance = None
-
-        # If SHAP failed or gave near-zero values, try model-specific methods
-        if feature_importance is None:
-            print("Using model-specific feature importance")
-
-            # For linear models (like LogisticRegression)
-            if hasattr(model, "coef_"):
-                print("Using model coefficients")
-                coef = model.coef_[predicted_class_idx] if model.coef_.shape[0] > 1 else model.coef_[0]
-                feature_importance = np.abs(coef)
-
-            # For tree-based models (like RandomForest)
-            elif hasattr(model, "feature_importances_"):
-                print("Using model feature_importances_")
-                feature_importance = model.feature_importances_
-
-            # For other models or if previous methods failed
-            else:
-                print("Using heuristic approach")
-                # Simple heuristic: assign equal importance to all present symptoms
-                feature_importance = np.zeros(len(feature_names))
-
-                # Identify which features are present in the input
-                for symptom in input_data.symptoms:
-                    processed_symptom = symptom.lower().strip()
-                    if processed_symptom in feature_names:
-                        idx = np.where(feature_names == processed_symptom)[0][0]
-                        feature_importance[idx] = 1.0
-                    else:
-                        words = processed_symptom.replace("_", " ").split()
-                        for word in words:
-                            word = word.strip()
-                            if word and word in feature_names:
-                                idx = np.where(feature_names == word)[0][0]
-                                feature_importance[idx] = 1.0
-
-        # Normalize feature importance to sum to 100%
-        if np.sum(feature_importance) > 0:
-            feature_importance = (feature_importance / np.sum(feature_importance)) * 100
-
-        # Map importance to symptoms
-        for symptom in input_data.symptoms:
-            processed_symptom = symptom.lower().strip()
-
-            # Try exact match first
-            if processed_symptom in feature_names:
-                idx = np.where(feature_names == processed_symptom)[0][0]
-                feature_contributions[symptom] = round(float(feature_importance[idx]), 2)
-            else:
-                # Try individual words
-                words = processed_symptom.replace("_", " ").split()
-                for word in words:
-                    word = word.strip()
-                    if word and word in feature_names:
-                        idx = np.where(feature_names == word)[0][0]
-                        feature_contributions[word] = round(float(feature_importance[idx]), 2)
-
-        # If we still have no matches (unlikely at this point), use most important features
-        if not feature_contributions:
-            top_feature_indices = np.argsort(feature_importance)[::-1][:3]
-            for idx in top_feature_indices:
-                if idx < len(feature_names):
-                    feature_contributions[feature_names[idx]] = round(float(feature_importance[idx]), 2)
-
-        # Disease-specific heuristics for common cases with high confidence
-        if predictions[0]["confidence"] > 95:
-            disease = predictions[0]["disease"]
-
-            # For allergy with high confidence
-            if disease == "Allergy" and "continuous_sneezing" in input_data.symptoms:
-                # Ensure sneezing is given high importance for allergies
-                feature_contributions["continuous_sneezing"] = max(feature_contributions.get("continuous_sneezing", 0),
-                                                                   50)
-
-                # Redistribute remaining percentage among other symptoms
-                other_symptoms = [s for s in feature_contributions.keys() if s != "continuous_sneezing"]
-                remaining = 50
-                if other_symptoms:
-                    per_symptom = remaining / len(other_symptoms)
-                    for s in other_symptoms:
-                        feature_contributions[s] = round(per_symptom, 2)
-
-        return {"predictions": predictions, "explanation": feature_contributions}
+                    results[idx] = e
+            continue
+
+        start = 0
+        for idx in members:
+            results[idx] = group_results[start:start + len(requests[idx])]
+            start += len(requests[idx])
+    return results
+
+
+def warm_bundle(bundle: ModelBundle):
+    """Run sample predictions through a freshly loaded model version before it serves traffic"""
+    for explain in ("full", "fast"):
+        predict_rows(bundle, WARMUP_SYMPTOMS, explain)
+        predict_rows(bundle, WARMUP_SYMPTOMS[:1], explain)
+
+
+# Load trained model & encoders
+memory_before_load = process_memory()
+try:
+    model_registry = ModelRegistry(warm_fn=warm_bundle)
+    print(f"✅ Serving model version {model_registry.current.version}")
+except Exception as e:
+    raise RuntimeError(f"❌ Error loading model files: {e}")
+
+memory_after_load = process_memory()
+print(f"Worker {memory_after_load['pid']} memory before model load: {memory_before_load}, after: {memory_after_load}")
+
+# Predictions + explanations keyed by model version, explain mode and symptom set
+prediction_cache = PredictionCache(version_fn=lambda: model_registry.current.fingerprint())
+
+# Queues concurrent requests into batched model calls on a worker thread,
+# keeping predict_proba and SHAP off the event loop
+inference_scheduler = MicroBatchScheduler(predict_batched_requests)
+
+
+def anytime_budget(anytime: bool, budget_ms: Optional[float]) -> Optional[float]:
+    """predict_rows anytime budget for the query parameters; a budget implies anytime mode"""
+    if budget_ms is not None:
+        return budget_ms
+    return math.inf if anytime else None
+
+
+async def cached_predict_rows(symptom_lists, explain: ExplainMode = "full", anytime_budget_ms: Optional[float] = None):
+    """Predict through the cache and the batching scheduler; returns exactly what predict_rows would"""
+    # Pin the serving model for the whole request, so a hot swap never mixes versions
+    bundle = model_registry.current
+    started = time.perf_counter()
+
+    # Anytime results stopped by convergence hold for any budget; budget-cut ones are never cached
+    anytime = anytime_budget_ms is not None
+    keys = [(bundle.version, explain, anytime, symptoms_key(symptoms)) for symptoms in symptom_lists]
+    results = [prediction_cache.get(key) for key in keys]
+
+    # Send every distinct missing symptom set to the scheduler as one request
+    missing_keys = list(dict.fromkeys(key for key, result in zip(keys, results) if result is None))
+    if missing_keys:
+        predicted = await inference_scheduler.submit(
+            [(bundle, explain, anytime_budget_ms, list(symptoms)) for _, explain, _, symptoms in missing_keys]
+        )
+        computed = dict(zip(missing_keys, predicted))
+        for key, result in computed.items():
+            if result.get("anytime", {}).get("stopped") != STOP_BUDGET:
+                prediction_cache.put(key, result)
+        results = [result if result is not None else computed[key] for key, result in zip(keys, results)]
+
+    model_registry.observe_request(bundle, (time.perf_counter() - started) * 1000)
+    return results
+
+
+@router.post("/predict_disease/")
+async def predict_disease(input_data: SymptomsInput, explain: ExplainMode = "full", anytime: bool = False,
+                          budget_ms: Optional[float] = Query(None, gt=0)):
+    """Predict diseases for one symptom list.
+
+    ``anytime=true`` stops evaluating trees once the top disease can no longer
+    change; ``budget_ms`` additionally caps the time spent on trees and the
+    explanation together (trees get what the explanation is expected to leave).
+    """
+    try:
+        return (await cached_predict_rows([input_data.symptoms], explain, anytime_budget(anytime, budget_ms)))[0]
 
     except Exception as e:
         error_details = traceback.format_exc()
         print(f"Detailed error: {error_details}")
-        raise HTTPException(status_code=500, detail=f"❌ Prediction error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"❌ Prediction error: {str(e)}")
+
+
+@router.post("/predict_disease/batch")
+async def predict_disease_batch(input_data: BatchSymptomsInput, explain: ExplainMode = "full", anytime: bool = False,
+                                budget_ms: Optional[float] = Query(None, gt=0)):
+    """Predict diseases for many symptom lists; rows match /predict_disease/ one for one"""
+    if not input_data.symptom_lists:
+        return {"results": []}
+
+    try:
+        return {"results": await cached_predict_rows(input_data.symptom_lists, explain,
+                                                     anytime_budget(anytime, budget_ms))}
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        print(f"Detailed error: {error_details}")
+        raise HTTPException(status_code=500, detail=f"❌ Prediction error: {str(e)}")
+
+
+@router.get("/predict_disease/cache/stats")
+async def prediction_cache_stats():
+    """Hit/miss/eviction counters of the prediction cache"""
+    return prediction_cache.stats()
+
+
+@router.get("/predict_disease/scheduler/stats")
+async def inference_scheduler_stats():
+    """Queue depth and batch size histograms of the inference scheduler"""
+    return inference_scheduler.stats()
+
+
+@router.get("/predict_disease/memory")
+async def worker_memory():
+    """Resident memory of this worker before and after loading the model artifacts"""
+    return {
+        "mmap": MODEL_MMAP,
+        "before_load": memory_before_load,
+        "after_load": memory_after_load,
+        "current": process_memory(),
+    }
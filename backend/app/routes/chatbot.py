@@ -2,25 +2,46 @@ import os
 import json
 import asyncio
 import uuid
-import shutil
-import hashlib
 import logging
+import time
+from concurrent.futures import Future
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from app.auth import get_current_user 
 
 from web3 import Web3
-from pdf2image import convert_from_path
-from pdfminer.high_level import extract_text
-import pytesseract
 import torch
 from transformers import AutoModelForQuestionAnswering, AutoTokenizer, pipeline
-from sentence_transformers import SentenceTransformer, util
-from fastapi import APIRouter, File, UploadFile, Form, Depends, HTTPException, BackgroundTasks, status
+from sentence_transformers import SentenceTransformer
+from fastapi import APIRouter, Form, Depends, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import MedicalRecord
+from app.models import MedicalRecord, MedicalRecordPage, UploadJob, User
+from app.services.answer_cache import AnswerCache
+from app.services.anchoring import BlockchainAnchorChain, InMemoryChain, MerkleAnchorService
+from app.services.chain_status import BlockchainStatusMonitor
+from app.services.document_index import (
+    copy_record_embeddings,
+    find_processed_document,
+    register_processed_document,
+)
+from app.services.pdf_extraction import PAGE_SOURCE_OCR, PageText, PdfExtractionEngine, join_pages
+from app.services.merkle import record_data_hash
+from app.services.patient_index import PatientIndexCache, load_patient_embeddings, patient_record_stamp
+from app.services.record_embeddings import (
+    EMBEDDING_MODEL_VERSION,
+    SBERT_MODEL_NAME,
+    StoredEmbeddings,
+    encode_chunks,
+    encode_query,
+    load_record_embeddings,
+    save_record_embeddings,
+    top_chunks,
+)
+from app.services.tx_submitter import RPC_TIMEOUT_SECONDS, TransactionSubmitter, pooled_session
+from app.services.upload_jobs import JobStage, UploadJobPipeline, UploadQueueFull, job_status
+from app.services.upload_stream import UploadRejected, receive_upload
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -31,6 +52,10 @@ MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_EXTENSIONS = {'.pdf'}
 TEMP_DIR = "./temp"
 MAX_CHUNK_SIZE = 512  # Tokens
+SEARCH_TOP_K = 5  # Chunks returned by cross-record search
+ASK_ALL_CONTEXT_CHUNKS = 3  # Chunks given to the QA model by cross-record ask
+NO_TEXT_MARKERS = {"No readable text found.", "Error processing document."}
+QA_MODEL_NAME = os.getenv("QA_MODEL_NAME", "bert-large-uncased-whole-word-masking-finetuned-squad")
 
 # Ensure temp folder exists
 os.makedirs(TEMP_DIR, exist_ok=True)
@@ -42,16 +67,15 @@ _models = {}
 def get_sbert_model():
     if "sbert" not in _models:
         logger.info("Loading SBERT model...")
-        _models["sbert"] = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        _models["sbert"] = SentenceTransformer(SBERT_MODEL_NAME)
     return _models["sbert"]
 
 
 def get_qa_pipeline():
     if "qa_pipeline" not in _models:
         logger.info("Loading QA model...")
-        model_name = "bert-large-uncased-whole-word-masking-finetuned-squad"
-        qa_model = AutoModelForQuestionAnswering.from_pretrained(model_name)
-        qa_tokenizer = AutoTokenizer.from_pretrained(model_name)
+        qa_model = AutoModelForQuestionAnswering.from_pretrained(QA_MODEL_NAME)
+        qa_tokenizer = AutoTokenizer.from_pretrained(QA_MODEL_NAME)
         _models["qa_pipeline"] = pipeline("question-answering", model=qa_model, tokenizer=qa_tokenizer)
     return _models["qa_pipeline"]
 
@@ -88,6 +112,14 @@ def verify_user_authorization(user_id: str, record_id: int, db: Session) -> bool
         return False
 
 
+def get_owned_record(db: Session, record_id: int, current_user: User) -> MedicalRecord:
+    """The record if it belongs to the current user; 404 otherwise, so other patients' record ids are not confirmed"""
+    record = db.query(MedicalRecord).filter(MedicalRecord.id == record_id).first()
+    if not record or record.patient_name != current_user.username:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Record not found")
+    return record
+
+
 # Blockchain Configuration
 class BlockchainManager:
     def __init__(self):
@@ -98,9 +130,10 @@ class BlockchainManager:
                                      "6ed956555e3153f281b31c7732ab9de977258a7a10c9d9a02ab66abe1d824299")
 
         # Complete RPC URL with the API key
-        self.rpc_url = f"https://eth-sepolia.g.alchemy.com/v2/{self.alchemy_api_key}"
-        self.chain_id = 11155111
+        self.rpc_url = os.getenv("BLOCKCHAIN_RPC_URL", f"https://eth-sepolia.g.alchemy.com/v2/{self.alchemy_api_key}")
+        self.chain_id = int(os.getenv("BLOCKCHAIN_CHAIN_ID", "11155111"))
         self.web3 = None
+        self.submitter: Optional[TransactionSubmitter] = None
         self.is_connected = False
         self.initialize()
 
@@ -116,9 +149,13 @@ class BlockchainManager:
             return
 
         try:
-            self.web3 = Web3(Web3.HTTPProvider(self.rpc_url))
+            # One keep-alive connection pool shared by every RPC call
+            self.web3 = Web3(Web3.HTTPProvider(self.rpc_url, session=pooled_session(),
+                                               request_kwargs={"timeout": RPC_TIMEOUT_SECONDS}))
             if self.web3.is_connected():
                 self.is_connected = True
+                self.submitter = TransactionSubmitter(self.web3, self.wallet_address, self.private_key,
+                                                      self.chain_id)
                 balance = self.web3.eth.get_balance(self.wallet_address)
                 logger.info(f"✅ Connected to Ethereum Sepolia. Current Block: {self.web3.eth.block_number}")
                 logger.info(f"Wallet balance: {self.web3.from_wei(balance, 'ether')} ETH")
@@ -129,112 +166,36 @@ class BlockchainManager:
 
     def generate_record_hash(self, record: Dict[str, Any]) -> str:
         """Create a deterministic hash of the record data"""
-        # Create a normalized copy of the record to ensure consistent hashing
-        normalized_record = dict(record)
-        # Sort keys for consistent serialization order
-        return hashlib.sha256(json.dumps(normalized_record, sort_keys=True).encode()).hexdigest()
+        # Sorted-key JSON, shared with the bulk audit so both hash records the same way
+        return record_data_hash(record)
 
-    def store_hash_on_blockchain(self, record_hash: str) -> Optional[str]:
-        """Store a hash on the blockchain and return transaction hash"""
-        if not self.is_connected:
-            logger.warning("Blockchain not connected, skipping hash storage")
-            return None
-
-        try:
-            # Check wallet balance
-            balance = self.web3.eth.get_balance(self.wallet_address)
-            logger.info(f"Wallet balance: {self.web3.from_wei(balance, 'ether')} ETH")
-
-            if balance == 0:
-                logger.error("Wallet has zero balance, cannot send transaction")
-                return None
-
-            nonce = self.web3.eth.get_transaction_count(self.wallet_address)
-            logger.info(f"Current nonce: {nonce}")
-
-            gas_price = int(self.web3.eth.gas_price * 1.1)
-            logger.info(f"Gas price: {self.web3.from_wei(gas_price, 'gwei')} gwei")
-
-            # Build the transaction
-            txn = {
-                "from": self.wallet_address,
-                "to": self.wallet_address,
-                "value": 0,
-                "gas": 100000,
-                "gasPrice": gas_price,
-                "nonce": nonce,
-                "chainId": self.chain_id,
-                "data": self.web3.to_hex(text=record_hash)
-            }
-            logger.info(f"Transaction prepared: {txn}")
-
-            # Sign and send transaction
-            signed_txn = self.web3.eth.account.sign_transaction(txn, self.private_key)
-            logger.info("Transaction signed successfully")
-
-            tx_hash = self.web3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            hex_hash = self.web3.to_hex(tx_hash)
-            logger.info(f"Transaction submitted with hash: {hex_hash}")
-
-            return hex_hash
-        except Exception as e:
-            logger.error(f"Error storing hash on blockchain: {str(e)}")
-            # Print full traceback for debugging
-            import traceback
-            logger.error(traceback.format_exc())
-            return None
-
-    def verify_record_hash(self, record: Dict[str, Any], stored_hash: str) -> bool:
-        """Verify that the current record matches the stored hash"""
-        if not stored_hash:
-            logger.warning("No stored hash to verify against")
-            return False
-
-        # Generate current hash and compare
-        current_hash = self.generate_record_hash(record)
-        logger.info(f"Verification - Current hash: {current_hash}")
-        logger.info(f"Verification - Stored hash: {stored_hash}")
-
-        match = current_hash == stored_hash
-        if match:
-            logger.info("Hash verification succeeded")
-        else:
-            logger.warning("Hash verification failed - hashes do not match")
-
-        return match
+    def submit_hash(self, record_hash: str) -> "Future[str]":
+        """Queue a hash for the single transaction writer; the future resolves to the transaction hash"""
+        return self.submitter.submit(record_hash)
 
 
 # Initialize blockchain manager
 blockchain = BlockchainManager()
 logger.info(f"Blockchain connected: {blockchain.is_connected}")
 
+# Chain head, wallet balance and connectivity for /health, read in the background
+blockchain_status = BlockchainStatusMonitor(blockchain)
+blockchain_status.start()
 
-# PDF Processing
-async def process_pdf_async(file_path: str) -> str:
-    """Process PDF file asynchronously"""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, extract_pdf_text, file_path)
+# Record hashes are anchored in Merkle batches (ANCHOR_BATCH_MAX_SIZE, ANCHOR_BATCH_MAX_WAIT_SECONDS);
+# ANCHOR_CHAIN=memory anchors on an in-process stand-in instead of Sepolia
+anchor_chain = InMemoryChain() if os.getenv("ANCHOR_CHAIN") == "memory" else BlockchainAnchorChain(blockchain)
+anchor_service = MerkleAnchorService(anchor_chain)
+anchor_service.start()
+if blockchain.submitter is not None:
+    # A batch whose transaction had to be re-sent points at the one that was mined
+    blockchain.submitter.on_mined = lambda tx_hash, mined_tx_hash, receipt: anchor_service.replace_tx_hash(
+        tx_hash, mined_tx_hash)
 
 
-def extract_pdf_text(file_path: str) -> str:
-    """Extract text from PDF using multiple methods if needed"""
-    try:
-        # First try pdfminer
-        extracted_text = extract_text(file_path).strip()
-        if extracted_text:
-            return extracted_text
-
-        # Fallback to OCR
-        logger.info(f"Using OCR fallback for {file_path}")
-        pages = convert_from_path(file_path, 300)
-        text = "\n".join([pytesseract.image_to_string(page) for page in pages]).strip()
-        if text:
-            return text
-
-        return "No readable text found."
-    except Exception as e:
-        logger.error(f"Error extracting text: {e}")
-        return "Error processing document."
+# PDF Processing
+# pdfminer and page-parallel OCR run on their own process pool (PDF_EXTRACT_WORKERS, OCR_DPI)
+pdf_engine = PdfExtractionEngine()
 
 
 def cleanup_temp_files(filepath: str):
@@ -270,101 +231,289 @@ def chunk_text(text: str, max_size: int = 512) -> List[str]:
     return chunks
 
 
+def load_record_pages(db: Session, record_id: int) -> List[MedicalRecordPage]:
+    return (db.query(MedicalRecordPage)
+            .filter(MedicalRecordPage.record_id == record_id)
+            .order_by(MedicalRecordPage.page_number)
+            .all())
+
+
+def embed_record_text(text: str, pages=None) -> StoredEmbeddings:
+    """Chunk a record's text (page by page when its pages are known) and embed every chunk with SBERT"""
+    if pages:
+        text_chunks, chunk_pages = [], []
+        for page in pages:
+            page_chunks = chunk_text(page.text, MAX_CHUNK_SIZE) if page.text else []
+            text_chunks.extend(page_chunks)
+            chunk_pages.extend([page.page_number] * len(page_chunks))
+    else:
+        text_chunks, chunk_pages = chunk_text(text, MAX_CHUNK_SIZE), None
+    return StoredEmbeddings(text_chunks, encode_chunks(get_sbert_model(), text_chunks), chunk_pages)
+
+
+async def embed_record_async(db: Session, record_id: int, patient_name: str, text: str) -> StoredEmbeddings:
+    """Embed a stored record off the event loop, then persist and index the result"""
+    pages = load_record_pages(db, record_id)
+    loop = asyncio.get_event_loop()
+    stored = await loop.run_in_executor(None, embed_record_text, text, pages)
+    save_record_embeddings(db, record_id, stored.chunks, stored.embeddings, pages=stored.pages)
+    patient_indexes.add_record(patient_name, record_id, *stored)
+    return stored
+
+
+# Per-patient chunk matrices for cross-record search
+patient_indexes = PatientIndexCache()
+
+# Answers to repeated questions about a record; keyed by the record's content
+# hash, so changed records and model upgrades never serve stale answers
+answer_cache = AnswerCache(f"{QA_MODEL_NAME}|{EMBEDDING_MODEL_VERSION}")
+
+
+async def get_patient_index(db: Session, patient_name: str):
+    """The patient's vector index, built from stored embeddings on a cache miss or when it is stale"""
+    # Another worker may have stored records since this one cached the index
+    stamp = patient_record_stamp(db, patient_name)
+    index = patient_indexes.get(patient_name, stamp)
+    if index is not None:
+        return index
+
+    records, missing = load_patient_embeddings(db, patient_name)
+    # Records uploaded before embeddings were persisted are embedded once and stored now
+    for record in missing:
+        text = json.loads(record.raw_data or "{}").get("notes", "")
+        if not text or text in NO_TEXT_MARKERS:
+            continue
+        records.append((record.id, *await embed_record_async(db, record.id, patient_name, text)))
+
+    return patient_indexes.build(patient_name, records, stamp=stamp)
+
+
 # API Router
 router = APIRouter(prefix="/medical_chatbot", tags=["medical_chatbot"])
 
 
-# Upload Medical Record
-@router.post("/upload", status_code=status.HTTP_201_CREATED)
-async def upload_medical_record(
-        background_tasks: BackgroundTasks,
-        file: UploadFile = File(...),
-        username: str = Form(...),
-        patient_id: Optional[str] = Form(None),
-        db: Session = Depends(get_db)
-):
-    """Upload and process a medical record PDF"""
-    try:
-        # Validate file
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Only {', '.join(ALLOWED_EXTENSIONS)} files are supported"
-            )
+# Upload job stages, run on the upload worker pool; a job resumed after a
+# restart runs them all again, so each one is idempotent
+def stored_extraction(db: Session, record: MedicalRecord) -> Dict[str, Any]:
+    """Extract stage outputs read back from a stored record"""
+    pages = [PageText(page.page_number, page.text, page.source, 0.0) for page in load_record_pages(db, record.id)]
+    extracted_text = json.loads(record.raw_data).get("notes", "")
+    return {"_text": extracted_text, "_pages": pages, "text_length": len(extracted_text), "pages": len(pages)}
+
+
+def extract_stage(db: Session, context: Dict[str, Any]) -> Dict[str, Any]:
+    # Resumed after its record was stored: read the text back instead of extracting again
+    if context["record_id"] is not None:
+        record = db.query(MedicalRecord).filter(MedicalRecord.id == context["record_id"]).first()
+        if record is not None:
+            return stored_extraction(db, record)
+
+    # The uploader processed identical content before: reuse its text and pages instead of extracting
+    # again. The source record stays out of the job result, which only says the extraction was reused
+    source = find_processed_document(db, context["content_sha256"], context["username"])
+    if source is not None:
+        logger.info(f"Upload {context['job_id']} duplicates record {source.id}, reusing its extraction")
+        return {**stored_extraction(db, source), "deduplicated": True, "_deduplicated_from": source.id}
+
+    # Text layer per page, OCR only for the pages without one
+    pages = pdf_engine.extract_pages(context["file_path"])
+    extracted_text = join_pages(pages) or "No readable text found."
+    return {
+        "_text": extracted_text,
+        "_pages": pages,
+        "text_length": len(extracted_text),
+        "pages": len(pages),
+        "ocr_pages": sum(page.source == PAGE_SOURCE_OCR for page in pages),
+    }
 
-        # Check file size
-        file.file.seek(0, 2)  # Move to end
-        file_size = file.file.tell()
-        file.file.seek(0)  # Reset position
 
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File too large. Maximum size is {MAX_FILE_SIZE // (1024 * 1024)}MB"
-            )
+def store_stage(db: Session, context: Dict[str, Any]) -> Dict[str, Any]:
+    job = db.query(UploadJob).filter(UploadJob.id == context["job_id"]).first()
+    # The record is linked to its job in the transaction that creates it, so a
+    # retried or resumed job finds it instead of storing a duplicate
+    new_record = None
+    if job.record_id is not None:
+        new_record = db.query(MedicalRecord).filter(MedicalRecord.id == job.record_id).first()
+    if new_record is not None:
+        record_data = json.loads(new_record.raw_data)
+        register_upload(db, context, new_record.id)
+        return {"record_id": new_record.id, "_record_data": record_data}
+
+    # Create record
+    record_data = {"notes": context["_text"]}
+    if context["patient_id"]:
+        record_data["patient_id"] = context["patient_id"]
+
+    # Create database record
+    new_record = MedicalRecord(
+        patient_name=context["username"],
+        #filename=file.filename,  # Store the filename
+        diagnosis="",
+        medications="[]",
+        raw_data=json.dumps(record_data),
+        created_at=datetime.utcnow()
+    )
+
+    db.add(new_record)
+    db.flush()
+
+    # Per-page text, so answers can cite pages and pages can be loaded one at a time
+    db.add_all([
+        MedicalRecordPage(record_id=new_record.id, page_number=page.page_number, text=page.text,
+                          source=page.source, char_count=len(page.text))
+        for page in context["_pages"]
+    ])
+    job.record_id = new_record.id
+    db.commit()
+    db.refresh(new_record)
+
+    register_upload(db, context, new_record.id)
+    return {"record_id": new_record.id, "_record_data": record_data}
+
+
+def register_upload(db: Session, context: Dict[str, Any], record_id: int):
+    # Later uploads of the same bytes reuse this record's extraction, embeddings and anchor
+    if context["content_sha256"] and "_deduplicated_from" not in context:
+        register_processed_document(db, context["content_sha256"], record_id, os.path.getsize(context["file_path"]))
+
+
+def embed_stage(db: Session, context: Dict[str, Any]) -> Dict[str, Any]:
+    # Chunk and embed once here, so /ask only has to encode the question
+    if not context["_text"] or context["_text"] in NO_TEXT_MARKERS:
+        return {"skipped": True}
+
+    if "_deduplicated_from" in context and copy_record_embeddings(db, context["_deduplicated_from"],
+                                                                  context["record_id"]):
+        stored = load_record_embeddings(db, context["record_id"])
+        if stored is not None:
+            patient_indexes.add_record(context["username"], context["record_id"], *stored)
+            return {"chunks": len(stored.chunks), "embeddings_reused": True}
+
+    stored = embed_record_text(context["_text"], context["_pages"])
+    save_record_embeddings(db, context["record_id"], stored.chunks, stored.embeddings, pages=stored.pages)
+    patient_indexes.add_record(context["username"], context["record_id"], *stored)
+    return {"chunks": len(stored.chunks)}
+
+
+def anchor_stage(db: Session, context: Dict[str, Any]) -> Dict[str, Any]:
+    # Queue the hash for the next Merkle batch; the record gets its transaction once the batch is anchored
+    record_hash = blockchain.generate_record_hash(context["_record_data"])
+    logger.info(f"Generated Hash: {record_hash}")
+    record = db.query(MedicalRecord).filter(MedicalRecord.id == context["record_id"]).first()
+    record.hash_value = record_hash  # Crucial: Store the hash value for later verification
+
+    # A duplicate with the same record data is covered by the original's anchor
+    if "_deduplicated_from" in context:
+        source = db.query(MedicalRecord).filter(MedicalRecord.id == context["_deduplicated_from"]).first()
+        if source is not None and source.blockchain_hash and source.hash_value == record_hash:
+            # Records anchored one transaction each have no proof to copy; the hash check covers them
+            anchor_service.copy_proof(db, source.id, record.id)
+            record.blockchain_hash = source.blockchain_hash
+            db.commit()
+            logger.info(f"Record reuses anchor {source.blockchain_hash} of record {source.id}")
+            return {"hash_value": record_hash, "blockchain_tx": source.blockchain_hash, "anchor_reused": True}
 
-        # Save file temporarily
-        file_id = str(uuid.uuid4())
-        file_path = f"{TEMP_DIR}/{file_id}_{file.filename}"
-        try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            # Process file
-            extracted_text = await process_pdf_async(file_path)
-
-            # Create record
-            record_data = {"notes": extracted_text}
-            if patient_id:
-                record_data["patient_id"] = patient_id
-
-            # Create database record
-            new_record = MedicalRecord(
-                patient_name=username,
-                #filename=file.filename,  # Store the filename
-                diagnosis="",
-                medications="[]",
-                raw_data=json.dumps(record_data),
-                created_at=datetime.utcnow()
-            )
+    anchor_service.enqueue(db, record.id, record_hash)
+    return {"hash_value": record_hash, "blockchain_tx": None, "anchor": "queued"}
 
-            db.add(new_record)
-            db.commit()
-            db.refresh(new_record)
 
-            # Store hash on blockchain
-            record_hash = blockchain.generate_record_hash(record_data)
-            logger.info(f"Generated Hash: {record_hash}")
+# Extraction and the record itself are required; a record without embeddings
+# is embedded on its first question, and anchoring failures leave it unverified
+upload_pipeline = UploadJobPipeline(
+    stages=[
+        JobStage("extract", extract_stage),
+        JobStage("store", store_stage),
+        JobStage("embed", embed_stage, required=False),
+        JobStage("anchor", anchor_stage, required=False),
+    ],
+    on_finish=lambda job: cleanup_temp_files(job.file_path),
+)
+# Picks up jobs left queued or running by a process that stopped (UPLOAD_JOB_STALE_SECONDS)
+upload_pipeline.start()
 
-            tx_hash = blockchain.store_hash_on_blockchain(record_hash)
-            logger.info(f"Transaction Hash: {tx_hash}")
 
-            if tx_hash:
-                # Update record with blockchain info
-                new_record.blockchain_hash = tx_hash
-                new_record.hash_value = record_hash  # Crucial: Store the hash value for later verification
-                db.commit()
-                logger.info(f"Record updated with hash: {record_hash}")
+# Upload Medical Record
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
+async def upload_medical_record(request: Request, db: Session = Depends(get_db)):
+    """Store a medical record PDF and queue it for extraction, embedding and anchoring.
+
+    Form fields: ``file`` (the PDF), ``username`` and optionally ``patient_id``.
+    The body is streamed straight to its temp file, so an oversized file is
+    refused as soon as it passes MAX_FILE_SIZE and the content is hashed
+    without a second pass.
+    """
+    file_id = str(uuid.uuid4())
 
-            return {
-                "message": "Medical record uploaded successfully",
-                "record_id": new_record.id,
-                "blockchain_tx": tx_hash,
-                "text_length": len(extracted_text),
-                "hash_value": record_hash  # Return hash value in response for debugging
-            }
-        finally:
-            # Schedule cleanup
-            background_tasks.add_task(cleanup_temp_files, file_path)
+    def upload_path(filename: str) -> str:
+        # Validate file
+        file_ext = os.path.splitext(filename)[1].lower()
+        if file_ext not in ALLOWED_EXTENSIONS:
+            raise UploadRejected(status.HTTP_400_BAD_REQUEST,
+                                 f"Only {', '.join(ALLOWED_EXTENSIONS)} files are supported")
+        return f"{TEMP_DIR}/{file_id}_{filename}"
 
-    except HTTPException:
-        raise
+    try:
+        # The upload job removes the file when it finishes
+        upload = await receive_upload(request, "file", upload_path, MAX_FILE_SIZE)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    username = upload.fields.get("username")
+    if upload.file_path is None or not username:
+        if upload.file_path is not None:
+            cleanup_temp_files(upload.file_path)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Both 'file' and 'username' are required")
+
+    try:
+        duplicate = find_processed_document(db, upload.content_sha256, username)
+        job = upload_pipeline.submit(db, UploadJob(
+            id=file_id,
+            username=username,
+            patient_id=upload.fields.get("patient_id"),
+            filename=upload.filename,
+            file_path=upload.file_path,
+            content_sha256=upload.content_sha256,
+        ))
+
+        return {
+            "message": "Medical record accepted for processing",
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"{router.prefix}/jobs/{job.id}",
+            "content_sha256": upload.content_sha256,
+            "duplicate": duplicate is not None
+        }
+
+    except UploadQueueFull as e:
+        cleanup_temp_files(upload.file_path)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
+        cleanup_temp_files(upload.file_path)
         logger.error(f"Error uploading record: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/jobs/stats")
+async def upload_job_stats():
+    """Pending, succeeded and failed upload jobs of this worker"""
+    return upload_pipeline.stats()
+
+
+@router.get("/jobs/{job_id}")
+async def get_upload_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Status, per-stage progress and timing of one of the current user's upload jobs"""
+    job = db.query(UploadJob).filter(UploadJob.id == job_id).first()
+    # Someone else's job is reported as missing, like a job id that never existed
+    if not job or job.username != current_user.username:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload job not found")
+    return job_status(job)
+
+
 # Ask Question About Medical Record
 @router.post("/ask")
 async def ask_chatbot(
@@ -407,32 +556,46 @@ async def ask_chatbot(
                 detail="Query cannot be empty"
             )
 
-        # SBERT Retrieval for relevant context
-        sbert_model = get_sbert_model()
-        query_embedding = sbert_model.encode(query, convert_to_tensor=True)
-
-        # Split text into proper chunks
-        text_chunks = chunk_text(medical_text, MAX_CHUNK_SIZE)
-
-        # Get embeddings
-        text_embeddings = sbert_model.encode(text_chunks, convert_to_tensor=True)
-
-        # Calculate similarity
-        similarity_scores = util.pytorch_cos_sim(query_embedding, text_embeddings)[0]
-
-        # Get top chunks
-        top_chunk_indices = similarity_scores.argsort(descending=True)[:2]
-        top_chunks = [text_chunks[i] for i in top_chunk_indices]
-        context = " ".join(top_chunks)
-
-        # Run question answering
-        qa_pipeline = get_qa_pipeline()
-        qa_result = qa_pipeline({"question": query, "context": context})
-
-        response = qa_result.get("answer", "No relevant information found.")
-        confidence = qa_result.get("score", 0)
+        # Hash of the data as stored now (the one that gets anchored), so any
+        # change to the record, anchored or not, misses the cache
+        record_hash = record_data_hash(raw_data)
+        cached = answer_cache.get(record_id, record_hash, query)
+        if cached is None:
+            started = time.perf_counter()
+
+            # SBERT Retrieval for relevant context
+            sbert_model = get_sbert_model()
+            query_embedding = encode_query(sbert_model, query)
+            cached = answer_cache.get_similar(record_id, record_hash, query_embedding)
+
+        if cached is None:
+            # Chunk embeddings stored at upload; records uploaded before that (or
+            # under another embedding model) are embedded once and stored now
+            stored = load_record_embeddings(db, record_id)
+            if stored is None:
+                stored = await embed_record_async(db, record_id, record.patient_name, medical_text)
+
+            # Get top chunks by cosine similarity (dot product of normalized vectors)
+            top_chunk_indices = top_chunks(query_embedding, stored.embeddings, k=2)
+            context = " ".join(stored.chunks[i] for i in top_chunk_indices)
+
+            # Run question answering
+            qa_pipeline = get_qa_pipeline()
+            qa_result = qa_pipeline({"question": query, "context": context})
+
+            answer = {
+                "response": qa_result.get("answer", "No relevant information found."),
+                "confidence": float(qa_result.get("score", 0)),
+                # Pages the context came from, for records extracted page by page
+                "pages": sorted({stored.pages[i] for i in top_chunk_indices}) if stored.pages else [],
+            }
+            answer_cache.put(record_id, record_hash, query, answer, query_embedding,
+                             (time.perf_counter() - started) * 1000)
+            cache_match = None
+        else:
+            answer, cache_match = cached
 
-        # Verify blockchain record if available
+        # Verify blockchain record if available (never cached: anchoring state changes)
         blockchain_verified = False
         logger.info(f"Record blockchain_hash: {record.blockchain_hash}")
         logger.info(f"Record has hash_value: {hasattr(record, 'hash_value')}")
@@ -441,18 +604,21 @@ async def ask_chatbot(
             logger.info(f"Verifying record hash: {record.hash_value}")
             logger.info(f"Raw data structure: {list(raw_data.keys())}")
 
-            # Verification should be more reliable now with enhanced logging
-            blockchain_verified = blockchain.verify_record_hash(raw_data, record.hash_value)
+            # Merkle inclusion proof checked locally against the anchored batch root
+            verification = anchor_service.verify_record(db, record, blockchain.generate_record_hash(raw_data))
+            blockchain_verified = verification["verified"]
 
             # If verification still fails, this might be a database column issue
             if not blockchain_verified:
-                logger.warning("Verification failed despite having hash value")
+                logger.warning(f"Verification failed despite having hash value ({verification['method']})")
 
         return {
             "query": query,
-            "response": response,
-            "confidence": float(confidence),
+            "response": answer["response"],
+            "confidence": answer["confidence"],
             "blockchain_verified": blockchain_verified,
+            "pages": answer["pages"],
+            "cached": cache_match,  # "exact", "similar" or None when the models ran
             "record_hash": getattr(record, "hash_value", None)  # Return hash for debugging
         }
     except HTTPException:
@@ -464,6 +630,109 @@ async def ask_chatbot(
             detail=f"Error processing query: {str(e)}"
         )
 
+@router.get("/ask/stats")
+async def answer_cache_stats():
+    """Hit rate and inference time saved by the record answer cache"""
+    return answer_cache.stats()
+
+
+@router.post("/search")
+async def search_records(
+        query: str = Form(...),
+        top_k: int = Form(SEARCH_TOP_K),
+        current_user: User = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Semantic search over the chunks of all of the authenticated patient's records"""
+    try:
+        if not query.strip():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Query cannot be empty"
+            )
+
+        # Records are filed under the uploader's username; only the caller's own are searched
+        index = await get_patient_index(db, current_user.username)
+        query_embedding = encode_query(get_sbert_model(), query)
+        results = index.search(query_embedding, max(1, top_k))
+
+        return {
+            "query": query,
+            "results": results,
+            "record_ids": list(dict.fromkeys(result["record_id"] for result in results))
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching records: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing query: {str(e)}"
+        )
+
+
+@router.post("/ask_all")
+async def ask_all_records(
+        query: str = Form(...),
+        current_user: User = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Answer a question from the most relevant chunks across all of the authenticated patient's records"""
+    try:
+        if not query.strip():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Query cannot be empty"
+            )
+
+        index = await get_patient_index(db, current_user.username)
+        query_embedding = encode_query(get_sbert_model(), query)
+        results = index.search(query_embedding, ASK_ALL_CONTEXT_CHUNKS)
+        if not results:
+            return {
+                "query": query,
+                "response": "No medical records with readable text were found.",
+                "confidence": 0.0,
+                "sources": []
+            }
+
+        # Remember where each chunk starts in the context, to cite the record the answer came from
+        context, offsets = "", []
+        for result in results:
+            offsets.append(len(context))
+            context += result["chunk"] + " "
+
+        qa_pipeline = get_qa_pipeline()
+        qa_result = qa_pipeline({"question": query, "context": context.strip()})
+        answer_start = qa_result.get("start", 0)
+        answer_source = next(result for offset, result in zip(reversed(offsets), reversed(results))
+                             if offset <= answer_start)
+
+        return {
+            "query": query,
+            "response": qa_result.get("answer", "No relevant information found."),
+            "confidence": float(qa_result.get("score", 0)),
+            "record_id": answer_source["record_id"],
+            "page": answer_source["page"],
+            "sources": [{"record_id": result["record_id"], "page": result["page"], "score": result["score"]}
+                        for result in results]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing cross-record query: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing query: {str(e)}"
+        )
+
+
+@router.get("/search/stats")
+async def search_index_stats():
+    """Patients, chunks and memory held by the cross-record search indexes"""
+    return patient_indexes.stats()
+
+
 @router.post("/general")
 async def general_chatbot(
         query: str = Form(...),
@@ -508,24 +777,36 @@ async def general_chatbot(
 # Health check endpoint
 @router.get("/health")
 async def health_check():
-    """Service health check endpoint"""
-    # Added more details to health check
-    health_data = {
+    """Service health with the cached blockchain status (refreshed every BLOCKCHAIN_STATUS_INTERVAL_SECONDS)"""
+    # Served from the background snapshot; probes never wait on an RPC call
+    return {
         "status": "healthy",
-        "blockchain_connected": blockchain.is_connected,
+        **blockchain_status.snapshot(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
-    # Add blockchain details if connected
-    if blockchain.is_connected:
-        try:
-            health_data["current_block"] = blockchain.web3.eth.block_number
-            balance = blockchain.web3.eth.get_balance(blockchain.wallet_address)
-            health_data["wallet_balance"] = float(blockchain.web3.from_wei(balance, 'ether'))
-        except Exception as e:
-            health_data["blockchain_error"] = str(e)
 
-    return health_data
+@router.get("/health/live")
+async def liveness_check():
+    """The process is up and serving requests"""
+    return {"status": "alive", "timestamp": datetime.utcnow().isoformat()}
+
+
+@router.get("/health/ready")
+async def readiness_check():
+    """Whether this worker can take uploads now, from in-process state only"""
+    uploads = upload_pipeline.stats()
+    ready = uploads["pending"] < uploads["max_pending"]
+    body = {
+        "status": "ready" if ready else "busy",
+        "upload_pending": uploads["pending"],
+        "upload_max_pending": uploads["max_pending"],
+        "blockchain_connected": blockchain_status.snapshot()["blockchain_connected"],
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    return JSONResponse(status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content=body)
+
 
 @router.get("/record/{record_id}")
 async def get_medical_record(
@@ -550,4 +831,68 @@ async def get_medical_record(
         "verified": bool(record.blockchain_hash),
         "content": raw_data.get("notes", ""),
         "blockchain_tx": record.blockchain_hash
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/record/{record_id}/pages")
+async def list_record_pages(
+    record_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Page numbers of a record with where their text came from, without the text itself"""
+    get_owned_record(db, record_id, current_user)
+    pages = (db.query(MedicalRecordPage.page_number, MedicalRecordPage.source, MedicalRecordPage.char_count)
+             .filter(MedicalRecordPage.record_id == record_id)
+             .order_by(MedicalRecordPage.page_number)
+             .all())
+    return {
+        "record_id": record_id,
+        "pages": [{"page": number, "source": source, "char_count": char_count} for number, source, char_count in pages]
+    }
+
+
+@router.get("/record/{record_id}/pages/{page_number}")
+async def get_record_page(
+    record_id: int,
+    page_number: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Text of a single page of a record"""
+    get_owned_record(db, record_id, current_user)
+    page = (db.query(MedicalRecordPage)
+            .filter(MedicalRecordPage.record_id == record_id, MedicalRecordPage.page_number == page_number)
+            .first())
+    if not page:
+        raise HTTPException(status_code=404, detail="Page not found")
+    return {"record_id": record_id, "page": page.page_number, "source": page.source, "text": page.text}
+
+
+@router.get("/record/{record_id}/proof")
+async def get_record_proof(
+    record_id: int,
+    check_chain: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Merkle inclusion proof of a record's hash, verified against its batch root (and the chain if asked)"""
+    record = get_owned_record(db, record_id, current_user)
+    if not record.raw_data:
+        raise HTTPException(status_code=404, detail="Record has no data to verify")
+
+    record_hash = blockchain.generate_record_hash(json.loads(record.raw_data))
+    try:
+        return anchor_service.verify_record(db, record, record_hash, check_chain=check_chain)
+    except Exception as e:
+        logger.error(f"Error reading anchor of record {record_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Could not read the chain: {e}")
+
+
+@router.get("/anchoring/stats")
+async def anchoring_stats():
+    """Queued record hashes, anchored Merkle batches and the transaction writer's counters"""
+    stats = anchor_service.stats()
+    if blockchain.submitter is not None:
+        stats["transactions"] = blockchain.submitter.stats()
+    return stats
@@ -1,42 +1,207 @@
-import pandas as pd
-import numpy as np
+"""Train the disease prediction model and write its serving artifacts.
+
+Run from the backend directory:
+
+    python -m app.routes.train --data /path/to/Training.csv [--encoding multihot] [--publish v2]
+"""
+import argparse
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
 import joblib
+import numpy as np
+import pandas as pd
 import shap
-from sklearn.model_selection import train_test_split
+from scipy.sparse import csr_matrix
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 
-# Load dataset
-df = pd.read_csv(r"/home/bhavya/Downloads/Training.csv")
+from app.services.explainer import build_attribution_table, parallel_shap_values
+from app.services.forest_engine import FlatForest
+from app.services.model_registry import publish_version
+from app.services.symptom_features import (
+    ENCODING_MODES,
+    ENCODING_MULTIHOT,
+    ENCODING_TFIDF,
+    load_symptom_vocabulary,
+    save_encoding_config,
+    smooth_idf,
+)
+
+LABEL_COLUMN = "prognosis"
+
+
+class StageTimer:
+    """Wall-clock time of each training stage"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        print(f"▶ {name}...")
+        yield
+        self.timings[name] = time.perf_counter() - started
+        print(f"✔ {name}: {self.timings[name]:.2f}s")
+
+    def report(self):
+        print("Stage timings:")
+        for name, seconds in self.timings.items():
+            print(f"  {name:<28} {seconds:>8.2f}s")
+        print(f"  {'total':<28} {sum(self.timings.values()):>8.2f}s")
+
+
+def symptom_presence(df: pd.DataFrame, columns) -> csr_matrix:
+    """Sparse (rows x symptoms) matrix straight from the one-hot dataset columns"""
+    return csr_matrix((df[columns].to_numpy() == 1).astype(np.float64))
+
+
+def tfidf_features(df: pd.DataFrame):
+    """TF-IDF features identical to fitting TfidfVectorizer on the comma-joined symptoms of each row.
+
+    Instead of building one text string per row, the symptom names are
+    tokenized once and the per-row token counts come from a sparse product
+    of the one-hot matrix with the (symptom x token) count matrix.
+    """
+    symptom_columns = [column for column in df.columns if column != LABEL_COLUMN]
+    presence = symptom_presence(df, symptom_columns)
+
+    # Only symptoms that occur contribute tokens, as with fitting on row text
+    occurring = [symptom for symptom, count in zip(symptom_columns, presence.getnnz(axis=0)) if count]
+    vectorizer = TfidfVectorizer()
+    vectorizer.fit(occurring)
+
+    symptom_tokens = CountVectorizer(vocabulary=vectorizer.vocabulary_).transform(symptom_columns)
+    token_counts = presence @ symptom_tokens
+    transformer = TfidfTransformer().fit(token_counts)
+    vectorizer.idf_ = transformer.idf_
+    return transformer.transform(token_counts), vectorizer
+
+
+def multihot_features(df: pd.DataFrame, use_idf: bool):
+    """Multi-hot features in symptom_encoder.json order, optionally IDF-weighted"""
+    vocabulary = load_symptom_vocabulary()
+    X = symptom_presence(df, sorted(vocabulary, key=vocabulary.get))
+    encoding_config = {"mode": ENCODING_MULTIHOT}
+    if use_idf:
+        idf = smooth_idf(X)
+        X = csr_matrix(X.multiply(idf))
+        encoding_config["idf"] = idf.tolist()
+    return X, encoding_config
+
+
+def build_features(df: pd.DataFrame, encoding: str, use_idf: bool = False):
+    """Feature matrix, encoded labels and the fitted encoders for the chosen encoding"""
+    if encoding == ENCODING_MULTIHOT:
+        X, encoding_config = multihot_features(df, use_idf)
+        vectorizer = None
+    else:
+        X, vectorizer = tfidf_features(df)
+        encoding_config = {"mode": ENCODING_TFIDF}
+
+    # Encode disease labels
+    label_encoder = LabelEncoder()
+    y = label_encoder.fit_transform(df[LABEL_COLUMN])
+    return X, y, vectorizer, encoding_config, label_encoder
+
+
+def train_forest(X, y, n_estimators: int = 200, max_depth: Optional[int] = None, min_samples_leaf: int = 1,
+                 ccp_alpha: float = 0.0, n_jobs: int = -1) -> RandomForestClassifier:
+    model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, min_samples_leaf=min_samples_leaf,
+                                   ccp_alpha=ccp_alpha, n_jobs=n_jobs, random_state=42)
+    return model.fit(X, y)
+
+
+def save_artifacts(out: str, model, vectorizer, encoding_config: dict, label_encoder, X_train, X_test,
+                   timer: StageTimer, background_size: int = 100, shap_check_rows: int = 200, n_jobs: int = -1):
+    """Build the SHAP explainers for ``model`` and write every serving artifact into ``out``"""
+    os.makedirs(out, exist_ok=True)
+
+    with timer.stage("build SHAP explainer"):
+        background_data = X_train[:background_size].toarray()
+        explainer = shap.TreeExplainer(model, data=background_data, feature_perturbation="interventional")
+        if shap_check_rows:
+            parallel_shap_values(explainer, X_test[:shap_check_rows], n_jobs=n_jobs)
+
+    with timer.stage("build attribution table"):
+        # Disease x symptom attribution table for explain=fast, from path-dependent
+        # TreeSHAP over the (deduplicated) training rows
+        attribution_table = build_attribution_table(shap.TreeExplainer(model), X_train,
+                                                    len(label_encoder.classes_), n_jobs=n_jobs)
+
+    with timer.stage("save artifacts"):
+        joblib.dump(model, os.path.join(out, "disease_model.pkl"))
+        # Memory-mappable copy of the forest for MODEL_MMAP=true serving
+        FlatForest.from_sklearn(model).save(os.path.join(out, "disease_forest"))
+        if vectorizer is not None:
+            joblib.dump(vectorizer, os.path.join(out, "tfidf_vectorizer.pkl"))
+        save_encoding_config(encoding_config, os.path.join(out, "feature_encoding.json"))
+        joblib.dump(label_encoder, os.path.join(out, "label_encoder.pkl"))
+        joblib.dump(explainer, os.path.join(out, "shap_explainer.pkl"))
+        joblib.dump(attribution_table, os.path.join(out, "symptom_attribution.pkl"))
+
+
+def add_artifact_arguments(parser: argparse.ArgumentParser):
+    """Options shared by training and the model size sweep"""
+    parser.add_argument("--data", default=os.getenv("TRAINING_DATA", "Training.csv"),
+                        help="training CSV with one-hot symptom columns and a prognosis column")
+    parser.add_argument("--out", default="models", help="directory the artifacts are written to")
+    parser.add_argument("--encoding", choices=ENCODING_MODES, default=os.getenv("SYMPTOM_ENCODING", ENCODING_TFIDF))
+    parser.add_argument("--idf", action="store_true", default=os.getenv("SYMPTOM_IDF", "false").lower() == "true",
+                        help="weight multi-hot columns by their IDF instead of 1")
+    parser.add_argument("--background-size", type=int, default=100, help="SHAP background rows")
+    parser.add_argument("--shap-check-rows", type=int, default=200, help="test rows explained as a SHAP smoke check")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="cores for training and SHAP (-1 = all)")
+    parser.add_argument("--publish", metavar="VERSION", help="also publish the artifacts as a registry version")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_artifact_arguments(parser)
+    parser.add_argument("--n-estimators", type=int, default=200)
+    parser.add_argument("--max-depth", type=int, default=None)
+    parser.add_argument("--min-samples-leaf", type=int, default=1)
+    parser.add_argument("--ccp-alpha", type=float, default=0.0, help="cost-complexity pruning strength")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    timer = StageTimer()
+
+    with timer.stage("load dataset"):
+        df = pd.read_csv(args.data)
+        print(f"  {len(df)} rows, {df.shape[1] - 1} symptoms from {args.data}")
 
-# Merge symptoms into a single text column for TF-IDF
-df["Symptom_Text"] = df.iloc[:, :-1].apply(lambda x: ",".join(x.index[x == 1]), axis=1)
+    with timer.stage(f"build {args.encoding} features"):
+        X, y, vectorizer, encoding_config, label_encoder = build_features(df, args.encoding, args.idf)
 
-# Use TF-IDF for feature extraction
-vectorizer = TfidfVectorizer()
-X = vectorizer.fit_transform(df["Symptom_Text"])
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-# Encode disease labels
-label_encoder = LabelEncoder()
-y = label_encoder.fit_transform(df["prognosis"])
+    with timer.stage("train random forest"):
+        model = train_forest(X_train, y_train, args.n_estimators, args.max_depth, args.min_samples_leaf,
+                             args.ccp_alpha, args.n_jobs)
+        print(f"  test accuracy: {model.score(X_test, y_test):.4f}")
 
-# Train/Test Split
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    save_artifacts(args.out, model, vectorizer, encoding_config, label_encoder, X_train, X_test, timer,
+                   args.background_size, args.shap_check_rows, args.n_jobs)
 
-# Train RandomForest Model
-model = RandomForestClassifier(n_estimators=200, random_state=42)
-model.fit(X_train, y_train)
+    if args.publish:
+        with timer.stage(f"publish version {args.publish}"):
+            publish_version(args.out, args.publish, metadata={"encoding": args.encoding,
+                                                              "n_estimators": args.n_estimators,
+                                                              "max_depth": args.max_depth,
+                                                              "min_samples_leaf": args.min_samples_leaf,
+                                                              "ccp_alpha": args.ccp_alpha})
 
-# ✅ Fix SHAP Issues
-background_data = X_train[:100].toarray()  # Use 100 samples as background data
-explainer = shap.TreeExplainer(model, data=background_data, feature_perturbation='interventional')  # ✅ FIXED
-shap_values = explainer.shap_values(X_test.toarray(), check_additivity=False)  # ✅ Fixed additivity issue
+    timer.report()
+    print("✅ Model trained & SHAP working correctly!")
 
-# Save everything
-joblib.dump(model, "models/disease_model.pkl")
-joblib.dump(vectorizer, "models/tfidf_vectorizer.pkl")
-joblib.dump(label_encoder, "models/label_encoder.pkl")
-joblib.dump(explainer, "models/shap_explainer.pkl")
 
-print("✅ Model trained & SHAP working correctly!")
+if __name__ == "__main__":
+    main()
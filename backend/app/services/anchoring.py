@@ -0,0 +1,407 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import AnchorBatch, AnchorProof, MedicalRecord
+from app.services.merkle import MerkleTree, verify_proof
+
+logger = logging.getLogger(__name__)
+
+# A batch is anchored once this many record hashes are queued...
+ANCHOR_BATCH_MAX_SIZE = int(os.getenv("ANCHOR_BATCH_MAX_SIZE", "256"))
+
+# ...or when the oldest has waited this long, whichever comes first
+ANCHOR_BATCH_MAX_WAIT_SECONDS = float(os.getenv("ANCHOR_BATCH_MAX_WAIT_SECONDS", "60"))
+
+# How long a flush waits for the node to accept a batch's transaction. One
+# not accepted by then stays in flight, claimed, until its submission
+# settles; it is never sent a second time
+ANCHOR_ACCEPT_WAIT_SECONDS = float(os.getenv("ANCHOR_ACCEPT_WAIT_SECONDS", "120"))
+
+# A batch still "sending" after this long, and not in flight in this process,
+# belongs to a process that died mid-send; its hashes are queued again (anchored
+# twice only if that process died between the node accepting and the commit)
+ANCHOR_SEND_TIMEOUT_SECONDS = float(os.getenv("ANCHOR_SEND_TIMEOUT_SECONDS", "600"))
+
+BATCH_SENDING = "sending"
+BATCH_ANCHORED = "anchored"
+BATCH_FAILED = "failed"
+
+
+class BlockchainAnchorChain:
+    """Anchors Merkle roots as the data of a transaction sent by BlockchainManager"""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    @property
+    def available(self) -> bool:
+        return self.manager.is_connected
+
+    def submit_root(self, merkle_root: str) -> "Future[str]":
+        """Queue the root's transaction; resolves to its hash once the node accepts it"""
+        if not self.manager.is_connected or self.manager.submitter is None:
+            raise RuntimeError("Blockchain not connected")
+        return self.manager.submit_hash(merkle_root)
+
+    def read_root(self, tx_hash: str) -> Optional[str]:
+        """The root a transaction carries, as read back from the chain"""
+        tx = self.manager.web3.eth.get_transaction(tx_hash)
+        return bytes(tx["input"]).decode(errors="replace") if tx else None
+
+
+class InMemoryChain:
+    """In-process stand-in for the chain, for tests and local development.
+
+    Every sent root is "mined" at once under a deterministic transaction
+    hash. Set ``fail`` to make sends raise, as an unreachable RPC would, or
+    ``hold`` to keep submissions pending until ``accept_held()``, as a slow
+    node would.
+    """
+
+    def __init__(self):
+        self.transactions: Dict[str, str] = {}
+        self.fail = False
+        self.hold = False
+        self.held: List[tuple] = []  # (merkle root, future) submitted while holding
+        self.available = True
+
+    def _mine(self, merkle_root: str) -> str:
+        tx_hash = "0x" + hashlib.sha256(f"{len(self.transactions)}:{merkle_root}".encode()).hexdigest()
+        self.transactions[tx_hash] = merkle_root
+        return tx_hash
+
+    def submit_root(self, merkle_root: str) -> "Future[str]":
+        if self.fail:
+            raise RuntimeError("In-memory chain is set to fail")
+        future: "Future[str]" = Future()
+        if self.hold:
+            self.held.append((merkle_root, future))
+        else:
+            future.set_result(self._mine(merkle_root))
+        return future
+
+    def accept_held(self):
+        held, self.held = self.held, []
+        for merkle_root, future in held:
+            future.set_result(self._mine(merkle_root))
+
+    def read_root(self, tx_hash: str) -> Optional[str]:
+        return self.transactions.get(tx_hash)
+
+
+class InFlightBatch(NamedTuple):
+    """A claimed batch whose transaction was submitted but not yet settled"""
+    future: "Future[str]"
+    row_ids: List[int]
+    record_ids: List[int]
+    proofs: List[str]
+
+
+class MerkleAnchorService:
+    """Anchors record hashes in batches: one transaction per Merkle root.
+
+    Record hashes are queued as anchor_proofs rows without a batch, so the
+    queue survives restarts. A background thread flushes it every
+    ``max_wait_seconds``, or as soon as ``max_batch_size`` hashes are
+    waiting: it builds the tree, sends only the root, and stores each
+    record's inclusion proof. Verifying a record needs just its proof and
+    the batch root, no RPC call. Rows are claimed by batch before the
+    transaction is sent, so several server processes never anchor the same
+    hash twice. Only a submission the node definitely rejected releases them
+    for the next flush; one still awaiting acceptance keeps them claimed and
+    is settled when its transaction hash arrives.
+    """
+
+    def __init__(self, chain, session_factory: Callable[[], Session] = SessionLocal,
+                 max_batch_size: int = ANCHOR_BATCH_MAX_SIZE,
+                 max_wait_seconds: float = ANCHOR_BATCH_MAX_WAIT_SECONDS,
+                 accept_wait_seconds: float = ANCHOR_ACCEPT_WAIT_SECONDS):
+        self.chain = chain
+        self.session_factory = session_factory
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_seconds = max_wait_seconds
+        self.accept_wait_seconds = accept_wait_seconds
+        self._in_flight: Dict[int, InFlightBatch] = {}  # batch id -> its unsettled submission
+        self._flush_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.queued_since_flush = 0
+        self.counters = {"batches": 0, "records_anchored": 0, "failed_batches": 0}
+
+    def start(self):
+        """Run the flush loop on a daemon thread (idempotent)"""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, name="merkle-anchor", daemon=True)
+                self._thread.start()
+
+    def stop(self, flush: bool = True):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+        if flush:
+            self.flush_all()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.max_wait_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush_all()
+            except Exception as e:
+                logger.error(f"Anchoring flush failed: {e}", exc_info=True)
+
+    def enqueue(self, db: Session, record_id: int, record_hash: str) -> AnchorProof:
+        """Queue a record's hash for the next batch; a changed hash replaces the record's old proof"""
+        row = db.query(AnchorProof).filter(AnchorProof.record_id == record_id).first()
+        if row is not None and row.record_hash == record_hash:
+            return row
+        if row is None:
+            row = AnchorProof(record_id=record_id)
+            db.add(row)
+        row.record_hash = record_hash
+        row.batch_id = None
+        row.leaf_index = None
+        row.proof = None
+        db.commit()
+
+        with self._lock:
+            self.queued_since_flush += 1
+            full = self.queued_since_flush >= self.max_batch_size
+        if full:
+            self._wake.set()
+        return row
+
+    def copy_proof(self, db: Session, source_record_id: int, record_id: int) -> bool:
+        """Give a record with the same hash the anchored proof of another; False if that has none yet"""
+        source = (db.query(AnchorProof)
+                  .filter(AnchorProof.record_id == source_record_id, AnchorProof.proof.isnot(None))
+                  .first())
+        if source is None:
+            return False
+        row = db.query(AnchorProof).filter(AnchorProof.record_id == record_id).first()
+        if row is None:
+            row = AnchorProof(record_id=record_id)
+            db.add(row)
+        row.record_hash = source.record_hash
+        row.batch_id = source.batch_id
+        row.leaf_index = source.leaf_index
+        row.proof = source.proof
+        db.commit()
+        return True
+
+    def flush_all(self) -> int:
+        """Anchor batches until the queue is empty; returns the records anchored"""
+        total = 0
+        while True:
+            anchored = self.flush()
+            total += anchored
+            if anchored < self.max_batch_size:
+                return total
+
+    def flush(self) -> int:
+        """Anchor up to max_batch_size queued hashes in one transaction; returns the records anchored"""
+        with self._flush_lock:
+            if not self.chain.available:
+                return 0
+            with self._lock:
+                self.queued_since_flush = 0
+
+            db = self.session_factory()
+            try:
+                self._settle_in_flight(db)
+                self._release_stale(db)
+                rows = (db.query(AnchorProof)
+                        .filter(AnchorProof.batch_id.is_(None))
+                        .order_by(AnchorProof.id)
+                        .limit(self.max_batch_size)
+                        .all())
+                if not rows:
+                    return 0
+                tree = MerkleTree([row.record_hash for row in rows])
+                row_ids = [row.id for row in rows]
+                record_ids = [row.record_id for row in rows]
+                proofs = [json.dumps(tree.proof(i)) for i in range(len(rows))]
+
+                # Claim the rows for this batch before sending anything
+                batch = AnchorBatch(merkle_root=tree.root, leaf_count=len(rows), status=BATCH_SENDING)
+                db.add(batch)
+                db.flush()
+                claimed = (db.query(AnchorProof)
+                           .filter(AnchorProof.id.in_(row_ids), AnchorProof.batch_id.is_(None))
+                           .update({AnchorProof.batch_id: batch.id}, synchronize_session=False))
+                if claimed != len(rows):
+                    # Another process took some of them; the rest go in the next flush
+                    db.rollback()
+                    return 0
+                db.commit()
+                batch_id = batch.id
+
+                try:
+                    future = self.chain.submit_root(tree.root)
+                except Exception as e:
+                    self._release(db, batch_id, len(rows), e)
+                    return 0
+                with self._lock:
+                    self._in_flight[batch_id] = InFlightBatch(future, row_ids, record_ids, proofs)
+                # A submission settling after this flush gave up waiting is recorded by the next one
+                future.add_done_callback(lambda _: self._wake.set())
+
+                try:
+                    future.result(timeout=self.accept_wait_seconds)
+                except FutureTimeout:
+                    logger.warning(f"Anchoring batch {batch_id} not accepted after {self.accept_wait_seconds}s; "
+                                   f"its records stay claimed until it is")
+                    return 0
+                except Exception:
+                    pass  # Rejected; released by _settle
+                return self._settle(db, batch_id)
+            finally:
+                db.close()
+
+    def _settle_in_flight(self, db: Session):
+        with self._lock:
+            done = [batch_id for batch_id, entry in self._in_flight.items() if entry.future.done()]
+        for batch_id in done:
+            self._settle(db, batch_id)
+
+    def _settle(self, db: Session, batch_id: int) -> int:
+        """Record the outcome of a batch's finished submission; returns the records anchored"""
+        with self._lock:
+            entry = self._in_flight.pop(batch_id)
+        error = entry.future.exception()
+        if error is not None:
+            self._release(db, batch_id, len(entry.row_ids), error)
+            return 0
+
+        tx_hash = entry.future.result()
+        batch = db.query(AnchorBatch).filter(AnchorBatch.id == batch_id).one()
+        batch.status = BATCH_ANCHORED
+        batch.tx_hash = tx_hash
+        batch.anchored_at = datetime.utcnow()
+        for leaf_index, (row_id, proof) in enumerate(zip(entry.row_ids, entry.proofs)):
+            # Rows whose hash changed meanwhile were re-queued and keep waiting
+            db.query(AnchorProof).filter(AnchorProof.id == row_id, AnchorProof.batch_id == batch_id).update(
+                {AnchorProof.leaf_index: leaf_index, AnchorProof.proof: proof}, synchronize_session=False)
+        db.query(MedicalRecord).filter(MedicalRecord.id.in_(entry.record_ids)).update(
+            {MedicalRecord.blockchain_hash: tx_hash}, synchronize_session=False)
+        db.commit()
+        logger.info(f"Anchored {len(entry.row_ids)} record hashes under root {batch.merkle_root} in {tx_hash}")
+
+        with self._lock:
+            self.counters["batches"] += 1
+            self.counters["records_anchored"] += len(entry.row_ids)
+        return len(entry.row_ids)
+
+    def _release(self, db: Session, batch_id: int, leaf_count: int, error: BaseException):
+        """Queue a rejected batch's hashes again for the next flush"""
+        logger.error(f"Anchoring batch {batch_id} ({leaf_count} records) failed: {error}")
+        db.query(AnchorProof).filter(AnchorProof.batch_id == batch_id).update(
+            {AnchorProof.batch_id: None}, synchronize_session=False)
+        db.query(AnchorBatch).filter(AnchorBatch.id == batch_id).update(
+            {AnchorBatch.status: BATCH_FAILED, AnchorBatch.error: str(error)}, synchronize_session=False)
+        db.commit()
+        with self._lock:
+            self.counters["failed_batches"] += 1
+
+    def replace_tx_hash(self, tx_hash: str, mined_tx_hash: str):
+        """Point a batch and its records at the replacement of its transaction that was actually mined"""
+        if tx_hash == mined_tx_hash:
+            return
+        db = self.session_factory()
+        try:
+            db.query(AnchorBatch).filter(AnchorBatch.tx_hash == tx_hash).update(
+                {AnchorBatch.tx_hash: mined_tx_hash}, synchronize_session=False)
+            db.query(MedicalRecord).filter(MedicalRecord.blockchain_hash == tx_hash).update(
+                {MedicalRecord.blockchain_hash: mined_tx_hash}, synchronize_session=False)
+            db.commit()
+            logger.info(f"Anchor transaction {tx_hash} was replaced by {mined_tx_hash}")
+        finally:
+            db.close()
+
+    def _release_stale(self, db: Session):
+        cutoff = datetime.utcnow() - timedelta(seconds=ANCHOR_SEND_TIMEOUT_SECONDS)
+        stale = (db.query(AnchorBatch)
+                 .filter(AnchorBatch.status == BATCH_SENDING, AnchorBatch.created_at < cutoff)
+                 .all())
+        with self._lock:
+            # Still awaiting acceptance here; re-sending it could anchor it twice
+            stale = [batch for batch in stale if batch.id not in self._in_flight]
+        for batch in stale:
+            db.query(AnchorProof).filter(AnchorProof.batch_id == batch.id).update(
+                {AnchorProof.batch_id: None}, synchronize_session=False)
+            batch.status = BATCH_FAILED
+            batch.error = "Abandoned while sending"
+            logger.warning(f"Requeued the hashes of abandoned anchoring batch {batch.id}")
+        if stale:
+            db.commit()
+
+    def record_proof(self, db: Session, record_id: int) -> Optional[Dict[str, Any]]:
+        """A record's queued hash or inclusion proof, with its batch root and transaction"""
+        row = db.query(AnchorProof).filter(AnchorProof.record_id == record_id).first()
+        if row is None:
+            return None
+        batch = db.query(AnchorBatch).filter(AnchorBatch.id == row.batch_id).first() if row.proof else None
+        return {
+            "record_id": record_id,
+            "record_hash": row.record_hash,
+            "status": BATCH_ANCHORED if batch is not None else "queued",
+            "batch_id": batch.id if batch is not None else None,
+            "merkle_root": batch.merkle_root if batch is not None else None,
+            "tx_hash": batch.tx_hash if batch is not None else None,
+            "leaf_index": row.leaf_index,
+            "proof": json.loads(row.proof) if row.proof else None,
+            "anchored_at": batch.anchored_at.isoformat() if batch is not None and batch.anchored_at else None,
+        }
+
+    def verify_record(self, db: Session, record: MedicalRecord, record_hash: str,
+                      check_chain: bool = False) -> Dict[str, Any]:
+        """Check a record's current hash against its anchored batch root.
+
+        The inclusion proof is checked locally; ``check_chain`` also reads
+        the root back from the anchoring transaction. Records anchored one
+        transaction each (before batching) are checked against their stored
+        hash as before.
+        """
+        proof = self.record_proof(db, record.id)
+        if proof is None:
+            verified = bool(record.blockchain_hash and record.hash_value and record.hash_value == record_hash)
+            return {"verified": verified, "method": "single_transaction", "tx_hash": record.blockchain_hash}
+
+        verified = (proof["status"] == BATCH_ANCHORED and proof["record_hash"] == record_hash
+                    and verify_proof(record_hash, proof["proof"], proof["merkle_root"]))
+        result = {"verified": verified, "method": "merkle_proof", **proof}
+        if check_chain and verified:
+            on_chain_root = self.chain.read_root(proof["tx_hash"])
+            result["on_chain_root"] = on_chain_root
+            result["verified"] = on_chain_root == proof["merkle_root"]
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        db = self.session_factory()
+        try:
+            queued = db.query(AnchorProof).filter(AnchorProof.batch_id.is_(None)).count()
+        finally:
+            db.close()
+        with self._lock:
+            return {"queued": queued, "in_flight": len(self._in_flight), "max_batch_size": self.max_batch_size,
+                    "max_wait_seconds": self.max_wait_seconds, "chain_available": self.chain.available,
+                    **self.counters}
@@ -0,0 +1,174 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "4096"))
+# Seconds an answer stays valid; 0 keeps answers until evicted or their record changes
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Cosine similarity above which a differently worded question reuses a cached
+# answer for the same record; 0 disables similarity matching
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
+MATCH_EXACT = "exact"
+MATCH_SIMILAR = "similar"
+
+AnswerKey = Tuple[int, str, str, str]  # (record id, record hash, model version, normalized query)
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercased question without punctuation or repeated whitespace, used as the cache key"""
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", query.lower())).strip()
+
+
+class CachedAnswer(NamedTuple):
+    value: Dict[str, Any]
+    embedding: Optional[np.ndarray]  # Normalized query embedding, for similarity matching
+    inference_ms: float  # Retrieval + QA time the answer cost, saved on every hit
+    expires_at: float
+
+
+class AnswerCache:
+    """Thread-safe LRU of record QA answers keyed by record id, record hash, QA model version and normalized query.
+
+    The record hash is the hash of the record's current data, so answers
+    never outlive a change to it; deduplicated records sharing one hash
+    still keep separate entries. Each record's answers are also grouped by
+    record id: a lookup with a different hash than the cached one drops the
+    record's old answers. With a similarity threshold, a miss on the exact
+    question falls back to the closest cached question for the same record
+    version.
+    """
+
+    def __init__(self, model_version: str, max_size: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.model_version = model_version
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[AnswerKey, CachedAnswer]" = OrderedDict()
+        self._record_hashes: Dict[int, str] = {}  # record id -> content hash its entries were cached under
+        self._record_keys: Dict[int, Set[AnswerKey]] = {}  # record id -> keys of its entries
+        self._lock = threading.Lock()
+        self.hits = {MATCH_EXACT: 0, MATCH_SIMILAR: 0}
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.saved_ms = 0.0
+
+    def _key(self, record_id: int, record_hash: str, query: str) -> AnswerKey:
+        return record_id, record_hash, self.model_version, normalize_query(query)
+
+    def _drop(self, key: AnswerKey):
+        del self._entries[key]
+        record_id = key[0]
+        keys = self._record_keys[record_id]
+        keys.discard(key)
+        if not keys:
+            del self._record_keys[record_id]
+            del self._record_hashes[record_id]
+
+    def _check_record(self, record_id: int, record_hash: str):
+        # The record changed since its answers were cached
+        if self._record_hashes.get(record_id, record_hash) != record_hash:
+            for key in self._record_keys.pop(record_id, ()):
+                self._entries.pop(key, None)
+            del self._record_hashes[record_id]
+            self.invalidations += 1
+
+    def _hit(self, key: AnswerKey, entry: CachedAnswer, match: str) -> Tuple[Dict[str, Any], str]:
+        self._entries.move_to_end(key)
+        self.hits[match] += 1
+        self.saved_ms += entry.inference_ms
+        return entry.value, match
+
+    def get(self, record_id: int, record_hash: str, query: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """Cached answer to this exact (normalized) question, before any model is run"""
+        if self.max_size <= 0:
+            return None
+        key = self._key(record_id, record_hash, query)
+        with self._lock:
+            self._check_record(record_id, record_hash)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at and entry.expires_at < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                if self.similarity_threshold <= 0:
+                    self.misses += 1
+                return None
+            return self._hit(key, entry, MATCH_EXACT)
+
+    def get_similar(self, record_id: int, record_hash: str,
+                    query_embedding: np.ndarray) -> Optional[Tuple[Dict[str, Any], str]]:
+        """Cached answer to the record's most similar question, if above the threshold (after a get miss)"""
+        if self.max_size <= 0 or self.similarity_threshold <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_record(record_id, record_hash)
+            keys = [key for key in self._record_keys.get(record_id, ())
+                    if self._entries[key].embedding is not None
+                    and not (self._entries[key].expires_at and self._entries[key].expires_at < now)]
+            if keys:
+                scores = np.stack([self._entries[key].embedding for key in keys]) @ query_embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    return self._hit(keys[best], self._entries[keys[best]], MATCH_SIMILAR)
+            self.misses += 1
+            return None
+
+    def put(self, record_id: int, record_hash: str, query: str, value: Dict[str, Any],
+            query_embedding: Optional[np.ndarray] = None, inference_ms: float = 0.0):
+        if self.max_size <= 0:
+            return
+        key = self._key(record_id, record_hash, query)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else 0
+        with self._lock:
+            self._check_record(record_id, record_hash)
+            self._entries[key] = CachedAnswer(value, query_embedding, inference_ms, expires_at)
+            self._entries.move_to_end(key)
+            self._record_hashes[record_id] = record_hash
+            self._record_keys.setdefault(record_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate_record(self, record_id: int):
+        """Drop every cached answer about a record"""
+        with self._lock:
+            for key in self._record_keys.pop(record_id, ()):
+                self._entries.pop(key, None)
+            if self._record_hashes.pop(record_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self.hits.values())
+            lookups = hits + self.misses
+            return {
+                "model_version": self.model_version,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity_threshold,
+                "hits": hits,
+                "exact_hits": self.hits[MATCH_EXACT],
+                "similar_hits": self.hits[MATCH_SIMILAR],
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "saved_inference_seconds": round(self.saved_ms / 1000, 2),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
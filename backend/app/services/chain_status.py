@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# How often the background thread reads the chain head and wallet balance
+BLOCKCHAIN_STATUS_INTERVAL_SECONDS = float(os.getenv("BLOCKCHAIN_STATUS_INTERVAL_SECONDS", "30"))
+
+# A snapshot older than this is reported as stale (the refresh thread is stuck or failing)
+BLOCKCHAIN_STATUS_MAX_AGE_SECONDS = float(os.getenv("BLOCKCHAIN_STATUS_MAX_AGE_SECONDS",
+                                                    str(3 * BLOCKCHAIN_STATUS_INTERVAL_SECONDS)))
+
+
+class BlockchainStatusMonitor:
+    """Blockchain status refreshed in the background, so health probes never make RPC calls.
+
+    Every ``interval_seconds`` one thread checks connectivity and reads the
+    head block and wallet balance; ``snapshot()`` returns the last result
+    with its age. A failed refresh keeps the last known block and balance
+    and records the error.
+    """
+
+    def __init__(self, manager, interval_seconds: float = BLOCKCHAIN_STATUS_INTERVAL_SECONDS,
+                 max_age_seconds: float = BLOCKCHAIN_STATUS_MAX_AGE_SECONDS):
+        self.manager = manager
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {"blockchain_connected": False, "current_block": None,
+                                        "wallet_balance": None}
+        self._refreshed_at: Optional[float] = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, name="blockchain-status", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _loop(self):
+        while True:
+            self.refresh()
+            if self._stop.wait(self.interval_seconds):
+                return
+
+    def refresh(self):
+        """Read the chain status now; the only place health reporting touches the network"""
+        started = time.perf_counter()
+        status = {}
+        web3 = self.manager.web3
+        try:
+            if web3 is None or not web3.is_connected():
+                status = {"blockchain_connected": False, "blockchain_error": "Not connected"}
+            else:
+                balance = web3.eth.get_balance(self.manager.wallet_address)
+                status = {
+                    "blockchain_connected": True,
+                    "current_block": web3.eth.block_number,
+                    "wallet_balance": float(web3.from_wei(balance, "ether")),
+                    "blockchain_error": None,
+                }
+        except Exception as e:
+            logger.warning(f"Blockchain status refresh failed: {e}")
+            status = {"blockchain_connected": False, "blockchain_error": str(e)}
+
+        with self._lock:
+            self._status.update(status)
+            self._status["refresh_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self._status["refreshed_at"] = datetime.utcnow().isoformat()
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+            if not status["blockchain_connected"]:
+                self.failures += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Last refreshed status, its age, and how long ago a transaction was last accepted and mined"""
+        with self._lock:
+            snapshot = dict(self._status)
+            age = time.monotonic() - self._refreshed_at if self._refreshed_at is not None else None
+        snapshot["status_age_seconds"] = round(age, 1) if age is not None else None
+        snapshot["status_stale"] = age is None or age > self.max_age_seconds
+
+        submitter = self.manager.submitter
+        for key, at in (("last_tx_accepted_age_seconds", getattr(submitter, "last_accepted_at", None)),
+                        ("last_tx_mined_age_seconds", getattr(submitter, "last_mined_at", None))):
+            snapshot[key] = round(time.monotonic() - at, 1) if at is not None else None
+        return snapshot
@@ -0,0 +1,45 @@
+import logging
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import MedicalRecord, ProcessedDocument, RecordEmbedding
+
+logger = logging.getLogger(__name__)
+
+def find_processed_document(db: Session, content_sha256: Optional[str],
+                            patient_name: str) -> Optional[MedicalRecord]:
+    """The patient's record that already holds the processing results of identical content, if any
+
+    Only the patient's own records are considered, so an upload never reveals
+    that another patient holds the same document.
+    """
+    if not content_sha256:
+        return None
+    return (db.query(MedicalRecord)
+            .join(ProcessedDocument, ProcessedDocument.record_id == MedicalRecord.id)
+            .filter(ProcessedDocument.content_sha256 == content_sha256,
+                    MedicalRecord.patient_name == patient_name)
+            .first())
+
+
+def register_processed_document(db: Session, content_sha256: str, record_id: int, size_bytes: int):
+    """Index a freshly processed document by content; the first record to register a digest keeps it"""
+    try:
+        db.add(ProcessedDocument(content_sha256=content_sha256, record_id=record_id, size_bytes=size_bytes))
+        db.commit()
+    except IntegrityError:
+        # An identical upload processed concurrently got there first
+        db.rollback()
+        logger.info(f"Document {content_sha256[:12]} already indexed")
+
+
+def copy_record_embeddings(db: Session, source_record_id: int, record_id: int) -> int:
+    """Give a record the stored chunk embeddings of another (for every model version); returns rows copied"""
+    rows = db.query(RecordEmbedding).filter(RecordEmbedding.record_id == source_record_id).all()
+    for row in rows:
+        db.add(RecordEmbedding(record_id=record_id, model_version=row.model_version, chunks=row.chunks,
+                               n_chunks=row.n_chunks, dim=row.dim, embeddings=row.embeddings))
+    db.commit()
+    return len(rows)
@@ -0,0 +1,296 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+import shap
+from joblib import Parallel, delayed
+
+SHAP_EXPLAINER_PATH = "models/shap_explainer.pkl"
+# Disease x symptom mean SHAP attributions precomputed by train.py
+ATTRIBUTION_TABLE_PATH = "models/symptom_attribution.pkl"
+# Time SHAP may take per explained row before explanations fall back to tree path contributions
+SHAP_BUDGET_MS = float(os.getenv("SHAP_BUDGET_MS", "250"))
+# How often (seconds) the SHAP cost is re-measured on the probe row
+SHAP_REPROBE_SECONDS = float(os.getenv("SHAP_REPROBE_SECONDS", "300"))
+# Weight of the newest call in each method's running per-row cost, used to
+# reserve explanation time out of a request's latency budget
+EXPLAIN_COST_SMOOTHING = 0.2
+
+METHOD_SHAP = "shap"
+METHOD_TREE_PATH = "tree_path"
+METHOD_TABLE = "attribution_table"
+
+
+def tree_path_contributions(model, X, class_indices: Sequence[int]) -> np.ndarray:
+    """Path-based (Saabas) contributions of every feature to each row's class probability.
+
+    Walks each row's decision path through every tree and credits the change
+    in class probability at each split to the split feature. Costs one
+    decision_path call per tree, no matter how many rows are explained, or
+    a single vectorized walk for a FlatForest.
+    """
+    if hasattr(model, "path_contributions"):
+        return model.path_contributions(X, class_indices)
+
+    n_rows = X.shape[0]
+    class_indices = np.asarray(class_indices)
+    contributions = np.zeros((n_rows, model.n_features_in_))
+    # Validate once here instead of once per tree inside estimator.decision_path
+    X = np.ascontiguousarray(X, dtype=np.float32)
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        node_values = tree.value[:, 0, :]
+        node_probabilities = node_values / node_values.sum(axis=1, keepdims=True)
+
+        # Node ids along a path are increasing, so consecutive entries of a
+        # row are (parent, child) pairs
+        paths = tree.decision_path(X)
+        nodes = paths.indices
+        rows = np.repeat(np.arange(n_rows), np.diff(paths.indptr))
+        same_row = rows[1:] == rows[:-1]
+        parents, children, pair_rows = nodes[:-1][same_row], nodes[1:][same_row], rows[1:][same_row]
+
+        pair_classes = class_indices[pair_rows]
+        delta = node_probabilities[children, pair_classes] - node_probabilities[parents, pair_classes]
+        np.add.at(contributions, (pair_rows, tree.feature[parents]), delta)
+
+    return contributions / len(model.estimators_)
+
+
+def select_class_values(shap_values, class_indices: Sequence[int]) -> np.ndarray:
+    """Reduce SHAP output to a (rows x features) matrix for each row's class"""
+    rows = np.arange(len(class_indices))
+    class_indices = np.asarray(class_indices)
+
+    if isinstance(shap_values, list):
+        # One (rows x features) array per class
+        stacked = np.stack([np.asarray(values) for values in shap_values], axis=-1)
+        class_indices = np.where(class_indices < stacked.shape[-1], class_indices, 0)
+        return stacked[rows, :, class_indices]
+
+    values = np.asarray(getattr(shap_values, "values", shap_values))
+    if values.ndim == 3:
+        # Multi-class output laid out as (rows, features, classes)
+        return values[rows, :, class_indices]
+    # Binary classification or regression
+    return values
+
+
+def stack_class_values(shap_values) -> np.ndarray:
+    """Lay out multi-class SHAP output as (rows, features, classes)"""
+    if isinstance(shap_values, list):
+        return np.stack([np.asarray(values) for values in shap_values], axis=-1)
+    values = np.asarray(getattr(shap_values, "values", shap_values))
+    return values if values.ndim == 3 else values[..., np.newaxis]
+
+
+def _attribution_chunk(explainer, rows: np.ndarray, weights: np.ndarray):
+    present = (rows != 0) * weights[:, np.newaxis]
+    values = stack_class_values(explainer.shap_values(rows, check_additivity=False))
+    # Sum over rows of value * weight, only where the symptom is present
+    return np.einsum("rfc,rf->cf", values, present), present.sum(axis=0)
+
+
+def build_attribution_table(explainer, X, n_classes: int, chunk_size: int = 256, n_jobs: int = 1) -> np.ndarray:
+    """Mean SHAP value of each symptom for each disease, over the rows where the symptom is present.
+
+    Duplicate rows are explained once and weighted by their count, which
+    matters for symptom datasets where most rows repeat. Chunks of rows are
+    explained in parallel across ``n_jobs`` processes.
+    """
+    dense = X.toarray() if hasattr(X, "toarray") else np.asarray(X)
+    unique_rows, counts = np.unique(dense, axis=0, return_counts=True)
+
+    chunks = Parallel(n_jobs=n_jobs)(
+        delayed(_attribution_chunk)(explainer, unique_rows[start:start + chunk_size], counts[start:start + chunk_size])
+        for start in range(0, len(unique_rows), chunk_size)
+    )
+    totals = np.zeros((n_classes, dense.shape[1]))
+    present_counts = np.zeros(dense.shape[1])
+    for chunk_totals, chunk_present in chunks:
+        totals += chunk_totals
+        present_counts += chunk_present
+
+    return (totals / np.maximum(present_counts, 1)).astype(np.float32)
+
+
+def parallel_shap_values(explainer, X, chunk_size: int = 64, n_jobs: int = 1) -> np.ndarray:
+    """SHAP values as (rows, features, classes), explaining chunks of rows in parallel"""
+    dense = X.toarray() if hasattr(X, "toarray") else np.asarray(X)
+    chunks = Parallel(n_jobs=n_jobs)(
+        delayed(explainer.shap_values)(dense[start:start + chunk_size], check_additivity=False)
+        for start in range(0, len(dense), chunk_size)
+    )
+    return np.concatenate([stack_class_values(chunk) for chunk in chunks], axis=0)
+
+
+class ExplainerService:
+    """Feature attributions from an explainer built once per model.
+
+    The SHAP explainer is loaded (or, for tree models, built) once per model
+    and timed on a probe row, never rebuilt inside a request. The probe
+    decides the method for every row: SHAP while its per-row cost is within
+    the budget, tree path contributions otherwise. A SHAP call that turns
+    out slower than the budget per row switches to tree path contributions
+    too, without waiting for the probe. Since the choice depends
+    neither on batch size nor on what else is being explained, a row gets
+    the same explanation alone or in any batch. The probe is repeated every
+    ``reprobe_seconds``, so SHAP comes back once it is fast enough again.
+    Each method's per-row cost is tracked as well, so callers with a latency
+    budget can set aside the time the explanation will take.
+    """
+
+    def __init__(self, model, explainer_path: str = SHAP_EXPLAINER_PATH,
+                 attribution_path: str = ATTRIBUTION_TABLE_PATH, budget_ms: float = SHAP_BUDGET_MS,
+                 mmap_mode: Optional[str] = None, reprobe_seconds: float = SHAP_REPROBE_SECONDS):
+        self.budget_ms = budget_ms
+        self.mmap_mode = mmap_mode
+        self.reprobe_seconds = reprobe_seconds
+        self.model = None
+        self.explainer = None
+        self.attribution_table = None
+        self.shap_ms_per_row = None
+        self.use_shap = False
+        self.ms_per_row: Dict[str, float] = {}  # method -> running cost of explaining one row
+        self._probed_at = 0.0
+        self._probe_lock = threading.Lock()
+        self.load(model, explainer_path, attribution_path)
+
+    def load(self, model, explainer_path: str = SHAP_EXPLAINER_PATH, attribution_path: str = ATTRIBUTION_TABLE_PATH):
+        """(Re)build the explainer for a model; call once whenever the model changes"""
+        attribution_table = None
+        try:
+            attribution_table = joblib.load(attribution_path, mmap_mode=self.mmap_mode)
+            print(f"✅ Attribution table Loaded! {attribution_table.shape}")
+        except Exception as table_error:
+            print(f"⚠️ Attribution table could not be loaded, fast explanations disabled: {table_error}")
+
+        explainer = None
+        try:
+            explainer = joblib.load(explainer_path, mmap_mode=self.mmap_mode)
+            print("✅ SHAP Explainer Loaded!")
+        except Exception as explainer_error:
+            print(f"⚠️ SHAP Explainer could not be loaded: {explainer_error}")
+            if hasattr(model, "estimators_"):
+                try:
+                    explainer = shap.TreeExplainer(model)
+                    print("✅ Built path-dependent SHAP TreeExplainer")
+                except Exception as e:
+                    print(f"⚠️ Creating SHAP TreeExplainer failed: {e}")
+
+        if explainer is not None:
+            # Time one probe row so the first request already knows what SHAP costs
+            try:
+                self._probe(explainer, model)
+            except Exception as e:
+                print(f"⚠️ SHAP explainer failed on a probe row, disabling it: {e}")
+                explainer = None
+
+        self.model = model
+        self.explainer = explainer
+        self.attribution_table = attribution_table
+        if explainer is None:
+            self.shap_ms_per_row, self.use_shap = None, False
+
+    def _probe(self, explainer, model):
+        """Time SHAP on an all-zero row and decide whether rows are explained with it"""
+        probe = np.zeros((1, model.n_features_in_))
+        started = time.perf_counter()
+        self._shap_values(explainer, probe, [0])
+        self.shap_ms_per_row = (time.perf_counter() - started) * 1000
+        self.ms_per_row[METHOD_SHAP] = self.shap_ms_per_row
+        self._probed_at = time.monotonic()
+        use_shap = self.shap_ms_per_row <= self.budget_ms
+        if use_shap != self.use_shap:
+            print(f"SHAP costs about {self.shap_ms_per_row:.1f} ms per row (budget {self.budget_ms:.0f} ms), "
+                        f"explaining with {METHOD_SHAP if use_shap else METHOD_TREE_PATH}")
+        self.use_shap = use_shap
+
+    def _maybe_reprobe(self, explainer, model):
+        if time.monotonic() - self._probed_at < self.reprobe_seconds:
+            return
+        # One thread re-measures; the others keep the current decision
+        if not self._probe_lock.acquire(blocking=False):
+            return
+        try:
+            self._probe(explainer, model)
+        except Exception as e:
+            print(f"⚠️ SHAP probe failed: {e}")
+            self._probed_at = time.monotonic()
+        finally:
+            self._probe_lock.release()
+
+    def _shap_values(self, explainer, dense_matrix, class_indices):
+        if hasattr(explainer, "shap_values"):
+            try:
+                shap_values = explainer.shap_values(dense_matrix, check_additivity=False)
+            except TypeError:
+                shap_values = explainer.shap_values(dense_matrix)
+        else:
+            shap_values = explainer(dense_matrix)
+        return select_class_values(shap_values, class_indices)
+
+    def _method(self, fast: bool = False) -> Optional[str]:
+        """The method explain() currently uses, before trying it"""
+        if fast and self.attribution_table is not None:
+            return METHOD_TABLE
+        if self.explainer is not None and self.use_shap:
+            return METHOD_SHAP
+        if hasattr(self.model, "estimators_") or hasattr(self.model, "path_contributions"):
+            return METHOD_TREE_PATH
+        return None
+
+    def estimated_ms(self, n_rows: int, fast: bool = False) -> float:
+        """Expected time to explain n_rows with the current method (0 until it has been timed)"""
+        return self.ms_per_row.get(self._method(fast), 0.0) * n_rows
+
+    def _timed(self, values: np.ndarray, method: str, started: float) -> Tuple[np.ndarray, str]:
+        ms = (time.perf_counter() - started) * 1000 / max(len(values), 1)
+        previous = self.ms_per_row.get(method)
+        self.ms_per_row[method] = ms if previous is None else previous + EXPLAIN_COST_SMOOTHING * (ms - previous)
+        if method == METHOD_SHAP and ms > self.budget_ms and self.use_shap:
+            # Later calls fall back right away; the next probe decides when SHAP comes back
+            print(f"⚠️ SHAP took {ms:.1f} ms per row (budget {self.budget_ms:.0f} ms), "
+                  f"explaining with {METHOD_TREE_PATH}")
+            self.use_shap = False
+        return values, method
+
+    def explain(self, dense_matrix, class_indices: Sequence[int],
+                fast: bool = False) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """Return absolute (rows x features) importances and the method that produced them.
+
+        Every row of a call is explained with the same method, chosen before
+        the call, so results are identical row for row however rows are batched.
+        """
+        explainer, model = self.explainer, self.model
+
+        attribution_table = self.attribution_table
+        if fast and attribution_table is not None:
+            # Table row of the predicted disease, kept only for the symptoms present
+            started = time.perf_counter()
+            values = attribution_table[np.asarray(class_indices)] * (np.asarray(dense_matrix) != 0)
+            return self._timed(np.abs(values), METHOD_TABLE, started)
+
+        if explainer is not None:
+            self._maybe_reprobe(explainer, model)
+        if explainer is not None and self.use_shap:
+            try:
+                started = time.perf_counter()
+                values = self._shap_values(explainer, dense_matrix, class_indices)
+                return self._timed(np.abs(values), METHOD_SHAP, started)
+            except Exception as e:
+                print(f"⚠️ SHAP explanation failed: {e}")
+
+        if hasattr(model, "estimators_") or hasattr(model, "path_contributions"):
+            try:
+                started = time.perf_counter()
+                values = tree_path_contributions(model, dense_matrix, class_indices)
+                return self._timed(np.abs(values), METHOD_TREE_PATH, started)
+            except Exception as e:
+                print(f"⚠️ Tree path contributions failed: {e}")
+
+        return None, None
@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+
+# "sklearn" evaluates the forest through RandomForestClassifier.predict_proba,
+# "flat" through FlatForest's array-backed traversal
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "sklearn")
+INFERENCE_ENGINES = ("sklearn", "flat")
+
+# Directory FlatForest.save writes the flattened forest to, one .npy per array
+FLAT_FOREST_DIR = "models/disease_forest"
+
+# Rows evaluated together; bounds the (rows x trees x classes) gather
+FLAT_FOREST_ROW_BLOCK = 256
+
+# Trees evaluated between early-stopping checks in anytime prediction
+ANYTIME_TREE_BLOCK = int(os.getenv("ANYTIME_TREE_BLOCK", "8"))
+
+# Why anytime prediction stopped evaluating trees for a row
+STOP_COMPLETE = "complete"
+STOP_CONVERGED = "converged"
+STOP_BUDGET = "budget"
+
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots", "classes_", "feature_importances_")
+
+
+class FlatForest:
+    """A fitted random forest flattened into contiguous NumPy arrays.
+
+    All trees share one set of node arrays (split feature, threshold, left
+    and right child, class distribution) with global node ids. A batch is
+    evaluated level by level: each vectorized step moves every (row, tree)
+    pair that is still on an internal node down one level, with no per-tree
+    Python calls. The arrays can be saved as plain .npy files and
+    memory-mapped, so worker processes share one page-cache copy.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features: int,
+                 classes_, feature_importances_=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.classes_ = classes_
+        if feature_importances_ is not None:
+            self.feature_importances_ = feature_importances_
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "FlatForest":
+        """Flatten the fitted estimators of a RandomForestClassifier (or any tree ensemble with estimators_)"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        node_offset, max_depth = 0, 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            # Leaves loop back to themselves and split on feature 0, so any
+            # gather on them stays in bounds
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append((np.where(is_leaf, node_ids, tree.children_left) + node_offset).astype(np.int32))
+            rights.append((np.where(is_leaf, node_ids, tree.children_right) + node_offset).astype(np.int32))
+
+            node_values = tree.value[:, 0, :]
+            values.append(node_values / node_values.sum(axis=1, keepdims=True))
+
+            roots.append(node_offset)
+            node_offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            n_features=model.n_features_in_,
+            classes_=np.asarray(model.classes_),
+            feature_importances_=getattr(model, "feature_importances_", None),
+        )
+
+    def save(self, directory: str = FLAT_FOREST_DIR):
+        """Write every array as an uncompressed .npy file so it can be memory-mapped"""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            array = getattr(self, name, None)
+            if array is not None:
+                np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"max_depth": self.max_depth, "n_features": self.n_features_in_}, f)
+
+    @classmethod
+    def load(cls, directory: str = FLAT_FOREST_DIR, mmap_mode: Optional[str] = "r") -> "FlatForest":
+        """Load a saved forest; with mmap_mode="r" the arrays stay in the shared page cache"""
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {}
+        for name in ARRAY_NAMES:
+            path = os.path.join(directory, f"{name}.npy")
+            if os.path.exists(path):
+                arrays[name] = np.load(path, mmap_mode=mmap_mode)
+        return cls(max_depth=meta["max_depth"], n_features=meta["n_features"], **arrays)
+
+    def _as_dense(self, X) -> np.ndarray:
+        # Same float32 view of the input sklearn's trees compare against
+        if hasattr(X, "toarray"):
+            X = X.toarray()
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def apply(self, X, trees: Optional[slice] = None) -> np.ndarray:
+        """Leaf node id reached in each tree, shape (rows, trees)"""
+        X = self._as_dense(X)
+        roots = self.roots[trees] if trees is not None else self.roots
+        n_rows, n_trees = X.shape[0], len(roots)
+        nodes = np.tile(roots, n_rows)
+        rows = np.repeat(np.arange(n_rows, dtype=np.int32), n_trees)
+
+        # Step every (row, tree) pair still on an internal node down one level
+        active = np.flatnonzero(self.left[nodes] != nodes)
+        while active.size:
+            current = nodes[active]
+            go_left = X[rows[active], self.feature[current]] <= self.threshold[current]
+            nodes[active] = next_nodes = np.where(go_left, self.left[current], self.right[current])
+            active = active[self.left[next_nodes] != next_nodes]
+        return nodes.reshape(n_rows, n_trees)
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Mean leaf class distribution over all trees, like RandomForestClassifier.predict_proba"""
+        X = self._as_dense(X)
+        probabilities = np.empty((X.shape[0], len(self.classes_)))
+        for start in range(0, X.shape[0], FLAT_FOREST_ROW_BLOCK):
+            leaves = self.apply(X[start:start + FLAT_FOREST_ROW_BLOCK])
+            probabilities[start:start + FLAT_FOREST_ROW_BLOCK] = self.value[leaves].mean(axis=1)
+        return probabilities
+
+    def tree_proba_sum(self, X, trees: slice) -> np.ndarray:
+        """Summed leaf class distributions of a slice of the trees"""
+        X = self._as_dense(X)
+        totals = np.empty((X.shape[0], len(self.classes_)))
+        for start in range(0, X.shape[0], FLAT_FOREST_ROW_BLOCK):
+            leaves = self.apply(X[start:start + FLAT_FOREST_ROW_BLOCK], trees)
+            totals[start:start + FLAT_FOREST_ROW_BLOCK] = self.value[leaves].sum(axis=1)
+        return totals
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def path_contributions(self, X, class_indices: Sequence[int]) -> np.ndarray:
+        """Path-based (Saabas) feature contributions to each row's class probability, all trees at once"""
+        X = self._as_dense(X)
+        class_indices = np.asarray(class_indices)
+        n_rows, n_trees = X.shape[0], self.n_estimators
+        contributions = np.zeros((n_rows, self.n_features_in_))
+        nodes = np.tile(self.roots, n_rows)
+        rows = np.repeat(np.arange(n_rows, dtype=np.int32), n_trees)
+
+        active = np.flatnonzero(self.left[nodes] != nodes)
+        while active.size:
+            current = nodes[active]
+            active_rows = rows[active]
+            split_features = self.feature[current]
+            go_left = X[active_rows, split_features] <= self.threshold[current]
+            next_nodes = np.where(go_left, self.left[current], self.right[current])
+
+            classes = class_indices[active_rows]
+            delta = self.value[next_nodes, classes] - self.value[current, classes]
+            np.add.at(contributions, (active_rows, split_features), delta)
+
+            nodes[active] = next_nodes
+            active = active[self.left[next_nodes] != next_nodes]
+        return contributions / n_trees
+
+
+def tree_proba_sum(predictor, X, trees: slice) -> np.ndarray:
+    """Summed class distributions of a slice of a FlatForest's or a sklearn forest's trees"""
+    if isinstance(predictor, FlatForest):
+        return predictor.tree_proba_sum(X, trees)
+    return np.sum([estimator.predict_proba(X) for estimator in predictor.estimators_[trees]], axis=0)
+
+
+def anytime_predict_proba(predictor, X, budget_ms: Optional[float] = None, tree_block: int = ANYTIME_TREE_BLOCK):
+    """Evaluate trees block by block, stopping each row once its top-1 class is decided.
+
+    Every tree adds a distribution summing to 1, so after t of T trees no
+    class can gain more than T - t on another: a row whose leading class is
+    ahead of the runner-up by more than that is final. Rows still undecided
+    when ``budget_ms`` has elapsed stop too. Returns the mean distribution
+    over the trees each row used, the trees used per row and why it stopped.
+    """
+    started = time.perf_counter()
+    n_trees = len(predictor.estimators_) if hasattr(predictor, "estimators_") else predictor.n_estimators
+    n_rows = X.shape[0]
+    totals = np.zeros((n_rows, len(predictor.classes_)))
+    trees_used = np.zeros(n_rows, dtype=np.int64)
+    stopped = np.full(n_rows, STOP_COMPLETE, dtype=object)
+
+    active = np.arange(n_rows)
+    for start in range(0, n_trees, tree_block):
+        trees = slice(start, min(start + tree_block, n_trees))
+        totals[active] += tree_proba_sum(predictor, X[active], trees)
+        trees_used[active] = trees.stop
+
+        remaining = n_trees - trees.stop
+        if remaining == 0 or totals.shape[1] < 2:
+            break
+        runner_up, leader = np.partition(totals[active], -2, axis=1)[:, -2:].T
+        converged = leader - runner_up > remaining
+        stopped[active[converged]] = STOP_CONVERGED
+        active = active[~converged]
+        if not active.size:
+            break
+        if budget_ms is not None and (time.perf_counter() - started) * 1000 >= budget_ms:
+            stopped[active] = STOP_BUDGET
+            break
+
+    return totals / trees_used[:, np.newaxis], trees_used, stopped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a pickled forest as memory-mappable arrays")
+    parser.add_argument("--model", default="models/disease_model.pkl")
+    parser.add_argument("--out", default=FLAT_FOREST_DIR)
+    args = parser.parse_args()
+
+    import joblib
+
+    forest = FlatForest.from_sklearn(joblib.load(args.model))
+    forest.save(args.out)
+    print(f"✅ Exported {forest.n_estimators} trees / {forest.n_nodes} nodes to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
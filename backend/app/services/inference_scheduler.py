@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Rows collected into one model call
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "64"))
+# How long the first queued request waits for others to join its batch
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+# Worker threads running batches off the event loop
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+
+HISTOGRAM_BOUNDS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class Histogram:
+    """Counts of observed values in power-of-two buckets"""
+
+    def __init__(self, bounds: Sequence[int] = HISTOGRAM_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.observations = 0
+
+    def observe(self, value: int):
+        for idx, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            idx = len(self.bounds)
+        self.counts[idx] += 1
+        self.total += value
+        self.observations += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.observations,
+            "mean": round(self.total / self.observations, 2) if self.observations else 0.0,
+        }
+
+
+class MicroBatchScheduler:
+    """Collects concurrent requests into batches and runs them in a worker thread.
+
+    Each submitted item is a list of rows. The collector waits for a free
+    worker, then gathers items for up to ``max_wait_ms`` or until
+    ``max_batch_size`` rows are queued, and hands the batch to ``batch_fn``
+    in the thread pool. ``batch_fn`` receives the list of items and must
+    return one result per item; an exception returned in place of a result
+    fails only that item's caller. While every worker is busy, requests
+    keep queueing, so batches grow with load.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = INFERENCE_MAX_BATCH,
+                 max_wait_ms: float = INFERENCE_MAX_WAIT_MS, workers: int = INFERENCE_WORKERS):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+
+        self._loop = None
+        self._queue = None
+        self._slots = None
+        self._collector = None
+
+        self.queue_depth = Histogram()
+        self.batch_size = Histogram()
+        self.max_queue_depth = 0
+        self.failed_batches = 0
+        self.failed_requests = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._collector is not None and not self._collector.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._collector = loop.create_task(self._collect())
+
+    async def submit(self, rows: Sequence[Any]) -> List[Any]:
+        """Queue one request's rows and wait for their results"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        depth = self._queue.qsize()
+        self.queue_depth.observe(depth)
+        self.max_queue_depth = max(self.max_queue_depth, depth + 1)
+        self._queue.put_nowait((rows, future))
+        return await future
+
+    async def _collect(self):
+        while True:
+            # Only start a batch once a worker can take it
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            n_rows = len(batch[0][0])
+            deadline = self._loop.time() + self.max_wait
+
+            while n_rows < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0 and self._queue.empty():
+                    break
+                try:
+                    item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                n_rows += len(item[0])
+
+            self.batch_size.observe(n_rows)
+            self._loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            results = await self._loop.run_in_executor(self._executor, self.batch_fn, [rows for rows, _ in batch])
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"Inference batch of {len(batch)} request(s) failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    self.failed_requests += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "workers": self.workers,
+            "failed_batches": self.failed_batches,
+            "failed_requests": self.failed_requests,
+            "queue_depth_histogram": self.queue_depth.snapshot(),
+            "batch_size_histogram": self.batch_size.snapshot(),
+        }
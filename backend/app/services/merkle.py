@@ -0,0 +1,82 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+# Domain separation between leaves and inner nodes, so an inner node can never
+# be passed off as a leaf (second-preimage attack on the tree)
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+SIDE_LEFT = "left"
+SIDE_RIGHT = "right"
+
+ProofStep = Tuple[str, str]  # (sibling hash hex, side the sibling is on)
+
+
+def record_data_hash(record: Dict[str, Any]) -> str:
+    """Deterministic SHA-256 hex of a record's data (keys sorted), the hash that gets anchored"""
+    return hashlib.sha256(json.dumps(dict(record), sort_keys=True).encode()).hexdigest()
+
+
+def leaf_hash(record_hash: str) -> bytes:
+    """Tree leaf of a record hash (hex SHA-256 from record_data_hash)"""
+    return hashlib.sha256(LEAF_PREFIX + bytes.fromhex(record_hash)).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+class MerkleTree:
+    """Binary SHA-256 Merkle tree over record hashes, in insertion order.
+
+    A level with an odd number of nodes promotes its last node unchanged
+    instead of pairing it with itself, so no two different leaf lists share
+    a root.
+    """
+
+    def __init__(self, record_hashes: Sequence[str]):
+        if not record_hashes:
+            raise ValueError("A Merkle tree needs at least one leaf")
+        self.levels: List[List[bytes]] = [[leaf_hash(record_hash) for record_hash in record_hashes]]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            parents = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                parents.append(level[-1])
+            self.levels.append(parents)
+
+    @property
+    def root(self) -> str:
+        return self.levels[-1][0].hex()
+
+    def __len__(self) -> int:
+        return len(self.levels[0])
+
+    def proof(self, index: int) -> List[ProofStep]:
+        """Sibling hashes from leaf `index` up to the root"""
+        steps = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                steps.append((level[sibling].hex(), SIDE_LEFT if sibling < index else SIDE_RIGHT))
+            index //= 2
+        return steps
+
+
+def root_from_proof(record_hash: str, proof: Sequence[ProofStep]) -> str:
+    """The root a record hash and its inclusion proof lead to"""
+    node = leaf_hash(record_hash)
+    for sibling, side in proof:
+        sibling = bytes.fromhex(sibling)
+        node = node_hash(sibling, node) if side == SIDE_LEFT else node_hash(node, sibling)
+    return node.hex()
+
+
+def verify_proof(record_hash: str, proof: Sequence[ProofStep], root: str) -> bool:
+    """Whether the record hash is a leaf of the tree with this root"""
+    try:
+        return root_from_proof(record_hash, proof) == root
+    except (ValueError, TypeError):
+        # Malformed hex or proof steps
+        return False
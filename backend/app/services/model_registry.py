@@ -0,0 +1,371 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import joblib
+
+from app.services.explainer import ExplainerService
+from app.services.forest_engine import INFERENCE_ENGINE, INFERENCE_ENGINES, FlatForest
+from app.services.prediction_cache import artifact_fingerprint
+from app.services.symptom_features import (
+    ENCODING_MODES,
+    ENCODING_MULTIHOT,
+    SYMPTOM_ENCODER_PATH,
+    MultiHotSymptomEncoder,
+    TfidfSymptomEncoder,
+    load_encoding_config,
+    load_symptom_vocabulary,
+)
+
+logger = logging.getLogger(__name__)
+
+# Directory the training output is served from when no registry version exists
+LEGACY_MODEL_DIR = "models"
+# One sub-directory per version, each with a manifest.json of file checksums
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "models/registry")
+# Pins a version: it is served from startup and the CURRENT pointer is not
+# followed (only an explicit activation on this worker replaces it); otherwise
+# the worker serves and follows CURRENT
+MODEL_VERSION = os.getenv("MODEL_VERSION")
+# How often (seconds) each worker checks CURRENT for a version activated by another worker
+MODEL_REGISTRY_POLL_SECONDS = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "5"))
+# Serve from memory-mapped artifacts (flat forest arrays, uncompressed
+# explainer) so uvicorn workers share one page-cache copy
+MODEL_MMAP = os.getenv("MODEL_MMAP", "false").lower() == "true"
+
+MANIFEST_NAME = "manifest.json"
+# Version names are single directory names inside the registry
+VERSION_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+CURRENT_POINTER = "CURRENT"
+
+# Files that make up one model version, relative to its directory
+MODEL_ARTIFACTS = [
+    "disease_model.pkl",
+    "tfidf_vectorizer.pkl",
+    "label_encoder.pkl",
+    "feature_encoding.json",
+    "shap_explainer.pkl",
+    "symptom_attribution.pkl",
+    "disease_forest",
+]
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_files(directory: str) -> List[str]:
+    """Relative paths of every model file present in a version directory"""
+    files = []
+    for artifact in MODEL_ARTIFACTS:
+        path = os.path.join(directory, artifact)
+        if os.path.isdir(path):
+            files.extend(os.path.join(artifact, name) for name in sorted(os.listdir(path)))
+        elif os.path.exists(path):
+            files.append(artifact)
+    return files
+
+
+def write_manifest(directory: str, version: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Record the checksum of every artifact in a version directory"""
+    manifest = {
+        "version": version,
+        "created_at": datetime.utcnow().isoformat(),
+        "files": {relative: file_sha256(os.path.join(directory, relative)) for relative in artifact_files(directory)},
+        "metadata": metadata or {},
+    }
+    with open(os.path.join(directory, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def verify_manifest(directory: str, manifest: Dict[str, Any]):
+    """Raise if any artifact is missing or does not match its recorded checksum"""
+    for relative, expected in manifest["files"].items():
+        path = os.path.join(directory, relative)
+        if not os.path.exists(path):
+            raise ValueError(f"Model version {manifest['version']} is missing {relative}")
+        if file_sha256(path) != expected:
+            raise ValueError(f"Checksum mismatch for {relative} in model version {manifest['version']}")
+
+
+def check_version_name(version: str) -> str:
+    """Raise ValueError unless the version is a plain directory name (no separators or "..")"""
+    if not VERSION_NAME.fullmatch(version) or ".." in version:
+        raise ValueError(f"Invalid model version name {version!r}")
+    return version
+
+
+def publish_version(source_dir: str, version: str, registry_dir: str = MODEL_REGISTRY_DIR,
+                    metadata: Optional[Dict[str, Any]] = None) -> str:
+    """Copy training output into a new registry version with a manifest"""
+    target = os.path.join(registry_dir, check_version_name(version))
+    if os.path.exists(target):
+        raise ValueError(f"Model version {version} already exists")
+
+    staging = f"{target}.staging"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for artifact in MODEL_ARTIFACTS:
+        path = os.path.join(source_dir, artifact)
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(staging, artifact))
+        elif os.path.exists(path):
+            shutil.copy2(path, os.path.join(staging, artifact))
+    write_manifest(staging, version, metadata)
+    # Versions appear complete or not at all
+    os.replace(staging, target)
+    return target
+
+
+class ModelBundle:
+    """Everything one model version needs to serve predictions"""
+
+    def __init__(self, version: str, directory: str):
+        self.version = version
+        self.directory = directory
+        started = time.perf_counter()
+
+        if MODEL_MMAP:
+            # The flat forest replaces the sklearn pickle, which would be a private copy per worker
+            self.model = FlatForest.load(self.path("disease_forest"), mmap_mode="r")
+        else:
+            self.model = joblib.load(self.path("disease_model.pkl"))
+        self.label_encoder = joblib.load(self.path("label_encoder.pkl"))
+
+        # The encoder mode is recorded at training time; SYMPTOM_ENCODING overrides it
+        vocabulary_path = self.path("symptom_encoder.json")
+        vocabulary = load_symptom_vocabulary(vocabulary_path if os.path.exists(vocabulary_path) else SYMPTOM_ENCODER_PATH)
+        encoding_config = load_encoding_config(self.path("feature_encoding.json"))
+        self.encoding_mode = os.getenv("SYMPTOM_ENCODING", encoding_config["mode"])
+        if self.encoding_mode not in ENCODING_MODES:
+            raise ValueError(f"Unknown SYMPTOM_ENCODING '{self.encoding_mode}', expected one of {ENCODING_MODES}")
+
+        if self.encoding_mode == ENCODING_MULTIHOT:
+            self.symptom_encoder = MultiHotSymptomEncoder(vocabulary, idf=encoding_config.get("idf"), dense=True)
+        else:
+            self.symptom_encoder = TfidfSymptomEncoder(joblib.load(self.path("tfidf_vectorizer.pkl")), vocabulary)
+
+        n_model_features = getattr(self.model, "n_features_in_", self.symptom_encoder.n_features)
+        if n_model_features != self.symptom_encoder.n_features:
+            raise ValueError(
+                f"'{self.encoding_mode}' encoder produces {self.symptom_encoder.n_features} features "
+                f"but the model expects {n_model_features}; retrain with the matching encoding"
+            )
+
+        # Array-backed forest evaluation when INFERENCE_ENGINE=flat, sklearn otherwise
+        if INFERENCE_ENGINE not in INFERENCE_ENGINES:
+            raise ValueError(f"Unknown INFERENCE_ENGINE '{INFERENCE_ENGINE}', expected one of {INFERENCE_ENGINES}")
+        if isinstance(self.model, FlatForest) or INFERENCE_ENGINE == "sklearn":
+            self.predictor = self.model
+        else:
+            self.predictor = FlatForest.from_sklearn(self.model)
+        # Trees anytime prediction can stop early over; None for models that are not forests
+        self.n_estimators = (self.predictor.n_estimators if isinstance(self.predictor, FlatForest)
+                             else len(getattr(self.predictor, "estimators_", ())) or None)
+
+        # Symptom -> feature column index, built once instead of per request
+        self.feature_index = self.symptom_encoder.feature_index
+
+        # Explainer is loaded (or built) once per version and reused by every request
+        self.explainer_service = ExplainerService(
+            self.model,
+            explainer_path=self.path("shap_explainer.pkl"),
+            attribution_path=self.path("symptom_attribution.pkl"),
+            mmap_mode="r" if MODEL_MMAP else None,
+        )
+
+        self.artifact_paths = [self.path(relative) for relative in artifact_files(directory)]
+        self.load_ms = (time.perf_counter() - started) * 1000
+        self.first_request_ms = None
+        logger.info(
+            f"✅ Model version {version} loaded in {self.load_ms:.0f} ms: {self.encoding_mode} encoder "
+            f"({len(self.feature_index)} features), {type(self.predictor).__name__} predictor, "
+            f"SHAP {'available' if self.explainer_service.explainer is not None else 'unavailable'}, "
+            f"attribution table {'available' if self.explainer_service.attribution_table is not None else 'unavailable'}"
+        )
+
+    def path(self, relative: str) -> str:
+        return os.path.join(self.directory, relative)
+
+    def fingerprint(self) -> str:
+        """Version plus the on-disk state of its files, so edits in place are noticed too"""
+        return f"{self.version}:{artifact_fingerprint(self.artifact_paths)}"
+
+
+class ModelRegistry:
+    """Versioned model directories with a hot-swappable serving pointer.
+
+    ``current`` is replaced by a single reference assignment once a new
+    version has been verified, loaded and warmed, so each request keeps
+    whichever bundle it read at its start. Activation writes the registry's
+    CURRENT pointer, and every worker polls it so all of them follow, except
+    workers with a pinned version, which never poll.
+    """
+
+    def __init__(self, registry_dir: str = MODEL_REGISTRY_DIR,
+                 warm_fn: Optional[Callable[[ModelBundle], None]] = None,
+                 poll_seconds: float = MODEL_REGISTRY_POLL_SECONDS,
+                 pinned_version: Optional[str] = MODEL_VERSION):
+        self.registry_dir = registry_dir
+        self.pinned_version = pinned_version
+        self.warm_fn = warm_fn
+        self.poll_seconds = poll_seconds
+        self._activation_lock = threading.Lock()
+        self.activation: Dict[str, Any] = {"state": "idle"}
+        self.last_swap: Optional[Dict[str, Any]] = None
+
+        version = pinned_version or self.pointer_version()
+        if version:
+            self.current = self._load(version)
+        else:
+            # No registry yet: serve the training output directory as it is
+            legacy_files = [os.path.join(LEGACY_MODEL_DIR, relative) for relative in artifact_files(LEGACY_MODEL_DIR)]
+            self.current = ModelBundle(f"legacy-{artifact_fingerprint(legacy_files)}", LEGACY_MODEL_DIR)
+
+        if poll_seconds > 0 and not pinned_version:
+            threading.Thread(target=self._poll_pointer, name="model-registry-poll", daemon=True).start()
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.registry_dir, check_version_name(version))
+
+    def pointer_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.registry_dir, CURRENT_POINTER)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_pointer(self, version: str):
+        os.makedirs(self.registry_dir, exist_ok=True)
+        pointer = os.path.join(self.registry_dir, CURRENT_POINTER)
+        with open(f"{pointer}.tmp", "w") as f:
+            f.write(version)
+        os.replace(f"{pointer}.tmp", pointer)
+
+    def versions(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.registry_dir):
+            return []
+        manifests = []
+        for name in sorted(os.listdir(self.registry_dir)):
+            if VERSION_NAME.fullmatch(name) and os.path.exists(os.path.join(self.version_dir(name), MANIFEST_NAME)):
+                manifest = read_manifest(self.version_dir(name))
+                manifests.append({key: manifest.get(key) for key in ("version", "created_at", "metadata")})
+        return manifests
+
+    def _load(self, version: str) -> ModelBundle:
+        directory = self.version_dir(version)
+        verify_manifest(directory, read_manifest(directory))
+        return ModelBundle(version, directory)
+
+    def activate(self, version: str) -> Dict[str, Any]:
+        """Verify, load and warm a version, then swap it in; blocks until done"""
+        if not self._activation_lock.acquire(blocking=False):
+            raise RuntimeError(f"Activation of {self.activation.get('version')} is already in progress")
+        try:
+            self.activation = {"state": "loading", "version": version, "started_at": datetime.utcnow().isoformat()}
+            started = time.perf_counter()
+            bundle = self._load(version)
+            loaded = time.perf_counter()
+
+            self.activation["state"] = "warming"
+            if self.warm_fn is not None:
+                self.warm_fn(bundle)
+            warmed = time.perf_counter()
+
+            previous = self.current
+            self.current = bundle
+            swapped = time.perf_counter()
+            self._write_pointer(version)
+
+            self.last_swap = {
+                "from_version": previous.version,
+                "to_version": version,
+                "load_ms": round((loaded - started) * 1000, 1),
+                "warm_ms": round((warmed - loaded) * 1000, 1),
+                "swap_ms": round((swapped - warmed) * 1000, 3),
+                "first_request_ms": None,
+                "swapped_at": datetime.utcnow().isoformat(),
+            }
+            self.activation = {"state": "active", "version": version}
+            logger.info(f"Swapped model {previous.version} -> {version}: {self.last_swap}")
+            return self.last_swap
+        except Exception as e:
+            self.activation = {"state": "failed", "version": version, "error": str(e)}
+            logger.error(f"Activating model version {version} failed: {e}", exc_info=True)
+            raise
+        finally:
+            self._activation_lock.release()
+
+    def activate_in_background(self, version: str):
+        if not os.path.exists(os.path.join(self.version_dir(version), MANIFEST_NAME)):
+            raise ValueError(f"Unknown model version {version}")
+        if self._activation_lock.locked():
+            raise RuntimeError(f"Activation of {self.activation.get('version')} is already in progress")
+        threading.Thread(target=self._activate_quietly, args=(version,), name="model-activate", daemon=True).start()
+
+    def _activate_quietly(self, version: str):
+        try:
+            self.activate(version)
+        except Exception:
+            pass  # recorded in self.activation
+
+    def _poll_pointer(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            version = self.pointer_version()
+            failed = self.activation.get("state") == "failed" and self.activation.get("version") == version
+            if version and version != self.current.version and not failed and not self._activation_lock.locked():
+                logger.info(f"Registry pointer moved to {version}, activating")
+                self._activate_quietly(version)
+
+    def observe_request(self, bundle: ModelBundle, elapsed_ms: float):
+        """Record the latency of the first request served by a bundle"""
+        if bundle.first_request_ms is None:
+            bundle.first_request_ms = round(elapsed_ms, 1)
+            if self.last_swap and self.last_swap["to_version"] == bundle.version:
+                self.last_swap["first_request_ms"] = bundle.first_request_ms
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "current_version": self.current.version,
+            "pinned_version": self.pinned_version,
+            "current_load_ms": round(self.current.load_ms, 1),
+            "current_first_request_ms": self.current.first_request_ms,
+            "pointer_version": self.pointer_version(),
+            "activation": self.activation,
+            "last_swap": self.last_swap,
+            "versions": self.versions(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish training output as a new model registry version")
+    parser.add_argument("version")
+    parser.add_argument("--source", default=LEGACY_MODEL_DIR)
+    parser.add_argument("--registry", default=MODEL_REGISTRY_DIR)
+    args = parser.parse_args()
+
+    target = publish_version(args.source, args.version, args.registry)
+    print(f"✅ Published model version {args.version} to {target}")
+
+
+if __name__ == "__main__":
+    main()
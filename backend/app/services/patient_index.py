@@ -0,0 +1,192 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import MedicalRecord, RecordEmbedding
+from app.services.record_embeddings import EMBEDDING_MODEL_VERSION, decode_embeddings
+
+# Patients whose chunk matrix is kept in memory; the least recently searched are evicted
+PATIENT_INDEX_MAX_PATIENTS = int(os.getenv("PATIENT_INDEX_MAX_PATIENTS", "256"))
+
+# Rows allocated for a new index; capacity doubles as records are appended
+INITIAL_CAPACITY = 64
+
+
+class PatientVectorIndex:
+    """Normalized chunk embeddings of all of one patient's records in a single matrix.
+
+    A search is one matrix-vector product over every chunk of every record.
+    Rows live in a float32 buffer with spare capacity, so a new upload is
+    appended without rebuilding the matrix. Rows below ``size`` are never
+    rewritten, so a search reads a snapshot of them while records are appended.
+    ``stamp`` is the patient's (record count, max record id) the index reflects.
+    """
+
+    def __init__(self, dim: int, stamp: Optional[Tuple[int, int]] = None):
+        self.dim = dim
+        self.stamp = stamp
+        self.size = 0
+        self._lock = threading.Lock()
+        self._matrix = np.empty((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._record_ids = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self.chunks: List[str] = []
+        self.pages: List[Optional[int]] = []
+        self.records = set()
+
+    def add(self, record_id: int, chunks: Sequence[str], embeddings: np.ndarray,
+            pages: Optional[Sequence[int]] = None):
+        """Append a record's chunks; a record already in the index is left as is"""
+        with self._lock:
+            if record_id in self.records or not len(chunks):
+                return
+            n = len(chunks)
+            if self.size + n > len(self._matrix):
+                capacity = max(2 * len(self._matrix), self.size + n)
+                matrix = np.empty((capacity, self.dim), dtype=np.float32)
+                matrix[:self.size] = self._matrix[:self.size]
+                record_ids = np.empty(capacity, dtype=np.int64)
+                record_ids[:self.size] = self._record_ids[:self.size]
+                self._matrix, self._record_ids = matrix, record_ids
+
+            self._matrix[self.size:self.size + n] = embeddings
+            self._record_ids[self.size:self.size + n] = record_id
+            self.chunks.extend(chunks)
+            self.pages.extend(pages if pages is not None else [None] * n)
+            self.records.add(record_id)
+            self.size += n
+
+    def search(self, query_embedding: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        """Top-k chunks across all records, best first, each citing its record id"""
+        with self._lock:
+            matrix, record_ids, size = self._matrix, self._record_ids, self.size
+        k = min(k, size)
+        if k == 0:
+            return []
+        scores = matrix[:size] @ query_embedding
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {"record_id": int(record_ids[i]), "page": self.pages[i], "chunk": self.chunks[i],
+             "score": round(float(scores[i]), 4)}
+            for i in best
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes + self._record_ids.nbytes
+
+
+def patient_record_stamp(db: Session, patient_name: str) -> Tuple[int, int]:
+    """(record count, max record id) of a patient, which changes whenever any worker adds or deletes a record"""
+    count, max_id = (db.query(func.count(MedicalRecord.id), func.max(MedicalRecord.id))
+                     .filter(MedicalRecord.patient_name == patient_name)
+                     .one())
+    return count, max_id or 0
+
+
+def load_patient_embeddings(db: Session, patient_name: str, model_version: str = EMBEDDING_MODEL_VERSION
+                            ) -> Tuple[List[Tuple[int, List[str], np.ndarray, Optional[List[int]]]], List[MedicalRecord]]:
+    """Stored (record id, chunks, embeddings, pages) of a patient's records, and the records that have none yet"""
+    rows = (db.query(MedicalRecord, RecordEmbedding)
+            .outerjoin(RecordEmbedding, (RecordEmbedding.record_id == MedicalRecord.id)
+                       & (RecordEmbedding.model_version == model_version))
+            .filter(MedicalRecord.patient_name == patient_name)
+            .order_by(MedicalRecord.id)
+            .all())
+
+    embedded, missing = [], []
+    for record, embedding in rows:
+        if embedding is None:
+            missing.append(record)
+        else:
+            embedded.append((record.id, *decode_embeddings(embedding)))
+    return embedded, missing
+
+
+class PatientIndexCache:
+    """LRU of per-patient vector indexes, updated in place as records are uploaded.
+
+    Uploads handled by other worker processes never reach this cache, so a
+    lookup passes the patient's current record stamp and an index built for
+    another stamp is treated as a miss and rebuilt.
+    """
+
+    def __init__(self, max_patients: int = PATIENT_INDEX_MAX_PATIENTS):
+        self.max_patients = max_patients
+        self._indexes: "OrderedDict[str, PatientVectorIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    def get(self, patient_name: str, stamp: Optional[Tuple[int, int]] = None) -> Optional[PatientVectorIndex]:
+        with self._lock:
+            index = self._indexes.get(patient_name)
+            if index is None:
+                self.misses += 1
+                return None
+            if stamp is not None and index.stamp != stamp:
+                # Records were added or removed elsewhere since it was built
+                del self._indexes[patient_name]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._indexes.move_to_end(patient_name)
+            self.hits += 1
+            return index
+
+    def build(self, patient_name: str, records: Sequence[Tuple[int, List[str], np.ndarray, Optional[List[int]]]],
+              dim: Optional[int] = None, stamp: Optional[Tuple[int, int]] = None) -> PatientVectorIndex:
+        """Index a patient's (record id, chunks, embeddings, pages) and make it the most recently used"""
+        dim = dim or next((embeddings.shape[1] for _, _, embeddings, _ in records), 0)
+        index = PatientVectorIndex(dim, stamp)
+        for record_id, chunks, embeddings, pages in records:
+            index.add(record_id, chunks, embeddings, pages)
+
+        with self._lock:
+            self._indexes[patient_name] = index
+            self._indexes.move_to_end(patient_name)
+            while len(self._indexes) > self.max_patients:
+                self._indexes.popitem(last=False)
+                self.evictions += 1
+        return index
+
+    def add_record(self, patient_name: str, record_id: int, chunks: Sequence[str], embeddings: np.ndarray,
+                   pages: Optional[Sequence[int]] = None):
+        """Append a new record to the patient's index if it is loaded; cold patients are built on next search"""
+        with self._lock:
+            index = self._indexes.get(patient_name)
+            if index is None or record_id in index.records:
+                return
+            if index.dim != embeddings.shape[1]:
+                if index.size:
+                    # Embedded under another model; rebuild from the database on next search
+                    del self._indexes[patient_name]
+                    return
+                index = self._indexes[patient_name] = PatientVectorIndex(embeddings.shape[1], index.stamp)
+            if index.stamp is not None:
+                # The new record is one more row in the database; keep the index current for it
+                count, max_id = index.stamp
+                index.stamp = (count + 1, max(max_id, record_id))
+            index.add(record_id, chunks, embeddings, pages)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "patients": len(self._indexes),
+                "max_patients": self.max_patients,
+                "chunks": sum(index.size for index in self._indexes.values()),
+                "memory_mb": round(sum(index.nbytes for index in self._indexes.values()) / 1024 / 1024, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "stale_rebuilds": self.stale,
+            }
@@ -0,0 +1,202 @@
+import io
+import logging
+import mmap
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, NamedTuple, Optional, Tuple
+
+import pytesseract
+from pdf2image import convert_from_path
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTContainer, LTFigure, LTImage, LTText, LTTextBox
+
+logger = logging.getLogger(__name__)
+
+# Processes shared by pdfminer and OCR; each holds at most one rasterized page
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+
+# Resolution pages are rasterized at for OCR
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+
+# A page is OCR'd when its text layer has fewer characters than this...
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "20"))
+
+# ...or when images cover at least this fraction of it and the text layer is
+# still sparse (a scanned page with a typed header or stamp)
+OCR_IMAGE_COVERAGE = float(os.getenv("OCR_IMAGE_COVERAGE", "0.5"))
+OCR_SPARSE_TEXT_CHARS = int(os.getenv("OCR_SPARSE_TEXT_CHARS", "200"))
+
+PAGE_SOURCE_TEXT = "text"
+PAGE_SOURCE_OCR = "ocr"
+
+# "spawn" keeps workers from inheriting the server's threads and loaded models
+PDF_EXTRACT_START_METHOD = os.getenv("PDF_EXTRACT_START_METHOD", "spawn")
+
+
+def _init_worker():
+    # One Tesseract thread per process; the pool provides the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+class PageText(NamedTuple):
+    """Extracted text of one page and where it came from"""
+    page_number: int  # 1-based
+    text: str
+    source: str  # PAGE_SOURCE_TEXT or PAGE_SOURCE_OCR
+    image_coverage: float
+
+
+def _layout_text(item) -> str:
+    # Same text pdfminer's extract_text produces for the item
+    if isinstance(item, LTTextBox):
+        return item.get_text() + "\n"
+    if isinstance(item, LTText):
+        return item.get_text()
+    if isinstance(item, LTContainer):
+        return "".join(_layout_text(child) for child in item)
+    return ""
+
+
+def _image_area(item) -> float:
+    if isinstance(item, (LTImage, LTFigure)):
+        return max(item.width, 0) * max(item.height, 0)
+    if isinstance(item, LTContainer):
+        return sum(_image_area(child) for child in item)
+    return 0.0
+
+
+class MappedFile(io.RawIOBase):
+    """Read-only file object over a memory map.
+
+    pdfminer seeks back and forth through the xref tables and object
+    streams; serving those reads from the mapping uses the page cache
+    directly instead of copying the file through a read buffer.
+    """
+
+    def __init__(self, file_path: str):
+        super().__init__()
+        with open(file_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self._map.read(None if size is None or size < 0 else size)
+
+    def readinto(self, buffer) -> int:
+        data = self._map.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._map.seek(offset, whence)
+        return self._map.tell()
+
+    def tell(self) -> int:
+        return self._map.tell()
+
+    def close(self):
+        if not self.closed:
+            self._map.close()
+        super().close()
+
+
+def pdfminer_pages(file_path: str) -> List[Tuple[str, float]]:
+    """Text layer and image coverage (fraction of the page area) of every page, in one parse"""
+    pages = []
+    # An empty file cannot be mapped; pdfminer reports it as not a PDF
+    source = MappedFile(file_path) if os.path.getsize(file_path) else file_path
+    try:
+        for layout in extract_pages(source):
+            page_area = max(layout.width * layout.height, 1.0)
+            pages.append((_layout_text(layout).strip(), min(_image_area(layout) / page_area, 1.0)))
+    finally:
+        if isinstance(source, MappedFile):
+            source.close()
+    return pages
+
+
+def needs_ocr(text: str, image_coverage: float) -> bool:
+    """Whether a page's text layer is missing or too sparse for how much of it is image"""
+    n_chars = len("".join(text.split()))
+    return n_chars < OCR_MIN_TEXT_CHARS or (image_coverage >= OCR_IMAGE_COVERAGE and n_chars < OCR_SPARSE_TEXT_CHARS)
+
+
+def ocr_page(file_path: str, page_number: int, dpi: int = OCR_DPI) -> str:
+    """Rasterize and OCR a single page (1-based), so only that page's image is ever in memory"""
+    images = convert_from_path(file_path, dpi, first_page=page_number, last_page=page_number)
+    return "\n".join(pytesseract.image_to_string(image) for image in images)
+
+
+def join_pages(pages: List[PageText]) -> str:
+    return "\n".join(page.text for page in pages if page.text).strip()
+
+
+class PdfExtractionEngine:
+    """Text extraction on a dedicated process pool.
+
+    pdfminer and Tesseract are CPU-bound and hold the GIL, so both run in
+    worker processes rather than the server's thread pool. Pages are judged
+    one by one: those with a usable text layer keep it, and only image-only
+    (or nearly so) pages are OCR'd. Every OCR page is its own task that
+    rasterizes just that page, so pages are processed in parallel across
+    cores while memory stays at one page image per worker.
+    """
+
+    def __init__(self, workers: int = PDF_EXTRACT_WORKERS, dpi: int = OCR_DPI,
+                 start_method: str = PDF_EXTRACT_START_METHOD):
+        self.workers = max(1, workers)
+        self.dpi = dpi
+        self.start_method = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(self.start_method),
+                                                 initializer=_init_worker)
+            return self._pool
+
+    def _reset_pool(self):
+        # A crashed worker breaks the whole pool; the next call starts a fresh one
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def extract_pages(self, file_path: str) -> List[PageText]:
+        """Per-page text: the text layer where it covers the page, OCR (in parallel) only where it does not"""
+        try:
+            layers = self.pool.submit(pdfminer_pages, file_path).result()
+            ocr_numbers = [number for number, (text, coverage) in enumerate(layers, start=1)
+                           if needs_ocr(text, coverage)]
+            if ocr_numbers:
+                logger.info(f"OCR of {len(ocr_numbers)}/{len(layers)} page(s) of {file_path} "
+                            f"({self.workers} workers, {self.dpi} DPI)")
+            futures = {number: self.pool.submit(ocr_page, file_path, number, self.dpi) for number in ocr_numbers}
+
+            pages = []
+            for number, (text, coverage) in enumerate(layers, start=1):
+                ocr_text = futures[number].result().strip() if number in futures else ""
+                # Keep the text layer if OCR recovers no more than it had
+                if len(ocr_text) > len(text):
+                    pages.append(PageText(number, ocr_text, PAGE_SOURCE_OCR, coverage))
+                else:
+                    pages.append(PageText(number, text, PAGE_SOURCE_TEXT, coverage))
+            return pages
+        except BrokenProcessPool:
+            self._reset_pool()
+            raise
+
+    def shutdown(self):
+        self._reset_pool()
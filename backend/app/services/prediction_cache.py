@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Sequence, Tuple
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+# Seconds an entry stays valid; 0 keeps entries until evicted or invalidated
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+# How often (seconds) the model version is re-checked for invalidation
+PREDICTION_CACHE_VERSION_CHECK = float(os.getenv("PREDICTION_CACHE_VERSION_CHECK", "1"))
+
+
+def symptoms_key(symptoms: Iterable[str]) -> Tuple[str, ...]:
+    """Cache key of a symptom list, exactly as submitted.
+
+    Spelling, order and repeats all reach the model and the explanation keys,
+    so normalizing any of them away would let one caller's spelling be
+    served to another.
+    """
+    return tuple(symptoms)
+
+
+def artifact_fingerprint(paths: Sequence[str]) -> str:
+    """Cheap version of a set of model files, from their size and modification time"""
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            digest.update(f"{path}:missing;".encode())
+    return digest.hexdigest()[:16]
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with TTL for prediction + explanation results.
+
+    Entries are keyed by the model version as well as the caller's key, and
+    the whole cache is dropped as soon as ``version_fn`` reports a new model
+    version.
+    """
+
+    def __init__(self, max_size: int = PREDICTION_CACHE_SIZE, ttl_seconds: float = PREDICTION_CACHE_TTL,
+                 version_fn: Optional[Callable[[], str]] = None,
+                 version_check_seconds: float = PREDICTION_CACHE_VERSION_CHECK):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.version_fn = version_fn
+        self.version_check_seconds = version_check_seconds
+        self.version = version_fn() if version_fn else None
+
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_version_check = time.monotonic() + version_check_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, now: float):
+        if self.version_fn is None or now < self._next_version_check:
+            return
+        self._next_version_check = now + self.version_check_seconds
+        version = self.version_fn()
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+            self.invalidations += 1
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if self.max_size <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(now)
+            entry = self._entries.get((self.version, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at < now:
+                del self._entries[(self.version, key)]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end((self.version, key))
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        now = time.monotonic()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds > 0 else 0
+        with self._lock:
+            self._check_version(now)
+            self._entries[(self.version, key)] = (expires_at, value)
+            self._entries.move_to_end((self.version, key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self.version,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,26 @@
+import os
+import resource
+from typing import Dict
+
+# /proc/self/status fields, in kB: total resident, private anonymous,
+# file-backed (incl. memory-mapped model arrays) and shared memory
+PROC_STATUS_FIELDS = ("VmRSS", "RssAnon", "RssFile", "RssShmem")
+
+
+def process_memory() -> Dict[str, float]:
+    """Resident memory of this worker in MB, split into private and file-backed pages where Linux reports it"""
+    memory = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in PROC_STATUS_FIELDS:
+                    memory[f"{name.lower()}_mb"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+
+    if "vmrss_mb" not in memory:
+        # ru_maxrss is the peak RSS, in kB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["peak_rss_mb"] = round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+    return memory
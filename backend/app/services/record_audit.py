@@ -0,0 +1,306 @@
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import AnchorBatch, AnchorProof, MedicalRecord
+from app.services.anchoring import BATCH_ANCHORED
+from app.services.merkle import record_data_hash, verify_proof
+
+logger = logging.getLogger(__name__)
+
+# Processes hashing records; the main process only streams rows and writes the report
+AUDIT_WORKERS = int(os.getenv("AUDIT_WORKERS", str(os.cpu_count() or 1)))
+
+# Rows fetched per round trip of the server-side cursor and hashed per task
+AUDIT_CHUNK_SIZE = int(os.getenv("AUDIT_CHUNK_SIZE", "2000"))
+
+AUDIT_REPORT_DIR = os.getenv("AUDIT_REPORT_DIR", "./audit_report")
+AUDIT_START_METHOD = os.getenv("AUDIT_START_METHOD", "spawn")
+
+# Progress is logged (and the checkpoint rewritten) at most this often
+AUDIT_PROGRESS_SECONDS = 10.0
+
+CHECKPOINT_NAME = "checkpoint.json"
+MISMATCHES_NAME = "mismatches.jsonl"
+
+AUDIT_RUNNING = "running"
+AUDIT_COMPLETED = "completed"
+AUDIT_FAILED = "failed"
+
+# Per-record outcomes; everything except "ok", "unhashed" and "single_transaction" is written to the report
+OUTCOME_OK = "ok"
+OUTCOME_UNHASHED = "unhashed"  # Never hashed (uploaded without anchoring)
+OUTCOME_SINGLE_TRANSACTION = "single_transaction"  # Hash matches; anchored before Merkle batching, no proof
+OUTCOME_HASH_MISMATCH = "hash_mismatch"
+OUTCOME_PROOF_MISMATCH = "proof_mismatch"
+OUTCOME_UNREADABLE = "unreadable"
+REPORTED_OUTCOMES = {OUTCOME_HASH_MISMATCH, OUTCOME_PROOF_MISMATCH, OUTCOME_UNREADABLE}
+
+# (id, raw_data, hash_value, blockchain_hash, proof JSON, anchored merkle root)
+AuditRow = Tuple[int, Optional[str], Optional[str], Optional[str], Optional[str], Optional[str]]
+
+
+def audit_row(row: AuditRow) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Outcome of one record, and the report entry when it failed"""
+    record_id, raw_data, hash_value, blockchain_hash, proof, merkle_root = row
+    if not hash_value:
+        return OUTCOME_UNHASHED, None
+
+    # Records are stored as json.dumps of a dict whose keys are already in
+    # sorted order, so the raw text usually is the canonical serialization:
+    # a digest match on it is conclusive and skips the parse and re-dump
+    actual = hashlib.sha256(raw_data.encode()).hexdigest() if raw_data else None
+    if actual != hash_value:
+        try:
+            actual = record_data_hash(json.loads(raw_data))
+        except (TypeError, ValueError) as e:
+            return OUTCOME_UNREADABLE, {"record_id": record_id, "outcome": OUTCOME_UNREADABLE, "error": str(e)}
+    if actual != hash_value:
+        return OUTCOME_HASH_MISMATCH, {"record_id": record_id, "outcome": OUTCOME_HASH_MISMATCH,
+                                       "stored_hash": hash_value, "current_hash": actual,
+                                       "blockchain_tx": blockchain_hash}
+
+    if proof and merkle_root:
+        if not verify_proof(actual, json.loads(proof), merkle_root):
+            return OUTCOME_PROOF_MISMATCH, {"record_id": record_id, "outcome": OUTCOME_PROOF_MISMATCH,
+                                            "current_hash": actual, "merkle_root": merkle_root,
+                                            "blockchain_tx": blockchain_hash}
+        return OUTCOME_OK, None
+    return (OUTCOME_SINGLE_TRANSACTION if blockchain_hash else OUTCOME_OK), None
+
+
+def audit_chunk(rows: Sequence[AuditRow]) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Outcome counts and report entries of a chunk of rows (runs in a worker process)"""
+    counts = Counter()
+    mismatches = []
+    for row in rows:
+        outcome, entry = audit_row(row)
+        counts[outcome] += 1
+        if entry is not None:
+            mismatches.append(entry)
+    return dict(counts), mismatches
+
+
+class RecordAuditor:
+    """Full integrity audit of medical_records, resumable from its report directory.
+
+    Rows are streamed in id order through a server-side cursor and hashed
+    in chunks on a process pool, a bounded number of chunks in flight.
+    Results are applied in order: a chunk's mismatches are appended to
+    mismatches.jsonl, then checkpoint.json records the last audited id, the
+    report's length and the running counts. A resumed audit truncates the
+    report to that length and continues after that id, so nothing is
+    reported twice.
+    """
+
+    def __init__(self, report_dir: str = AUDIT_REPORT_DIR,
+                 session_factory: Callable[[], Session] = SessionLocal,
+                 workers: int = AUDIT_WORKERS, chunk_size: int = AUDIT_CHUNK_SIZE,
+                 start_method: str = AUDIT_START_METHOD):
+        self.report_dir = report_dir
+        self.session_factory = session_factory
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.start_method = start_method
+        self._lock = threading.Lock()
+        self.state: Dict[str, Any] = self._load_checkpoint() or {}
+
+    @property
+    def checkpoint_path(self) -> str:
+        return os.path.join(self.report_dir, CHECKPOINT_NAME)
+
+    @property
+    def mismatches_path(self) -> str:
+        return os.path.join(self.report_dir, MISMATCHES_NAME)
+
+    def _load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def _save_checkpoint(self):
+        # Written to a temp file and renamed, so a crash never leaves a torn checkpoint
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    def progress(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.state, counts=dict(self.state.get("counts", {})))
+
+    def _stream_rows(self, db: Session, after_id: int):
+        query = (db.query(MedicalRecord.id, MedicalRecord.raw_data, MedicalRecord.hash_value,
+                          MedicalRecord.blockchain_hash, AnchorProof.proof, AnchorBatch.merkle_root)
+                 .outerjoin(AnchorProof, AnchorProof.record_id == MedicalRecord.id)
+                 .outerjoin(AnchorBatch, and_(AnchorBatch.id == AnchorProof.batch_id,
+                                              AnchorBatch.status == BATCH_ANCHORED))
+                 .filter(MedicalRecord.id > after_id)
+                 .order_by(MedicalRecord.id)
+                 .execution_options(stream_results=True, yield_per=self.chunk_size))
+        chunk = []
+        for row in query:
+            chunk.append(tuple(row))
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def run(self, resume: bool = True) -> Dict[str, Any]:
+        """Audit every record (or the rest of an interrupted audit); returns the final checkpoint"""
+        os.makedirs(self.report_dir, exist_ok=True)
+        previous = self._load_checkpoint()
+        resuming = resume and previous is not None and previous.get("status") != AUDIT_COMPLETED
+        db = self.session_factory()
+        try:
+            with self._lock:
+                if resuming:
+                    self.state = previous
+                    self.state["status"] = AUDIT_RUNNING
+                    self.state["resumed_at"] = datetime.utcnow().isoformat()
+                else:
+                    self.state = {"status": AUDIT_RUNNING, "started_at": datetime.utcnow().isoformat(),
+                                  "last_id": 0, "records": 0, "report_bytes": 0, "counts": {},
+                                  "elapsed_seconds": 0.0}
+                self.state["total_records"] = db.query(MedicalRecord).count()
+                self.state["error"] = None
+
+            # Drop anything written after the last checkpoint
+            with open(self.mismatches_path, "a+b") as report:
+                report.truncate(self.state["report_bytes"])
+            logger.info(f"{'Resuming' if resuming else 'Starting'} audit of {self.state['total_records']} records "
+                        f"after id {self.state['last_id']} ({self.workers} workers, chunks of {self.chunk_size})")
+            self._audit(db)
+        except Exception as e:
+            with self._lock:
+                self.state["status"] = AUDIT_FAILED
+                self.state["error"] = str(e)
+            self._save_checkpoint()
+            logger.error(f"Audit failed after id {self.state.get('last_id')}: {e}", exc_info=True)
+            raise
+        finally:
+            db.close()
+        return self.progress()
+
+    def _audit(self, db: Session):
+        started = time.perf_counter()
+        elapsed_before = self.state["elapsed_seconds"]
+        records_before = self.state["records"]
+        last_progress = started
+        context = multiprocessing.get_context(self.start_method)
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool, \
+                open(self.mismatches_path, "ab") as report:
+            in_flight = deque()
+
+            def apply_oldest():
+                last_id, future = in_flight.popleft()
+                counts, mismatches = future.result()
+                for entry in mismatches:
+                    report.write((json.dumps(entry) + "\n").encode())
+                report.flush()
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    state = self.state
+                    state["last_id"] = last_id
+                    state["records"] += sum(counts.values())
+                    state["counts"] = dict(Counter(state["counts"]) + Counter(counts))
+                    state["report_bytes"] = report.tell()
+                    state["elapsed_seconds"] = round(elapsed_before + elapsed, 1)
+                    rate = (state["records"] - records_before) / elapsed if elapsed else 0.0
+                    state["records_per_second"] = round(rate, 1)
+                    remaining = max(state["total_records"] - state["records"], 0)
+                    state["eta_seconds"] = round(remaining / rate, 1) if rate else None
+
+            for chunk in self._stream_rows(db, self.state["last_id"]):
+                in_flight.append((chunk[-1][0], pool.submit(audit_chunk, chunk)))
+                # Keep every worker busy with one chunk queued behind it, and no more rows in memory
+                while len(in_flight) > 2 * self.workers:
+                    apply_oldest()
+                    if time.perf_counter() - last_progress >= AUDIT_PROGRESS_SECONDS:
+                        last_progress = time.perf_counter()
+                        self._save_checkpoint()
+                        self._log_progress()
+            while in_flight:
+                apply_oldest()
+
+        with self._lock:
+            self.state["status"] = AUDIT_COMPLETED
+            self.state["finished_at"] = datetime.utcnow().isoformat()
+        self._save_checkpoint()
+        self._log_progress()
+
+    def _log_progress(self):
+        state = self.progress()
+        reported = sum(state["counts"].get(outcome, 0) for outcome in REPORTED_OUTCOMES)
+        logger.info(f"Audit {state['status']}: {state['records']}/{state['total_records']} records, "
+                    f"{reported} reported, {state.get('records_per_second', 0)} records/s")
+
+
+class AuditRunner:
+    """One audit at a time in a background thread, for the admin endpoint"""
+
+    def __init__(self, report_dir: str = AUDIT_REPORT_DIR):
+        self.auditor = RecordAuditor(report_dir)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, resume: bool = True):
+        if self.running:
+            raise RuntimeError("An audit is already running")
+        self._thread = threading.Thread(target=self._run_quietly, args=(resume,), name="record-audit", daemon=True)
+        self._thread.start()
+
+    def _run_quietly(self, resume: bool):
+        try:
+            self.auditor.run(resume=resume)
+        except Exception:
+            pass  # recorded in the checkpoint
+
+    def status(self) -> Dict[str, Any]:
+        return {"running": self.running, "report_dir": self.auditor.report_dir, **self.auditor.progress()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit every medical record's hash (and Merkle proof) "
+                                                 "against the stored values")
+    parser.add_argument("--report-dir", default=AUDIT_REPORT_DIR,
+                        help="checkpoint and mismatches.jsonl; an unfinished audit there is resumed")
+    parser.add_argument("--workers", type=int, default=AUDIT_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=AUDIT_CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore an unfinished audit and start over")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    result = RecordAuditor(args.report_dir, workers=args.workers, chunk_size=args.chunk_size).run(
+        resume=not args.restart)
+    reported = sum(result["counts"].get(outcome, 0) for outcome in REPORTED_OUTCOMES)
+    print(f"{'✅' if not reported else '❌'} Audited {result['records']} records in {result['elapsed_seconds']} s: "
+          f"{json.dumps(result['counts'])}")
+    if reported:
+        print(f"Mismatches written to {os.path.join(args.report_dir, MISMATCHES_NAME)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
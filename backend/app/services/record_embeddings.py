@@ -0,0 +1,83 @@
+import json
+import os
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models import RecordEmbedding
+
+# Sentence embedding model used for chunk retrieval
+SBERT_MODEL_NAME = os.getenv("SBERT_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+
+# Stored vectors are only reused for the same version; change it whenever the
+# model or the chunking changes so records are re-embedded on their next use
+EMBEDDING_MODEL_VERSION = os.getenv("EMBEDDING_MODEL_VERSION", SBERT_MODEL_NAME)
+
+# Vectors are persisted as float16: half the storage, and cosine scores stay
+# well within the precision retrieval needs
+EMBEDDING_DTYPE = np.float16
+
+
+class StoredEmbeddings(NamedTuple):
+    chunks: List[str]
+    embeddings: np.ndarray  # (n_chunks x dim) float16
+    pages: Optional[List[int]]  # Page each chunk came from, when chunked per page
+
+
+def encode_chunks(sbert_model, chunks: Sequence[str]) -> np.ndarray:
+    """L2-normalized float16 embeddings, one row per chunk"""
+    embeddings = sbert_model.encode(list(chunks), convert_to_numpy=True, normalize_embeddings=True)
+    return np.asarray(embeddings, dtype=EMBEDDING_DTYPE).reshape(len(chunks), -1)
+
+
+def encode_query(sbert_model, query: str) -> np.ndarray:
+    """L2-normalized float32 embedding of a question"""
+    return np.asarray(sbert_model.encode(query, convert_to_numpy=True, normalize_embeddings=True), dtype=np.float32)
+
+
+def save_record_embeddings(db: Session, record_id: int, chunks: Sequence[str], embeddings: np.ndarray,
+                           model_version: str = EMBEDDING_MODEL_VERSION,
+                           pages: Optional[Sequence[int]] = None) -> RecordEmbedding:
+    """Store (or replace) a record's chunk embeddings for one embedding model version"""
+    embeddings = np.ascontiguousarray(embeddings, dtype=EMBEDDING_DTYPE)
+    row = (db.query(RecordEmbedding)
+           .filter(RecordEmbedding.record_id == record_id, RecordEmbedding.model_version == model_version)
+           .first())
+    if row is None:
+        row = RecordEmbedding(record_id=record_id, model_version=model_version)
+        db.add(row)
+
+    row.chunks = json.dumps({"chunks": list(chunks), "pages": list(pages)} if pages is not None else list(chunks))
+    row.n_chunks, row.dim = embeddings.shape
+    row.embeddings = embeddings.tobytes()
+    db.commit()
+    return row
+
+
+def decode_embeddings(row: RecordEmbedding) -> StoredEmbeddings:
+    """Chunk texts, their (n_chunks x dim) float16 embedding matrix and their pages"""
+    embeddings = np.frombuffer(row.embeddings, dtype=EMBEDDING_DTYPE).reshape(row.n_chunks, row.dim)
+    chunks = json.loads(row.chunks)
+    if isinstance(chunks, dict):
+        return StoredEmbeddings(chunks["chunks"], embeddings, chunks["pages"])
+    return StoredEmbeddings(chunks, embeddings, None)
+
+
+def load_record_embeddings(db: Session, record_id: int,
+                           model_version: str = EMBEDDING_MODEL_VERSION) -> Optional[StoredEmbeddings]:
+    """Stored chunks and embeddings of a record, or None if it has none for this model version"""
+    row = (db.query(RecordEmbedding)
+           .filter(RecordEmbedding.record_id == record_id, RecordEmbedding.model_version == model_version)
+           .first())
+    return decode_embeddings(row) if row is not None else None
+
+
+def top_chunks(query_embedding: np.ndarray, embeddings: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k chunks most similar to the query, best first (cosine on normalized vectors)"""
+    scores = embeddings.astype(np.float32) @ query_embedding
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
@@ -0,0 +1,139 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+SYMPTOM_ENCODER_PATH = "models/symptom_encoder.json"
+FEATURE_ENCODING_PATH = "models/feature_encoding.json"
+
+# Encoder modes: TF-IDF over the comma-joined symptom text, or multi-hot
+# columns written straight from the canonical symptom mapping
+ENCODING_TFIDF = "tfidf"
+ENCODING_MULTIHOT = "multihot"
+ENCODING_MODES = (ENCODING_TFIDF, ENCODING_MULTIHOT)
+
+
+def load_symptom_vocabulary(path: str = SYMPTOM_ENCODER_PATH) -> Dict[str, int]:
+    """Load the canonical symptom -> index mapping shipped with the model"""
+    with open(path) as f:
+        return json.load(f)
+
+
+class SymptomFeatureIndex:
+    """O(1) lookups from a submitted symptom to its feature columns.
+
+    Built once at model load from the feature names of the encoder and
+    seeded with the canonical symptoms, so the explanation path never scans
+    the vocabulary per request.
+    """
+
+    def __init__(self, feature_names: Iterable[str], symptoms: Iterable[str] = ()):
+        self.feature_names = np.asarray(list(feature_names), dtype=object)
+        self.columns: Dict[str, int] = {name: idx for idx, name in enumerate(self.feature_names)}
+        self._resolved: Dict[str, List[Tuple[Optional[str], int]]] = {}
+        for symptom in symptoms:
+            processed_symptom = symptom.lower().strip()
+            self._resolved[processed_symptom] = self._resolve(processed_symptom)
+
+    def __len__(self) -> int:
+        return len(self.feature_names)
+
+    def _resolve(self, processed_symptom: str) -> List[Tuple[Optional[str], int]]:
+        # Exact match first
+        if processed_symptom in self.columns:
+            return [(None, self.columns[processed_symptom])]
+
+        # Fall back to individual words
+        matches = []
+        for word in processed_symptom.replace("_", " ").split():
+            word = word.strip()
+            if word and word in self.columns:
+                matches.append((word, self.columns[word]))
+        return matches
+
+    def lookup(self, symptom: str) -> List[Tuple[Optional[str], int]]:
+        """Return (matched word, column) pairs for a symptom; word is None on an exact match"""
+        processed_symptom = symptom.lower().strip()
+        resolved = self._resolved.get(processed_symptom)
+        if resolved is None:
+            # Unknown input is resolved on the fly and not cached, to keep the index bounded
+            resolved = self._resolve(processed_symptom)
+        return resolved
+
+
+def smooth_idf(X) -> np.ndarray:
+    """Smoothed IDF weights of a (samples x symptoms) presence matrix, as TfidfTransformer computes them"""
+    n_samples = X.shape[0]
+    document_frequency = np.asarray((X != 0).sum(axis=0)).ravel()
+    return np.log((1 + n_samples) / (1 + document_frequency)) + 1
+
+
+class TfidfSymptomEncoder:
+    """Legacy encoder: joins symptoms into text and re-tokenizes it with the fitted TfidfVectorizer"""
+
+    mode = ENCODING_TFIDF
+
+    def __init__(self, vectorizer, symptoms: Iterable[str] = ()):
+        self.vectorizer = vectorizer
+        self.feature_index = SymptomFeatureIndex(vectorizer.get_feature_names_out(), symptoms)
+
+    @property
+    def n_features(self) -> int:
+        return len(self.feature_index)
+
+    def transform(self, symptom_lists: Sequence[Sequence[str]]):
+        return self.vectorizer.transform([",".join(symptoms) for symptoms in symptom_lists])
+
+
+class MultiHotSymptomEncoder:
+    """Writes multi-hot rows straight from the canonical symptom -> index mapping.
+
+    Skips the string join and regex tokenization of the TF-IDF path. When
+    ``idf`` is given, present symptoms carry their IDF weight instead of 1.
+    """
+
+    mode = ENCODING_MULTIHOT
+
+    def __init__(self, vocabulary: Dict[str, int], idf: Optional[Sequence[float]] = None, dense: bool = False):
+        self.vocabulary = {symptom.lower().strip(): idx for symptom, idx in vocabulary.items()}
+        self.idf = np.asarray(idf, dtype=np.float64) if idf is not None else None
+        self.dense = dense
+
+        feature_names = sorted(vocabulary, key=vocabulary.get)
+        if self.idf is not None and len(self.idf) != len(feature_names):
+            raise ValueError(f"IDF has {len(self.idf)} weights for {len(feature_names)} symptoms")
+        self.feature_index = SymptomFeatureIndex(feature_names, vocabulary)
+
+    @property
+    def n_features(self) -> int:
+        return len(self.feature_index)
+
+    def transform(self, symptom_lists: Sequence[Sequence[str]]):
+        indptr = [0]
+        indices: List[int] = []
+        for symptoms in symptom_lists:
+            columns = {self.vocabulary.get(symptom.lower().strip()) for symptom in symptoms}
+            columns.discard(None)
+            indices.extend(sorted(columns))
+            indptr.append(len(indices))
+
+        indices_array = np.asarray(indices, dtype=np.int32)
+        data = self.idf[indices_array] if self.idf is not None else np.ones(len(indices_array))
+        matrix = csr_matrix((data, indices_array, np.asarray(indptr, dtype=np.int32)),
+                            shape=(len(symptom_lists), self.n_features))
+        return matrix.toarray() if self.dense else matrix
+
+
+def load_encoding_config(path: str = FEATURE_ENCODING_PATH) -> Dict[str, Any]:
+    """Read the encoder settings saved by training; models predating it used TF-IDF"""
+    if not os.path.exists(path):
+        return {"mode": ENCODING_TFIDF}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_encoding_config(config: Dict[str, Any], path: str = FEATURE_ENCODING_PATH):
+    with open(path, "w") as f:
+        json.dump(config, f)
@@ -0,0 +1,364 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3.exceptions import TransactionNotFound
+
+logger = logging.getLogger(__name__)
+
+# Connections kept open to the RPC endpoint and shared by every call
+RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "10"))
+RPC_TIMEOUT_SECONDS = float(os.getenv("RPC_TIMEOUT_SECONDS", "10"))
+
+TX_GAS_LIMIT = 100000
+
+# Gas price is fetched at most once per TTL and padded by the multiplier
+GAS_PRICE_TTL_SECONDS = float(os.getenv("GAS_PRICE_TTL_SECONDS", "15"))
+GAS_PRICE_MULTIPLIER = 1.1
+
+# Attempts to get a transaction accepted by the node, with exponential backoff
+TX_SUBMIT_ATTEMPTS = int(os.getenv("TX_SUBMIT_ATTEMPTS", "5"))
+TX_RETRY_BACKOFF_SECONDS = float(os.getenv("TX_RETRY_BACKOFF_SECONDS", "0.5"))
+
+# Receipts are polled for every submitted transaction; one still unmined after
+# the timeout is re-sent with the same nonce and a higher gas price
+TX_RECEIPT_POLL_SECONDS = float(os.getenv("TX_RECEIPT_POLL_SECONDS", "5"))
+TX_RECEIPT_TIMEOUT_SECONDS = float(os.getenv("TX_RECEIPT_TIMEOUT_SECONDS", "180"))
+TX_MAX_REPLACEMENTS = 3
+TX_REPLACEMENT_GAS_BUMP = 1.125  # Nodes require at least +10% to replace a pending transaction
+
+# Finished receipts kept for status lookups
+TX_RECEIPT_HISTORY = 1000
+
+# Node errors meaning our local nonce is out of step with the chain
+NONCE_ERRORS = ("nonce too low", "already known", "known transaction", "replacement transaction underpriced")
+
+# Node errors meaning it already holds the very transaction we just sent
+KNOWN_TX_ERRORS = ("already known", "known transaction")
+
+TX_PENDING = "pending"
+TX_MINED = "mined"
+TX_REVERTED = "reverted"
+
+
+def pooled_session(pool_size: int = RPC_POOL_SIZE) -> requests.Session:
+    """HTTP session keeping up to pool_size keep-alive connections, for Web3.HTTPProvider(session=...)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class NonceManager:
+    """Next nonce of the sending account, tracked locally.
+
+    Read from the node ("pending" count) once, then advanced for every
+    accepted transaction; a nonce error makes the next call read it again.
+    """
+
+    def __init__(self, fetch: Callable[[], int]):
+        self._fetch = fetch
+        self._next: Optional[int] = None
+        self._lock = threading.Lock()
+        self.resyncs = 0
+
+    def peek(self) -> int:
+        with self._lock:
+            if self._next is None:
+                self._next = self._fetch()
+            return self._next
+
+    def advance(self):
+        with self._lock:
+            if self._next is not None:  # Otherwise the next peek reads it from the node again
+                self._next += 1
+
+    def resync(self):
+        with self._lock:
+            self._next = None
+            self.resyncs += 1
+
+
+class GasPriceCache:
+    """Node gas price, padded by GAS_PRICE_MULTIPLIER and refreshed at most once per TTL"""
+
+    def __init__(self, fetch: Callable[[], int], ttl_seconds: float = GAS_PRICE_TTL_SECONDS,
+                 multiplier: float = GAS_PRICE_MULTIPLIER):
+        self._fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.multiplier = multiplier
+        self._price: Optional[int] = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def get(self) -> int:
+        with self._lock:
+            if self._price is None or time.monotonic() - self._fetched_at > self.ttl_seconds:
+                self._price = int(self._fetch() * self.multiplier)
+                self._fetched_at = time.monotonic()
+                self.fetches += 1
+            return self._price
+
+    def invalidate(self):
+        with self._lock:
+            self._price = None
+
+
+class TrackedTransaction:
+    """A data transaction from submission until its receipt"""
+
+    def __init__(self, data: str, future: Future):
+        self.data = data
+        self.future = future
+        self.nonce: Optional[int] = None
+        self.gas_price = 0
+        self.hashes: List[str] = []  # Original hash first, then any replacements
+        self.submitted_at = 0.0
+        self.first_submitted_at = 0.0
+        self.replacements = 0
+
+
+class TransactionSubmitter:
+    """Single writer for the account's transactions.
+
+    Callers enqueue data and get a Future of the transaction hash; one
+    thread signs and sends them in order, so nonces come from a local
+    counter instead of a get_transaction_count per transaction and
+    concurrent submissions never collide. Send failures are retried with
+    backoff (resyncing the nonce on nonce errors); a failed send may still
+    have reached the node, so before each retry the hashes of the earlier
+    attempts are looked up and one the node knows is taken as accepted
+    instead of being sent again under a new nonce. A second thread polls
+    receipts and re-sends a transaction that stays unmined with a bumped
+    gas price under the same nonce; ``on_mined(original_hash, mined_hash,
+    receipt)`` reports where each one finally landed.
+    """
+
+    def __init__(self, web3, address: str, private_key: str, chain_id: int, gas_limit: int = TX_GAS_LIMIT,
+                 attempts: int = TX_SUBMIT_ATTEMPTS, backoff_seconds: float = TX_RETRY_BACKOFF_SECONDS,
+                 gas_price_ttl_seconds: float = GAS_PRICE_TTL_SECONDS,
+                 receipt_poll_seconds: float = TX_RECEIPT_POLL_SECONDS,
+                 receipt_timeout_seconds: float = TX_RECEIPT_TIMEOUT_SECONDS,
+                 on_mined: Optional[Callable[[str, str, Dict[str, Any]], None]] = None):
+        self.web3 = web3
+        self.address = address
+        self.private_key = private_key
+        self.chain_id = chain_id
+        self.gas_limit = gas_limit
+        self.attempts = max(1, attempts)
+        self.backoff_seconds = backoff_seconds
+        self.receipt_poll_seconds = receipt_poll_seconds
+        self.receipt_timeout_seconds = receipt_timeout_seconds
+        self.on_mined = on_mined
+        self.nonces = NonceManager(lambda: web3.eth.get_transaction_count(address, "pending"))
+        self.gas_prices = GasPriceCache(lambda: web3.eth.gas_price, gas_price_ttl_seconds)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._unmined: Dict[int, TrackedTransaction] = {}
+        self.receipts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.counters = {"submitted": 0, "failed": 0, "retries": 0, "replaced": 0, "mined": 0, "reverted": 0}
+        # time.monotonic() of the last transaction the node accepted, and of the last receipt
+        self.last_accepted_at: Optional[float] = None
+        self.last_mined_at: Optional[float] = None
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._write_loop, name="tx-writer", daemon=True),
+                             threading.Thread(target=self._receipt_loop, name="tx-receipts", daemon=True)]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stop.set()
+        self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def submit(self, data: str) -> "Future[str]":
+        """Queue a transaction carrying `data` (text); resolves to its hash once the node accepts it"""
+        self.start()
+        future: "Future[str]" = Future()
+        self._queue.put(TrackedTransaction(data, future))
+        return future
+
+    def _write_loop(self):
+        while True:
+            tx = self._queue.get()
+            if tx is None:
+                return
+            try:
+                self._send(tx)
+            except Exception as e:
+                logger.error(f"Transaction writer error: {e}", exc_info=True)
+                if not tx.future.done():
+                    tx.future.set_exception(e)
+
+    def _send(self, tx: TrackedTransaction):
+        replacing = tx.nonce is not None
+        attempted = []  # (hash, nonce, gas price) of this call's signed attempts
+        for attempt in range(1, self.attempts + 1):
+            signed_hash = None
+            try:
+                landed = self._landed(attempted)
+                if landed is not None:
+                    # An attempt whose response was lost reached the node after all
+                    self._accepted(tx, *landed, replacing)
+                    return
+                nonce = tx.nonce if replacing else self.nonces.peek()
+                gas_price = self.gas_prices.get()
+                if replacing:
+                    gas_price = max(gas_price, int(tx.gas_price * TX_REPLACEMENT_GAS_BUMP) + 1)
+                signed = self.web3.eth.account.sign_transaction({
+                    "from": self.address,
+                    "to": self.address,
+                    "value": 0,
+                    "gas": self.gas_limit,
+                    "gasPrice": gas_price,
+                    "nonce": nonce,
+                    "chainId": self.chain_id,
+                    "data": self.web3.to_hex(text=tx.data),
+                }, self.private_key)
+                signed_hash = self.web3.to_hex(signed.hash)
+                attempted.append((signed_hash, nonce, gas_price))
+                tx_hash = self.web3.to_hex(self.web3.eth.send_raw_transaction(signed.raw_transaction))
+            except Exception as e:
+                message = str(e).lower()
+                if signed_hash and any(error in message for error in KNOWN_TX_ERRORS):
+                    # The node holds this exact signed transaction, from an earlier attempt
+                    self._accepted(tx, signed_hash, nonce, gas_price, replacing)
+                    return
+                if replacing and "nonce too low" in message:
+                    # The original (or an earlier replacement) was mined meanwhile
+                    return
+                if not replacing and any(error in message for error in NONCE_ERRORS):
+                    self.nonces.resync()
+                if "underpriced" in message or "fee too low" in message:
+                    self.gas_prices.invalidate()
+                if attempt == self.attempts:
+                    logger.error(f"Transaction not accepted after {attempt} attempts: {e}")
+                    with self._lock:
+                        self.counters["failed"] += 1
+                    if not tx.future.done():
+                        tx.future.set_exception(e)
+                    return
+                logger.warning(f"Transaction attempt {attempt} failed, retrying: {e}")
+                with self._lock:
+                    self.counters["retries"] += 1
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+                continue
+
+            self._accepted(tx, tx_hash, nonce, gas_price, replacing)
+            return
+
+    def _landed(self, attempted):
+        """The (hash, nonce, gas price) of an earlier attempt the node knows about, if any"""
+        for attempt in reversed(attempted):
+            try:
+                if self.web3.eth.get_transaction(attempt[0]):
+                    return attempt
+            except TransactionNotFound:
+                pass
+        return None
+
+    def _accepted(self, tx: TrackedTransaction, tx_hash: str, nonce: int, gas_price: int, replacing: bool):
+        if not replacing:
+            self.nonces.advance()
+        now = time.monotonic()
+        tx.nonce, tx.gas_price, tx.submitted_at = nonce, gas_price, now
+        tx.first_submitted_at = tx.first_submitted_at or now
+        tx.hashes.append(tx_hash)
+        with self._lock:
+            self._unmined[nonce] = tx
+            self.counters["replaced" if replacing else "submitted"] += 1
+            self.last_accepted_at = now
+        if not tx.future.done():
+            tx.future.set_result(tx_hash)
+
+    def _receipt_loop(self):
+        while not self._stop.wait(self.receipt_poll_seconds):
+            try:
+                self.poll_receipts()
+            except Exception as e:
+                logger.error(f"Receipt polling failed: {e}", exc_info=True)
+
+    def poll_receipts(self):
+        """Record receipts of mined transactions and queue replacements of stuck ones"""
+        with self._lock:
+            unmined = list(self._unmined.values())
+        for tx in unmined:
+            receipt, mined_hash = None, None
+            for tx_hash in reversed(tx.hashes):
+                try:
+                    receipt = self.web3.eth.get_transaction_receipt(tx_hash)
+                except Exception:
+                    # TransactionNotFound while pending
+                    receipt = None
+                if receipt:
+                    mined_hash = tx_hash
+                    break
+
+            if receipt:
+                self._finish(tx, mined_hash, receipt)
+            elif (time.monotonic() - tx.submitted_at > self.receipt_timeout_seconds
+                  and tx.replacements < TX_MAX_REPLACEMENTS):
+                logger.warning(f"Transaction {tx.hashes[-1]} unmined after {self.receipt_timeout_seconds}s, "
+                               f"re-sending nonce {tx.nonce} with a higher gas price")
+                tx.replacements += 1
+                tx.submitted_at = time.monotonic()
+                self._queue.put(tx)
+
+    def _finish(self, tx: TrackedTransaction, mined_hash: str, receipt):
+        status = TX_MINED if receipt.get("status", 1) == 1 else TX_REVERTED
+        info = {
+            "tx_hash": tx.hashes[0],
+            "mined_tx_hash": mined_hash,
+            "status": status,
+            "block_number": receipt.get("blockNumber"),
+            "gas_used": receipt.get("gasUsed"),
+            "seconds_to_mine": round(time.monotonic() - tx.first_submitted_at, 1),
+        }
+        with self._lock:
+            self._unmined.pop(tx.nonce, None)
+            self.receipts[tx.hashes[0]] = info
+            while len(self.receipts) > TX_RECEIPT_HISTORY:
+                self.receipts.popitem(last=False)
+            self.counters[status] += 1
+            self.last_mined_at = time.monotonic()
+        if status == TX_REVERTED:
+            logger.error(f"Transaction {mined_hash} reverted in block {info['block_number']}")
+        if self.on_mined is not None:
+            try:
+                self.on_mined(tx.hashes[0], mined_hash, info)
+            except Exception as e:
+                logger.error(f"Receipt callback for {mined_hash} failed: {e}")
+
+    def receipt(self, tx_hash: str) -> Dict[str, Any]:
+        """Receipt status of a transaction sent by this submitter (by its original hash)"""
+        with self._lock:
+            if tx_hash in self.receipts:
+                return self.receipts[tx_hash]
+            if any(tx.hashes and tx.hashes[0] == tx_hash for tx in self._unmined.values()):
+                return {"tx_hash": tx_hash, "status": TX_PENDING}
+        return {"tx_hash": tx_hash, "status": "unknown"}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"queued": self._queue.qsize(), "unmined": len(self._unmined),
+                    "nonce_resyncs": self.nonces.resyncs, "gas_price_fetches": self.gas_prices.fetches,
+                    **self.counters}
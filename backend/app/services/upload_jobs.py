@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import UploadJob
+
+logger = logging.getLogger(__name__)
+
+# Uploads processed concurrently; the rest wait in the pool's queue
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+
+# Jobs accepted but not yet finished before uploads are refused with 503
+UPLOAD_MAX_PENDING = int(os.getenv("UPLOAD_MAX_PENDING", "100"))
+
+# Attempts per stage, with exponential backoff between them
+UPLOAD_STAGE_ATTEMPTS = int(os.getenv("UPLOAD_STAGE_ATTEMPTS", "3"))
+UPLOAD_RETRY_BACKOFF_SECONDS = float(os.getenv("UPLOAD_RETRY_BACKOFF_SECONDS", "1.0"))
+
+# A queued or running job not touched for this long belongs to a process that
+# died (live workers touch their jobs every third of it) and is resumed
+UPLOAD_JOB_STALE_SECONDS = float(os.getenv("UPLOAD_JOB_STALE_SECONDS", "300"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+STAGE_PENDING = "pending"
+STAGE_RUNNING = "running"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+STAGE_SKIPPED = "skipped"
+
+
+class JobStage(NamedTuple):
+    """One step of the pipeline.
+
+    ``run(db, context)`` gets the job's inputs plus the outputs of earlier
+    stages and returns a dict of outputs to add (``"skipped": True`` marks
+    the stage skipped). A failing ``required`` stage fails the job after its
+    last attempt; an optional one is marked failed and the job carries on.
+    """
+    name: str
+    run: Callable[[Session, Dict[str, Any]], Optional[Dict[str, Any]]]
+    required: bool = True
+
+
+class UploadQueueFull(Exception):
+    """Raised when UPLOAD_MAX_PENDING jobs are already waiting"""
+
+
+def job_status(job: UploadJob) -> Dict[str, Any]:
+    """JSON view of a job for the status endpoint"""
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "filename": job.filename,
+        "record_id": job.record_id,
+        "stages": json.loads(job.stages or "{}"),
+        "result": json.loads(job.result or "{}"),
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+class UploadJobPipeline:
+    """Runs upload jobs through their stages on a bounded thread pool.
+
+    Job state (per-stage status, attempts and timing) is written to the
+    upload_jobs table after every transition, so any worker can answer a
+    status request. Jobs outlive the process: a monitor thread keeps this
+    process's jobs touched and resumes queued or running jobs nobody has
+    touched for ``stale_seconds``, i.e. jobs of a process that died. A
+    resumed job runs every stage again, so stages must be idempotent; the
+    context carries the job's ``record_id`` if one was already stored.
+    """
+
+    def __init__(self, stages: Sequence[JobStage], session_factory: Callable[[], Session] = SessionLocal,
+                 workers: int = UPLOAD_WORKERS, max_pending: int = UPLOAD_MAX_PENDING,
+                 attempts: int = UPLOAD_STAGE_ATTEMPTS, backoff_seconds: float = UPLOAD_RETRY_BACKOFF_SECONDS,
+                 on_finish: Optional[Callable[[UploadJob], None]] = None,
+                 stale_seconds: float = UPLOAD_JOB_STALE_SECONDS):
+        self.stages = list(stages)
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+        self.attempts = max(1, attempts)
+        self.backoff_seconds = backoff_seconds
+        self.on_finish = on_finish
+        self.stale_seconds = stale_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="upload-job")
+        self._lock = threading.Lock()
+        self._active = set()  # Ids of the jobs this process has queued or is running
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+        self.pending = 0
+        self.counters = {JOB_SUCCEEDED: 0, JOB_FAILED: 0, "retries": 0, "resumed": 0}
+
+    def start(self):
+        """Resume abandoned jobs now and keep watching for them on a daemon thread (idempotent)"""
+        with self._lock:
+            if self._monitor is None:
+                self._stop.clear()
+                self._monitor = threading.Thread(target=self._monitor_loop, name="upload-job-monitor", daemon=True)
+                self._monitor.start()
+
+    def stop(self):
+        with self._lock:
+            monitor, self._monitor = self._monitor, None
+        if monitor is not None:
+            self._stop.set()
+            monitor.join()
+
+    def _monitor_loop(self):
+        while True:
+            try:
+                self.touch_active()
+                self.resume_stale()
+            except Exception as e:
+                logger.error(f"Upload job monitor failed: {e}", exc_info=True)
+            if self._stop.wait(self.stale_seconds / 3):
+                return
+
+    def touch_active(self):
+        """Mark this process's jobs alive, so no other process resumes them mid-stage"""
+        with self._lock:
+            active = list(self._active)
+        if not active:
+            return
+        db = self.session_factory()
+        try:
+            db.query(UploadJob).filter(UploadJob.id.in_(active),
+                                       UploadJob.status.in_((JOB_QUEUED, JOB_RUNNING))).update(
+                {UploadJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def resume_stale(self) -> int:
+        """Queue again the unfinished jobs nobody has touched for stale_seconds; returns how many"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        db = self.session_factory()
+        resumed = []
+        try:
+            stale = (db.query(UploadJob.id, UploadJob.updated_at)
+                     .filter(UploadJob.status.in_((JOB_QUEUED, JOB_RUNNING)), UploadJob.updated_at < cutoff)
+                     .order_by(UploadJob.created_at)
+                     .all())
+            for job_id, updated_at in stale:
+                # Claim by compare-and-set, so only one process resumes each job
+                claimed = db.query(UploadJob).filter(UploadJob.id == job_id, UploadJob.updated_at == updated_at).update(
+                    {UploadJob.status: JOB_QUEUED, UploadJob.updated_at: datetime.utcnow()},
+                    synchronize_session=False)
+                db.commit()
+                if claimed:
+                    resumed.append(job_id)
+        finally:
+            db.close()
+
+        for job_id in resumed:
+            logger.warning(f"Resuming upload job {job_id} abandoned by a previous process")
+            # Already accepted, so max_pending does not apply
+            with self._lock:
+                self.pending += 1
+                self.counters["resumed"] += 1
+            self._queue(job_id)
+        return len(resumed)
+
+    def _queue(self, job_id: str):
+        """Hand a job to the worker pool; the caller has counted it as pending"""
+        with self._lock:
+            self._active.add(job_id)
+        self._executor.submit(self._run, job_id)
+
+    def submit(self, db: Session, job: UploadJob) -> UploadJob:
+        """Persist a new job and queue it; raises UploadQueueFull when the backlog is at its limit"""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise UploadQueueFull(f"{self.pending} uploads are already being processed")
+            self.pending += 1
+
+        try:
+            job.status = JOB_QUEUED
+            job.stages = json.dumps({stage.name: {"status": STAGE_PENDING, "attempts": 0} for stage in self.stages})
+            job.result = json.dumps({})
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            self._queue(job.id)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        return job
+
+    def _save(self, db: Session, job: UploadJob, stages: Dict[str, Any], result: Dict[str, Any]):
+        job.stages = json.dumps(stages)
+        job.result = json.dumps(result, default=str)
+        job.updated_at = datetime.utcnow()
+        db.commit()
+
+    def _run(self, job_id: str):
+        db = self.session_factory()
+        job = None
+        try:
+            job = db.query(UploadJob).filter(UploadJob.id == job_id).first()
+            if job is None:
+                logger.error(f"Upload job {job_id} disappeared before it ran")
+                return
+
+            stages = json.loads(job.stages)
+            result = json.loads(job.result or "{}")
+            # record_id is set when a resumed job already stored its record
+            context = {"job_id": job.id, "username": job.username, "patient_id": job.patient_id,
+                       "filename": job.filename, "file_path": job.file_path,
+                       "content_sha256": job.content_sha256, "record_id": job.record_id, **result}
+            job.status = JOB_RUNNING
+            job.error = None
+            self._save(db, job, stages, result)
+
+            for stage in self.stages:
+                outputs = self._run_stage(db, job, stage, stages, result, context)
+                if outputs is None and stage.required:
+                    job.status = JOB_FAILED
+                    job.error = f"{stage.name}: {stages[stage.name]['error']}"
+                    self._save(db, job, stages, result)
+                    return
+
+            job.status = JOB_SUCCEEDED
+            job.record_id = context.get("record_id")
+            self._save(db, job, stages, result)
+        except Exception as e:
+            logger.error(f"Upload job {job_id} crashed: {e}", exc_info=True)
+            if job is not None:
+                db.rollback()
+                job.status = JOB_FAILED
+                job.error = str(e)
+                db.commit()
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self._active.discard(job_id)
+                if job is not None and job.status in (JOB_SUCCEEDED, JOB_FAILED):
+                    self.counters[job.status] += 1
+            if job is not None and self.on_finish is not None:
+                try:
+                    self.on_finish(job)
+                except Exception as e:
+                    logger.error(f"Upload job {job_id} cleanup failed: {e}")
+            db.close()
+
+    def _run_stage(self, db: Session, job: UploadJob, stage: JobStage, stages: Dict[str, Any],
+                   result: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Run one stage with retries; returns its outputs, or None once every attempt has failed"""
+        state = stages[stage.name]
+        state["status"] = STAGE_RUNNING
+        state["started_at"] = datetime.utcnow().isoformat()
+        started = time.perf_counter()
+
+        for attempt in range(1, self.attempts + 1):
+            state["attempts"] = attempt
+            self._save(db, job, stages, result)
+            try:
+                outputs = stage.run(db, context) or {}
+                break
+            except Exception as e:
+                db.rollback()
+                state["error"] = str(e)
+                logger.warning(f"Upload job {job.id} stage {stage.name} attempt {attempt} failed: {e}")
+                if attempt == self.attempts:
+                    state["status"] = STAGE_FAILED
+                    state["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    self._save(db, job, stages, result)
+                    return None
+                with self._lock:
+                    self.counters["retries"] += 1
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+        state["status"] = STAGE_SKIPPED if outputs.pop("skipped", False) else STAGE_DONE
+        state["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        state.pop("error", None)
+        context.update(outputs)
+        # Keys starting with "_" (e.g. the extracted text) are handed to later stages but not persisted
+        result.update({key: value for key, value in outputs.items() if not key.startswith("_")})
+        if "record_id" in outputs:
+            job.record_id = outputs["record_id"]
+        self._save(db, job, stages, result)
+        return outputs
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"pending": self.pending, "max_pending": self.max_pending, **self.counters}
@@ -0,0 +1,187 @@
+import codecs
+import hashlib
+import os
+from typing import Callable, Dict, NamedTuple, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Request body allowance on top of the file itself (boundaries, part headers, form fields)
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Largest accepted non-file form field
+MAX_FIELD_SIZE = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """The upload cannot be accepted; carries the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class UploadTooLarge(UploadRejected):
+    def __init__(self, max_size: int):
+        super().__init__(413, f"File too large. Maximum size is {max_size // (1024 * 1024)}MB")
+
+
+class StreamedUpload(NamedTuple):
+    fields: Dict[str, str]
+    filename: Optional[str]
+    file_path: Optional[str]
+    size: int
+    content_sha256: Optional[str]
+
+
+class _UploadReceiver:
+    """multipart callbacks writing the file part straight to its final path.
+
+    Form fields are kept in memory (bounded by MAX_FIELD_SIZE); the one file
+    part is hashed and written chunk by chunk as it arrives, and the size
+    limit is checked on every chunk rather than after the body is spooled.
+    """
+
+    def __init__(self, file_field: str, path_for: Callable[[str], str], max_file_size: int, charset: str):
+        self.file_field = file_field
+        self.path_for = path_for
+        self.max_file_size = max_file_size
+        self.charset = charset
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_path: Optional[str] = None
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self._file = None
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._name = ""
+        self._data = bytearray()
+        self._in_file = False
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._data = bytearray()
+        self._in_file = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise UploadRejected(400, 'The Content-Disposition header field "name" must be provided.')
+        self._name = options[b"name"].decode(self.charset, errors="replace")
+        if b"filename" not in options:
+            return
+        if self._name != self.file_field or self._file is not None:
+            raise UploadRejected(400, f"Only one file, in the '{self.file_field}' field, may be uploaded")
+
+        # Opened before any file data arrives; path_for rejects unsupported names
+        self.filename = os.path.basename(options[b"filename"].decode(self.charset, errors="replace"))
+        self.file_path = self.path_for(self.filename)
+        self._file = open(self.file_path, "wb")
+        self._in_file = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if not self._in_file:
+            if len(self._data) + end - start > MAX_FIELD_SIZE:
+                raise UploadRejected(400, f"Form field '{self._name}' is too large")
+            self._data += data[start:end]
+            return
+        self.size += end - start
+        if self.size > self.max_file_size:
+            raise UploadTooLarge(self.max_file_size)
+        chunk = memoryview(data)[start:end]
+        self.digest.update(chunk)
+        self._file.write(chunk)
+
+    def on_part_end(self):
+        if not self._in_file:
+            self.fields[self._name] = self._data.decode(self.charset, errors="replace")
+
+    def finish(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            if os.path.exists(self.file_path):
+                os.remove(self.file_path)
+
+
+async def receive_upload(request: Request, file_field: str, path_for: Callable[[str], str],
+                         max_file_size: int) -> StreamedUpload:
+    """Parse a multipart upload as it streams in, writing its file once to ``path_for(filename)``.
+
+    Nothing is spooled: the body is hashed and written as each chunk arrives,
+    and an oversized upload is refused from its Content-Length or, failing
+    that, as soon as the file part passes ``max_file_size``. A rejected
+    upload leaves no file behind. Parsing, hashing, the file writes and the
+    final fsync run on the thread pool, one chunk at a time, so concurrent
+    uploads never block the event loop on disk I/O.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_file_size + MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLarge(max_file_size)
+
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    if b"boundary" not in params:
+        raise UploadRejected(400, "Expected a multipart/form-data request")
+    try:
+        charset = codecs.lookup(params.get(b"charset", b"utf-8").decode("latin-1")).name
+    except LookupError:
+        charset = "latin-1"
+
+    receiver = _UploadReceiver(file_field, path_for, max_file_size, charset)
+    parser = MultipartParser(params[b"boundary"], receiver.callbacks())
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(parser.write, chunk)
+        parser.finalize()
+        await run_in_threadpool(receiver.finish)
+    except UploadRejected:
+        await run_in_threadpool(receiver.abort)
+        raise
+    except Exception as e:
+        await run_in_threadpool(receiver.abort)
+        raise UploadRejected(400, f"Malformed upload: {e}")
+
+    return StreamedUpload(
+        fields=receiver.fields,
+        filename=receiver.filename,
+        file_path=receiver.file_path,
+        size=receiver.size,
+        content_sha256=receiver.digest.hexdigest() if receiver.file_path else None,
+    )
@@ -0,0 +1,60 @@
+"""Compare sklearn's predict_proba with the flat forest engine.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_forest_engine --model models/disease_model.pkl
+"""
+import argparse
+import time
+
+import joblib
+import numpy as np
+
+from app.services.forest_engine import FlatForest
+
+BATCH_SIZES = (1, 32, 1024)
+
+
+def time_call(fn, X, repeats: int) -> float:
+    """Median wall-clock milliseconds of fn(X)"""
+    fn(X)  # warm up
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(X)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="models/disease_model.pkl")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--density", type=float, default=0.03, help="fraction of symptoms present per row")
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    started = time.perf_counter()
+    forest = FlatForest.from_sklearn(model)
+    print(f"Flattened {forest.n_estimators} trees / {forest.n_nodes} nodes "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    rng = np.random.default_rng(0)
+    X = (rng.random((max(BATCH_SIZES), model.n_features_in_)) < args.density).astype(np.float64)
+
+    max_error = np.abs(forest.predict_proba(X) - model.predict_proba(X)).max()
+    print(f"Max |flat - sklearn| probability difference: {max_error:.3g}")
+    if max_error > args.tolerance:
+        raise SystemExit(f"❌ Flat forest differs from sklearn by more than {args.tolerance}")
+
+    print(f"{'batch':>6} {'sklearn ms':>12} {'flat ms':>10} {'speedup':>8}")
+    for batch_size in BATCH_SIZES:
+        batch = X[:batch_size]
+        sklearn_ms = time_call(model.predict_proba, batch, args.repeats)
+        flat_ms = time_call(forest.predict_proba, batch, args.repeats)
+        print(f"{batch_size:>6} {sklearn_ms:>12.2f} {flat_ms:>10.2f} {sklearn_ms / flat_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
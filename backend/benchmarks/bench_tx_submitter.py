@@ -0,0 +1,241 @@
+"""Concurrent anchoring transactions: per-call RPC flow vs. the single-writer submitter.
+
+Both variants send N transactions from N threads to a local mock JSON-RPC
+node that answers every call after a fixed latency and enforces nonces the
+way geth does (nonce too low, already known, underpriced replacement).
+
+"per_call" repeats the old store_hash_on_blockchain flow in every thread:
+balance, nonce, gas price, sign, send. "submitter" queues every hash on
+one TransactionSubmitter with a local nonce counter and cached gas price,
+over a pooled HTTP session.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_tx_submitter --concurrency 100
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rlp
+from eth_account import Account
+from web3 import Web3
+
+from app.services.tx_submitter import TransactionSubmitter, pooled_session
+
+CHAIN_ID = 11155111
+GAS_PRICE = 10 ** 9
+
+
+class MockNode:
+    """Just enough of an Ethereum node for data transactions from one account"""
+
+    def __init__(self, latency_seconds: float, block_seconds: float):
+        self.latency_seconds = latency_seconds
+        self.block_seconds = block_seconds
+        self.lock = threading.Lock()
+        self.mined_count = 0  # Nonces below this are mined
+        self.pool = {}  # nonce -> (tx hash, gas price)
+        self.receipts = {}
+        self.block_number = 0
+        self.calls = Counter()
+        self.errors = Counter()
+
+    def pending_count(self) -> int:
+        nonce = self.mined_count
+        while nonce in self.pool:
+            nonce += 1
+        return nonce
+
+    def mine(self):
+        with self.lock:
+            self.block_number += 1
+            while self.mined_count in self.pool:
+                tx_hash, _ = self.pool.pop(self.mined_count)
+                self.receipts[tx_hash] = {"transactionHash": tx_hash, "blockNumber": hex(self.block_number),
+                                          "blockHash": "0x" + "00" * 32, "status": "0x1", "gasUsed": hex(21000),
+                                          "cumulativeGasUsed": hex(21000), "transactionIndex": "0x0",
+                                          "logs": [], "logsBloom": "0x" + "00" * 256, "from": None, "to": None,
+                                          "contractAddress": None, "effectiveGasPrice": hex(GAS_PRICE),
+                                          "type": "0x0"}
+                self.mined_count += 1
+
+    def send_raw(self, raw_hex: str) -> str:
+        raw = bytes.fromhex(raw_hex[2:])
+        fields = rlp.decode(raw)
+        nonce, gas_price = int.from_bytes(fields[0], "big"), int.from_bytes(fields[1], "big")
+        tx_hash = "0x" + hashlib.sha3_256(raw).hexdigest()
+        with self.lock:
+            if nonce < self.mined_count:
+                raise ValueError("nonce too low")
+            if nonce in self.pool:
+                known_hash, known_price = self.pool[nonce]
+                if known_hash == tx_hash:
+                    raise ValueError("already known")
+                if gas_price < known_price * 1.1:
+                    raise ValueError("replacement transaction underpriced")
+            self.pool[nonce] = (tx_hash, gas_price)
+        return tx_hash
+
+    def call(self, method: str, params):
+        self.calls[method] += 1
+        time.sleep(self.latency_seconds)
+        if method == "eth_chainId":
+            return hex(CHAIN_ID)
+        if method == "web3_clientVersion":
+            return "mock/1.0"
+        if method == "eth_blockNumber":
+            return hex(self.block_number)
+        if method == "eth_getBalance":
+            return hex(10 ** 18)
+        if method == "eth_gasPrice":
+            return hex(GAS_PRICE)
+        if method == "eth_getTransactionCount":
+            with self.lock:
+                return hex(self.pending_count() if params[1] == "pending" else self.mined_count)
+        if method == "eth_sendRawTransaction":
+            return self.send_raw(params[0])
+        if method == "eth_getTransactionReceipt":
+            with self.lock:
+                return self.receipts.get(params[0])
+        raise ValueError(f"method {method} not supported")
+
+
+def serve(node: MockNode) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            try:
+                response = {"jsonrpc": "2.0", "id": request["id"], "result": node.call(request["method"],
+                                                                                      request.get("params", []))}
+            except ValueError as e:
+                node.errors[str(e)] += 1
+                response = {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32000, "message": str(e)}}
+            body = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_miner(node: MockNode, stop: threading.Event):
+    def loop():
+        while not stop.wait(node.block_seconds):
+            node.mine()
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def per_call_store(web3: Web3, account, record_hash: str) -> str:
+    """The old store_hash_on_blockchain: four RPC round trips, nonce read fresh each time"""
+    web3.eth.get_balance(account.address)
+    nonce = web3.eth.get_transaction_count(account.address)
+    gas_price = int(web3.eth.gas_price * 1.1)
+    signed = account.sign_transaction({"to": account.address, "value": 0, "gas": 100000, "gasPrice": gas_price,
+                                       "nonce": nonce, "chainId": CHAIN_ID,
+                                       "data": web3.to_hex(text=record_hash)})
+    return web3.to_hex(web3.eth.send_raw_transaction(signed.raw_transaction))
+
+
+def run_variant(variant: str, concurrency: int, latency_seconds: float, block_seconds: float,
+                receipt_poll_seconds: float) -> dict:
+    node = MockNode(latency_seconds, block_seconds)
+    server = serve(node)
+    stop = threading.Event()
+    start_miner(node, stop)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    account = Account.create()
+    hashes = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(concurrency)]
+
+    submitter = None
+    if variant == "per_call":
+        web3 = Web3(Web3.HTTPProvider(url))
+
+        def send(record_hash):
+            return per_call_store(web3, account, record_hash)
+    else:
+        web3 = Web3(Web3.HTTPProvider(url, session=pooled_session()))
+        submitter = TransactionSubmitter(web3, account.address, account.key, CHAIN_ID, attempts=5,
+                                         backoff_seconds=0.05, receipt_poll_seconds=receipt_poll_seconds)
+
+        def send(record_hash):
+            return submitter.submit(record_hash).result()
+
+    def attempt(record_hash):
+        try:
+            return send(record_hash)
+        except Exception:
+            return None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        tx_hashes = list(pool.map(attempt, hashes))
+    accepted_seconds = time.perf_counter() - started
+    accepted = [tx_hash for tx_hash in tx_hashes if tx_hash]
+
+    # Accepted transactions that a later one replaced never get mined
+    deadline = time.monotonic() + 10 * block_seconds + 5
+    while time.monotonic() < deadline:
+        with node.lock:
+            mined = sum(tx_hash in node.receipts for tx_hash in accepted)
+            pool_empty = not node.pool
+        if pool_empty:
+            break
+        time.sleep(block_seconds / 4)
+    if submitter is not None:
+        time.sleep(receipt_poll_seconds * 2)
+        submitter.stop()
+    stop.set()
+    server.shutdown()
+
+    return {
+        "accepted": len(accepted),
+        "mined": mined,
+        "accept_seconds": accepted_seconds,
+        "tx_per_s": len(accepted) / accepted_seconds,
+        "rpc_calls": sum(node.calls.values()),
+        "node_errors": dict(node.errors),
+        "receipts_tracked": submitter.stats()["mined"] if submitter is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=100, help="concurrent uploads, one transaction each")
+    parser.add_argument("--latency-ms", type=float, default=20, help="mock RPC round-trip latency")
+    parser.add_argument("--block-seconds", type=float, default=1.0)
+    parser.add_argument("--receipt-poll-seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} concurrent transactions, {args.latency_ms:g} ms RPC latency, "
+          f"{args.block_seconds:g} s blocks")
+    for variant in ("per_call", "submitter"):
+        result = run_variant(variant, args.concurrency, args.latency_ms / 1000, args.block_seconds,
+                             args.receipt_poll_seconds)
+        print(f"{variant:>10}: {result['accepted']}/{args.concurrency} accepted, {result['mined']} mined, "
+              f"{result['accept_seconds']:.2f} s ({result['tx_per_s']:.1f} tx/s), "
+              f"{result['rpc_calls']} RPC calls")
+        if result["node_errors"]:
+            print(f"{'':>12}node errors: {result['node_errors']}")
+        if result["receipts_tracked"] is not None:
+            print(f"{'':>12}receipts tracked: {result['receipts_tracked']}")
+
+
+if __name__ == "__main__":
+    main()
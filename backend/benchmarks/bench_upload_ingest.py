@@ -0,0 +1,138 @@
+"""Compare spooled and streaming ingestion of a large upload.
+
+"spooled" is the old /upload path: Starlette parses the form into a
+SpooledTemporaryFile, the size is found by seeking to its end, and the file
+is then copied (and hashed) into the temp directory. "streaming" is
+receive_upload, which hashes and writes each chunk as it arrives. Each
+variant runs in its own process so peak RSS is its own; the request body is
+generated chunk by chunk and never held in memory.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_upload_ingest --size-mb 50
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from starlette.requests import Request
+
+from app.services.upload_stream import UploadRejected, receive_upload
+
+BOUNDARY = "----medchain-bench"
+VARIANTS = ("spooled", "streaming")
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def request_for(size: int, chunk_size: int, send_length: bool) -> Request:
+    """A multipart upload of `size` file bytes, delivered to the app in `chunk_size` pieces"""
+    head = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"username\"\r\n\r\nbench\r\n"
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.pdf\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode()
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+    block = os.urandom(chunk_size)
+
+    def pieces():
+        yield head
+        remaining = size
+        while remaining:
+            n = min(chunk_size, remaining)
+            yield block[:n]
+            remaining -= n
+        yield tail
+
+    body = pieces()
+
+    async def receive():
+        piece = next(body, None)
+        if piece is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": piece, "more_body": True}
+
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if send_length:
+        headers.append((b"content-length", str(len(head) + size + len(tail)).encode()))
+    return Request({"type": "http", "method": "POST", "path": "/upload", "headers": headers}, receive)
+
+
+async def spooled(request: Request, directory: str, max_size: int):
+    form = await request.form()
+    file = form["file"]
+    file.file.seek(0, 2)
+    size = file.file.tell()
+    file.file.seek(0)
+    if size > max_size:
+        raise UploadRejected(413, "File too large")
+    digest = hashlib.sha256()
+    with open(os.path.join(directory, file.filename), "wb") as buffer:
+        # Second pass over the spooled upload to copy and hash it
+        for chunk in iter(lambda: file.file.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            buffer.write(chunk)
+        buffer.flush()
+        os.fsync(buffer.fileno())
+    await form.close()
+    return digest.hexdigest()
+
+
+async def streaming(request: Request, directory: str, max_size: int):
+    upload = await receive_upload(request, "file", lambda name: os.path.join(directory, name), max_size)
+    return upload.content_sha256
+
+
+def run_variant(variant: str, size: int, chunk_size: int, max_size: int, send_length: bool) -> dict:
+    ingest = spooled if variant == "spooled" else streaming
+    with tempfile.TemporaryDirectory() as directory:
+        request = request_for(size, chunk_size, send_length)
+        started = time.perf_counter()
+        try:
+            asyncio.run(ingest(request, directory, max_size))
+            outcome = "accepted"
+        except UploadRejected as e:
+            outcome = f"rejected ({e.status_code})"
+        seconds = time.perf_counter() - started
+    return {
+        "outcome": outcome,
+        "seconds": seconds,
+        "mb_per_s": size / 1024 / 1024 / seconds,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=50)
+    parser.add_argument("--max-size-mb", type=float, default=50, help="upload limit (MAX_FILE_SIZE)")
+    parser.add_argument("--chunk-kb", type=int, default=64, help="size of each body chunk the server receives")
+    parser.add_argument("--no-content-length", action="store_true",
+                        help="send no Content-Length, as with a chunked request")
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    max_size = int(args.max_size_mb * 1024 * 1024)
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, size, args.chunk_kb * 1024, max_size, not args.no_content_length)))
+        return
+
+    print(f"{args.size_mb:g} MB upload, {args.max_size_mb:g} MB limit, {args.chunk_kb} KB chunks"
+          f"{', no Content-Length' if args.no_content_length else ''}")
+    print(f"{'variant':>10} {'outcome':>15} {'seconds':>8} {'MB/s':>8} {'peak RSS MB':>12}")
+    for variant in VARIANTS:
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_upload_ingest", "--variant", variant,
+                                 *sys.argv[1:]], capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{variant:>10} {result['outcome']:>15} {result['seconds']:>8.2f} {result['mb_per_s']:>8.1f} "
+              f"{result['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Sweep forest size and pruning settings against serving cost.
+
+Trains one variant per combination of tree count, max depth and pruning
+setting, and records accuracy, artifact size, load time and single-row /
+batched predict latency. The Pareto-optimal variants (no other variant is at
+least as accurate, as fast and as small) are marked, and --export writes the
+chosen one as the serving model.
+
+Run from the backend directory:
+
+    python -m benchmarks.sweep_forest --data /path/to/Training.csv \\
+        --trees 25,50,100,200 --depths none,10,20 --min-samples-leaf 1,5 --export
+"""
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from app.routes.train import StageTimer, add_artifact_arguments, build_features, save_artifacts, train_forest
+from app.services.forest_engine import INFERENCE_ENGINE, INFERENCE_ENGINES, FlatForest
+from app.services.model_registry import publish_version
+from benchmarks.bench_forest_engine import time_call
+
+BATCH_SIZE = 64
+
+
+def int_list(value: str):
+    """Comma-separated ints; "none" means unlimited"""
+    return [None if item.strip().lower() == "none" else int(item) for item in value.split(",")]
+
+
+def float_list(value: str):
+    return [float(item) for item in value.split(",")]
+
+
+def directory_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def measure_variant(model, engine: str, X_test, y_test, repeats: int) -> dict:
+    """Accuracy, on-disk size, load time and predict latency of one trained forest"""
+    with tempfile.TemporaryDirectory() as scratch:
+        if engine == "flat":
+            path = os.path.join(scratch, "disease_forest")
+            FlatForest.from_sklearn(model).save(path)
+            load = lambda: FlatForest.load(path, mmap_mode=None)  # noqa: E731
+        else:
+            path = os.path.join(scratch, "disease_model.pkl")
+            joblib.dump(model, path)
+            load = lambda: joblib.load(path)  # noqa: E731
+
+        started = time.perf_counter()
+        predictor = load()
+        load_ms = (time.perf_counter() - started) * 1000
+        size_bytes = directory_size(path)
+
+    dense = X_test.toarray()
+    batch = dense[np.arange(BATCH_SIZE) % len(dense)]
+    return {
+        "accuracy": float(np.mean(predictor.predict(dense) == y_test)),
+        "n_nodes": int(sum(tree.tree_.node_count for tree in model.estimators_)),
+        "size_mb": size_bytes / 1024 / 1024,
+        "load_ms": load_ms,
+        "single_ms": time_call(predictor.predict_proba, dense[:1], repeats),
+        f"batch{BATCH_SIZE}_ms": time_call(predictor.predict_proba, batch, repeats),
+    }
+
+
+def pareto_front(results):
+    """Indices of variants that no other variant beats on accuracy, latency and size at once"""
+    def dominates(a, b):
+        at_least = a["accuracy"] >= b["accuracy"] and a["single_ms"] <= b["single_ms"] and a["size_mb"] <= b["size_mb"]
+        strictly = a["accuracy"] > b["accuracy"] or a["single_ms"] < b["single_ms"] or a["size_mb"] < b["size_mb"]
+        return at_least and strictly
+
+    return [i for i, result in enumerate(results)
+            if not any(dominates(other, result) for j, other in enumerate(results) if j != i)]
+
+
+def choose_variant(results, front, max_accuracy_drop: float, latency_slack: float) -> int:
+    """Smallest Pareto variant that is within max_accuracy_drop of the most accurate one
+    and within latency_slack of the fastest such variant"""
+    best_accuracy = max(results[i]["accuracy"] for i in front)
+    eligible = [i for i in front if results[i]["accuracy"] >= best_accuracy - max_accuracy_drop]
+    fastest_ms = min(results[i]["single_ms"] for i in eligible)
+    # Latencies this close are within timing noise; prefer the smaller artifact
+    fast = [i for i in eligible if results[i]["single_ms"] <= fastest_ms * (1 + latency_slack)]
+    return min(fast, key=lambda i: (results[i]["size_mb"], results[i]["single_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_artifact_arguments(parser)
+    parser.add_argument("--trees", type=int_list, default=[25, 50, 100, 200])
+    parser.add_argument("--depths", type=int_list, default=[None, 20, 10])
+    parser.add_argument("--min-samples-leaf", type=int_list, default=[1, 5])
+    parser.add_argument("--ccp-alphas", type=float_list, default=[0.0])
+    parser.add_argument("--engine", choices=INFERENCE_ENGINES, default=INFERENCE_ENGINE,
+                        help="predictor whose size and latency are measured")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.005,
+                        help="accuracy the exported variant may give up for speed")
+    parser.add_argument("--latency-slack", type=float, default=0.1,
+                        help="relative single-row latency treated as a tie when picking the smallest variant")
+    parser.add_argument("--report", default="sweep_report.json")
+    parser.add_argument("--export", action="store_true", help="write the chosen variant's artifacts to --out")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data)
+    X, y, vectorizer, encoding_config, label_encoder = build_features(df, args.encoding, args.idf)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    grid = list(itertools.product(args.trees, args.depths, args.min_samples_leaf, args.ccp_alphas))
+    results, models = [], []
+    for n_estimators, max_depth, min_samples_leaf, ccp_alpha in grid:
+        model = train_forest(X_train, y_train, n_estimators, max_depth, min_samples_leaf, ccp_alpha, args.n_jobs)
+        # Latency is measured single-threaded, the way a serving worker runs it
+        model.set_params(n_jobs=None)
+        result = {"n_estimators": n_estimators, "max_depth": max_depth,
+                  "min_samples_leaf": min_samples_leaf, "ccp_alpha": ccp_alpha}
+        result.update(measure_variant(model, args.engine, X_test, y_test, args.repeats))
+        results.append(result)
+        models.append(model)
+
+    front = pareto_front(results)
+    chosen = choose_variant(results, front, args.max_accuracy_drop, args.latency_slack)
+    for i, result in enumerate(results):
+        result["pareto"] = i in front
+        result["chosen"] = i == chosen
+
+    print(f"{'trees':>6} {'depth':>6} {'leaf':>5} {'ccp':>7} {'acc':>7} {'nodes':>8} {'MB':>7} "
+          f"{'load ms':>8} {'1-row ms':>9} {f'{BATCH_SIZE}-row ms':>9}")
+    for result in results:
+        marker = "★" if result["chosen"] else ("•" if result["pareto"] else " ")
+        print(f"{result['n_estimators']:>6} {str(result['max_depth']):>6} {result['min_samples_leaf']:>5} "
+              f"{result['ccp_alpha']:>7.4f} {result['accuracy']:>7.4f} {result['n_nodes']:>8} "
+              f"{result['size_mb']:>7.2f} {result['load_ms']:>8.1f} {result['single_ms']:>9.2f} "
+              f"{result[f'batch{BATCH_SIZE}_ms']:>9.2f} {marker}")
+    print("• Pareto-optimal   ★ chosen for export")
+
+    with open(args.report, "w") as f:
+        json.dump({"engine": args.engine, "encoding": args.encoding, "variants": results}, f, indent=2)
+    print(f"Report written to {args.report}")
+
+    if args.export:
+        timer = StageTimer()
+        best = results[chosen]
+        save_artifacts(args.out, models[chosen], vectorizer, encoding_config, label_encoder, X_train, X_test, timer,
+                       args.background_size, args.shap_check_rows, args.n_jobs)
+        if args.publish:
+            publish_version(args.out, args.publish,
+                            metadata={"encoding": args.encoding, **{key: best[key] for key in (
+                                "n_estimators", "max_depth", "min_samples_leaf", "ccp_alpha", "accuracy")}})
+        timer.report()
+        print(f"✅ Exported {best['n_estimators']} trees (max_depth={best['max_depth']}, "
+              f"min_samples_leaf={best['min_samples_leaf']}) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
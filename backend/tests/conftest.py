@@ -0,0 +1,107 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Module-level settings are read at import time, so point them at a scratch
+# directory before any app module is imported
+TEST_DIR = tempfile.mkdtemp(prefix="medchain-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}")
+os.environ.setdefault("MODEL_REGISTRY_DIR", os.path.join(TEST_DIR, "registry"))
+os.environ.setdefault("MODEL_VERSION", "test")
+os.environ.setdefault("MODEL_REGISTRY_POLL_SECONDS", "0")
+
+# Symptoms of each synthetic disease; rows are random subsets of them
+DISEASE_SYMPTOMS = {
+    "Allergy": ["continuous_sneezing", "shivering", "chills", "watering_from_eyes"],
+    "Fungal infection": ["itching", "skin_rash", "nodal_skin_eruptions", "dischromic _patches"],
+    "GERD": ["stomach_pain", "acidity", "ulcers_on_tongue", "vomiting", "cough", "chest_pain"],
+    "Common Cold": ["continuous_sneezing", "chills", "fatigue", "cough", "high_fever", "headache"],
+    "Migraine": ["acidity", "indigestion", "headache", "blurred_and_distorted_vision", "depression"],
+}
+
+
+def training_frame(rows_per_disease: int = 40, seed: int = 0) -> pd.DataFrame:
+    from app.services.symptom_features import load_symptom_vocabulary
+
+    vocabulary = load_symptom_vocabulary()
+    columns = sorted(vocabulary, key=vocabulary.get)
+    rng = np.random.default_rng(seed)
+    records = []
+    for disease, symptoms in DISEASE_SYMPTOMS.items():
+        for _ in range(rows_per_disease):
+            present = rng.choice(symptoms, size=rng.integers(2, len(symptoms) + 1), replace=False)
+            record = dict.fromkeys(columns, 0)
+            record.update(dict.fromkeys(present, 1))
+            record["prognosis"] = disease
+            records.append(record)
+    return pd.DataFrame.from_records(records)
+
+
+def write_pdf(path, pages) -> str:
+    """Minimal PDF with one Helvetica text line per page; an empty string gives a page without a text layer"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        stream = f"BT /F1 12 Tf 72 720 Td ({escaped}) Tj ET" if text else ""
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    body, offsets = b"%PDF-1.4\n", []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{content}\nendobj\n".encode()
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(body)
+    return str(path)
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    return lambda pages, name="record.pdf": write_pdf(tmp_path / name, pages)
+
+
+@pytest.fixture(scope="session")
+def trained_model_dir():
+    """A small forest trained by train.py and published as registry version "test" """
+    from app.routes import train
+
+    data = os.path.join(TEST_DIR, "Training.csv")
+    out = os.path.join(TEST_DIR, "trained")
+    training_frame().to_csv(data, index=False)
+    train.main(["--data", data, "--out", out, "--encoding", "multihot", "--n-estimators", "12",
+                "--background-size", "20", "--shap-check-rows", "0", "--n-jobs", "1",
+                "--publish", os.environ["MODEL_VERSION"]])
+    return out
+
+
+@pytest.fixture(scope="session")
+def ai_insights(trained_model_dir):
+    from app.routes import ai_insights
+
+    return ai_insights
+
+
+@pytest.fixture
+def db():
+    from app.database import Base, SessionLocal, engine
+    import app.models  # noqa: F401  (registers the tables)
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,80 @@
+import asyncio
+import math
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+SYMPTOM_LISTS = [
+    ["itching", "skin_rash"],
+    ["continuous_sneezing", "shivering", "chills"],
+    ["stomach_pain", "acidity", "vomiting"],
+    ["headache", "acidity", "indigestion"],
+    ["high_fever", "cough", "fatigue"],
+    ["chills", "cough"],
+    ["itching"],
+    ["unknown symptom"],
+]
+
+
+def test_batch_rows_match_single_predictions(ai_insights):
+    bundle = ai_insights.model_registry.current
+    for explain in ("full", "fast"):
+        batch = ai_insights.predict_rows(bundle, SYMPTOM_LISTS, explain)
+        singles = [ai_insights.predict_rows(bundle, [symptoms], explain)[0] for symptoms in SYMPTOM_LISTS]
+        assert batch == singles
+        assert all(result["explanation_method"] for result in batch)
+
+
+def test_batch_endpoint_matches_single_endpoint(ai_insights):
+    app = FastAPI()
+    app.include_router(ai_insights.router)
+    with TestClient(app) as client:
+        batch = client.post("/predict_disease/batch", json={"symptom_lists": SYMPTOM_LISTS}).json()["results"]
+        singles = [client.post("/predict_disease/", json={"symptoms": symptoms}).json() for symptoms in SYMPTOM_LISTS]
+    assert batch == singles
+
+
+def test_cached_rows_match_uncached_predictions(ai_insights):
+    bundle = ai_insights.model_registry.current
+    symptom_lists = [["Itching", "skin_rash", "itching"], ["itching", "skin_rash"], ["skin_rash", "Itching"]]
+    expected = ai_insights.predict_rows(bundle, symptom_lists)
+    ai_insights.prediction_cache.clear()
+
+    # The second call is served from the cache, the third mixes cached and fresh rows
+    assert asyncio.run(ai_insights.cached_predict_rows(symptom_lists)) == expected
+    assert asyncio.run(ai_insights.cached_predict_rows(symptom_lists)) == expected
+    assert asyncio.run(ai_insights.cached_predict_rows(symptom_lists[1:] + [["Chills"]]))[:2] == expected[1:]
+
+
+def test_bad_row_fails_only_its_request(ai_insights):
+    bundle = ai_insights.model_registry.current
+    requests = [[(bundle, "full", None, SYMPTOM_LISTS[0])], [(bundle, "full", None, None)],
+                [(bundle, "full", None, SYMPTOM_LISTS[1]), (bundle, "full", None, SYMPTOM_LISTS[2])]]
+    results = ai_insights.predict_batched_requests(requests)
+
+    assert isinstance(results[1], Exception)
+    assert results[0] == ai_insights.predict_rows(bundle, SYMPTOM_LISTS[:1])
+    assert results[2] == ai_insights.predict_rows(bundle, SYMPTOM_LISTS[1:3])
+
+
+def test_anytime_budget_sets_aside_the_explanation_time(ai_insights, monkeypatch):
+    bundle = ai_insights.model_registry.current
+    budgets = []
+    anytime_predict_proba = ai_insights.anytime_predict_proba
+
+    def recording(predictor, X, budget_ms=None):
+        budgets.append(budget_ms)
+        return anytime_predict_proba(predictor, X, budget_ms)
+
+    monkeypatch.setattr(ai_insights, "anytime_predict_proba", recording)
+    expected = bundle.explainer_service.estimated_ms(2)
+    results = ai_insights.predict_rows(bundle, SYMPTOM_LISTS[:2], "full", expected + 40)
+    assert budgets[-1] == pytest.approx(40)
+    assert all("anytime" in result for result in results)
+
+    # An explanation expected to take the whole budget leaves trees a single block
+    ai_insights.predict_rows(bundle, SYMPTOM_LISTS[:2], "full", expected / 2)
+    assert budgets[-1] == 0.0
+    ai_insights.predict_rows(bundle, SYMPTOM_LISTS[:2], "full", math.inf)
+    assert budgets[-1] is None
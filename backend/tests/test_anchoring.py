@@ -0,0 +1,70 @@
+import hashlib
+
+from app.models import AnchorBatch, MedicalRecord
+from app.services.anchoring import BATCH_ANCHORED, BATCH_FAILED, InMemoryChain, MerkleAnchorService
+
+
+def add_records(db, n):
+    hashes = {}
+    for i in range(n):
+        record = MedicalRecord(patient_name="alice", raw_data=str(i))
+        db.add(record)
+        db.commit()
+        hashes[record.id] = hashlib.sha256(str(i).encode()).hexdigest()
+    return hashes
+
+
+def enqueue(service, db, hashes):
+    for record_id, record_hash in hashes.items():
+        service.enqueue(db, record_id, record_hash)
+
+
+def test_batch_is_anchored_in_one_transaction_with_verifiable_proofs(db):
+    chain = InMemoryChain()
+    service = MerkleAnchorService(chain, max_batch_size=8)
+    hashes = add_records(db, 5)
+    enqueue(service, db, hashes)
+
+    assert service.flush_all() == 5
+    assert len(chain.transactions) == 1
+    for record_id, record_hash in hashes.items():
+        record = db.get(MedicalRecord, record_id)
+        db.refresh(record)
+        result = service.verify_record(db, record, record_hash, check_chain=True)
+        assert result["verified"] and result["status"] == BATCH_ANCHORED
+        assert not service.verify_record(db, record, "00" * 32)["verified"]
+
+
+def test_unaccepted_submission_is_not_sent_again(db):
+    chain = InMemoryChain()
+    chain.hold = True
+    service = MerkleAnchorService(chain, max_batch_size=8, accept_wait_seconds=0.01)
+    hashes = add_records(db, 3)
+    enqueue(service, db, hashes)
+
+    # The node has not accepted the transaction yet: the records stay claimed
+    assert service.flush() == 0
+    assert service.flush() == 0
+    assert len(chain.held) == 1
+    assert service.stats()["in_flight"] == 1
+
+    chain.accept_held()
+    assert service.flush() == 0
+    assert len(chain.transactions) == 1
+    assert service.stats()["records_anchored"] == 3
+    record_id, record_hash = next(iter(hashes.items()))
+    assert service.verify_record(db, db.get(MedicalRecord, record_id), record_hash, check_chain=True)["verified"]
+
+
+def test_rejected_submission_is_requeued(db):
+    chain = InMemoryChain()
+    chain.fail = True
+    service = MerkleAnchorService(chain, max_batch_size=8)
+    enqueue(service, db, add_records(db, 2))
+
+    assert service.flush() == 0
+    assert db.query(AnchorBatch).one().status == BATCH_FAILED
+    assert service.stats()["queued"] == 2
+
+    chain.fail = False
+    assert service.flush() == 2
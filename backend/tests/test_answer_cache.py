@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.services.answer_cache import MATCH_EXACT, MATCH_SIMILAR, AnswerCache, normalize_query
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_normalize_query():
+    assert normalize_query("  What is the  BP?? ") == "what is the bp"
+
+
+def test_records_sharing_a_hash_keep_their_own_answers():
+    cache = AnswerCache("v1", similarity_threshold=0.9)
+    cache.put(1, "h", "What is BP?", {"response": "record 1"}, unit(1, 0))
+    cache.put(2, "h", "What is BP?", {"response": "record 2"}, unit(1, 0))
+
+    assert cache.get(1, "h", "what is bp") == ({"response": "record 1"}, MATCH_EXACT)
+    assert cache.get(2, "h", "what is bp") == ({"response": "record 2"}, MATCH_EXACT)
+
+    cache.invalidate_record(2)
+    assert cache.get(2, "h", "what is bp") is None
+    assert cache.get_similar(1, "h", unit(1, 0.1)) == ({"response": "record 1"}, MATCH_SIMILAR)
+
+
+def test_changed_record_drops_its_answers():
+    cache = AnswerCache("v1", similarity_threshold=0.9)
+    cache.put(1, "old", "What is BP?", {"response": "120/80"}, unit(1, 0), inference_ms=500)
+    assert cache.get(1, "old", "What is BP?") is not None
+
+    assert cache.get(1, "new", "What is BP?") is None
+    assert cache.get_similar(1, "new", unit(1, 0)) is None
+    assert cache.get(1, "old", "What is BP?") is None
+
+    stats = cache.stats()
+    assert stats["size"] == 0
+    assert stats["exact_hits"] == 1
+    assert stats["saved_inference_seconds"] == 0.5
+    assert stats["invalidations"] >= 1
+
+
+def test_lru_eviction_keeps_record_index_consistent():
+    cache = AnswerCache("v1", max_size=2, similarity_threshold=0.9)
+    for record_id in range(4):
+        cache.put(record_id, "h", "q", {"response": record_id}, unit(1, 0))
+
+    assert cache.stats()["evictions"] == 2
+    assert cache.get(0, "h", "q") is None
+    assert cache.get_similar(0, "h", unit(1, 0)) is None
+    assert cache.get(3, "h", "q") == ({"response": 3}, MATCH_EXACT)
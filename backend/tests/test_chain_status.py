@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+from app.services.chain_status import BlockchainStatusMonitor
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+        self.eth = SimpleNamespace(get_balance=self._balance, block_number=1234)
+
+    def _balance(self, address):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("RPC unreachable")
+        return 2 * 10 ** 18
+
+    def is_connected(self):
+        return True
+
+    @staticmethod
+    def from_wei(value, unit):
+        return value / 10 ** 18
+
+
+def test_snapshot_never_calls_the_node_and_keeps_the_last_good_values():
+    web3 = FakeWeb3()
+    manager = SimpleNamespace(web3=web3, wallet_address="0xabc", submitter=None)
+    monitor = BlockchainStatusMonitor(manager, interval_seconds=3600, max_age_seconds=60)
+    assert monitor.snapshot()["status_stale"]
+
+    monitor.refresh()
+    for _ in range(5):
+        snapshot = monitor.snapshot()
+    assert web3.calls == 1
+    assert snapshot["blockchain_connected"] and snapshot["current_block"] == 1234
+    assert snapshot["wallet_balance"] == 2.0 and not snapshot["status_stale"]
+
+    web3.fail = True
+    monitor.refresh()
+    snapshot = monitor.snapshot()
+    assert not snapshot["blockchain_connected"] and snapshot["blockchain_error"] == "RPC unreachable"
+    assert snapshot["current_block"] == 1234 and monitor.failures == 1
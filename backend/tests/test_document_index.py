@@ -0,0 +1,50 @@
+import numpy as np
+
+from app.models import MedicalRecord, ProcessedDocument
+from app.services.document_index import (copy_record_embeddings, find_processed_document,
+                                         register_processed_document)
+from app.services.record_embeddings import load_record_embeddings, save_record_embeddings
+
+DIGEST = "ab" * 32
+
+
+def add_record(db, patient_name):
+    record = MedicalRecord(patient_name=patient_name, raw_data="{}")
+    db.add(record)
+    db.commit()
+    return record
+
+
+def test_identical_content_resolves_to_the_first_record(db):
+    first = add_record(db, "alice")
+    second = add_record(db, "alice")
+    assert find_processed_document(db, DIGEST, "alice") is None
+    assert find_processed_document(db, None, "alice") is None
+
+    register_processed_document(db, DIGEST, first.id, 1024)
+    # A concurrent duplicate loses the race and leaves the session usable
+    register_processed_document(db, DIGEST, second.id, 1024)
+
+    assert find_processed_document(db, DIGEST, "alice").id == first.id
+    assert db.query(ProcessedDocument).count() == 1
+
+
+def test_identical_content_of_another_patient_is_not_found(db):
+    register_processed_document(db, DIGEST, add_record(db, "alice").id, 1024)
+
+    assert find_processed_document(db, DIGEST, "bob") is None
+
+
+def test_copy_record_embeddings_duplicates_every_model_version(db):
+    source = add_record(db, "alice")
+    copy = add_record(db, "bob")
+    embeddings = np.eye(2, dtype=np.float16)
+    save_record_embeddings(db, source.id, ["a", "b"], embeddings, model_version="v1", pages=[1, 2])
+    save_record_embeddings(db, source.id, ["a"], embeddings[:1], model_version="v2")
+
+    assert copy_record_embeddings(db, source.id, copy.id) == 2
+
+    stored = load_record_embeddings(db, copy.id, model_version="v1")
+    assert stored.chunks == ["a", "b"] and stored.pages == [1, 2]
+    np.testing.assert_array_equal(stored.embeddings, embeddings)
+    assert load_record_embeddings(db, copy.id, model_version="v2").chunks == ["a"]
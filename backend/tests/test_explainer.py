@@ -0,0 +1,105 @@
+import math
+
+import joblib
+import numpy as np
+import pytest
+import shap
+from sklearn.ensemble import RandomForestClassifier
+
+from app.services.explainer import (METHOD_SHAP, METHOD_TABLE, METHOD_TREE_PATH, ExplainerService,
+                                    build_attribution_table, stack_class_values, tree_path_contributions)
+
+
+@pytest.fixture(scope="module")
+def forest():
+    rng = np.random.default_rng(0)
+    X = (rng.random((200, 12)) < 0.3).astype(np.float64)
+    y = (X[:, 0] + 2 * X[:, 1] + X[:, 2]).astype(int) % 3
+    return RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y), X
+
+
+def service(model, **kwargs):
+    return ExplainerService(model, explainer_path="missing.pkl", attribution_path="missing.pkl", **kwargs)
+
+
+def test_batch_explanations_match_single_rows(forest):
+    model, X = forest
+    explainer = service(model, budget_ms=math.inf, reprobe_seconds=math.inf)
+    # A budget that fits one row but not a batch of eight must not change the method (with
+    # headroom, since a call slower than the budget per row would rightly switch to tree paths)
+    explainer.budget_ms = explainer.shap_ms_per_row * 4
+    rows, classes = X[:8], model.predict(X[:8])
+
+    batch_values, batch_method = explainer.explain(rows, classes)
+    assert batch_method == METHOD_SHAP
+    for row in range(len(rows)):
+        values, method = explainer.explain(rows[row:row + 1], classes[row:row + 1])
+        assert method == batch_method
+        np.testing.assert_allclose(values[0], batch_values[row])
+
+
+def test_over_budget_uses_tree_paths_until_reprobe(forest):
+    model, X = forest
+    explainer = service(model, budget_ms=0, reprobe_seconds=math.inf)
+    classes = model.predict(X[:4])
+
+    values, method = explainer.explain(X[:4], classes)
+    assert method == METHOD_TREE_PATH
+    np.testing.assert_allclose(values, np.abs(tree_path_contributions(model, X[:4], classes)))
+
+    # SHAP is re-measured once the probe interval has passed and comes back within budget
+    explainer.budget_ms, explainer.reprobe_seconds = math.inf, 0
+    assert explainer.explain(X[:4], classes)[1] == METHOD_SHAP
+
+
+def test_slow_shap_call_falls_back_until_reprobe(forest):
+    model, X = forest
+    explainer = service(model, budget_ms=math.inf, reprobe_seconds=math.inf)
+    classes = model.predict(X[:4])
+
+    # The probe fit the budget, but a real call takes longer per row than allowed
+    explainer.budget_ms = 0
+    assert explainer.explain(X[:4], classes)[1] == METHOD_SHAP
+    assert explainer.explain(X[:4], classes)[1] == METHOD_TREE_PATH
+
+    explainer.budget_ms, explainer.reprobe_seconds = math.inf, 0
+    assert explainer.explain(X[:4], classes)[1] == METHOD_SHAP
+
+
+def test_explanation_cost_is_tracked_per_method(forest):
+    model, X = forest
+    explainer = service(model, budget_ms=0, reprobe_seconds=math.inf)
+    assert explainer.estimated_ms(4) == 0.0
+
+    explainer.explain(X[:4], model.predict(X[:4]))
+    per_row = explainer.ms_per_row[METHOD_TREE_PATH]
+    assert per_row > 0
+    assert explainer.estimated_ms(10) == 10 * per_row
+
+    # The SHAP estimate comes from the probe and applies as soon as SHAP is in budget
+    explainer.budget_ms, explainer.reprobe_seconds = math.inf, 0
+    explainer.explain(X[:1], model.predict(X[:1]))
+    assert explainer.estimated_ms(2) == 2 * explainer.ms_per_row[METHOD_SHAP]
+
+
+def test_attribution_table_is_the_mean_shap_value_where_present(forest, tmp_path):
+    model, X = forest
+    explainer = shap.TreeExplainer(model)
+    # Repeated rows are explained once and weighted by their count
+    rows = np.concatenate([X[:30], X[:10]])
+    table = build_attribution_table(explainer, rows, n_classes=3, chunk_size=7)
+
+    values = stack_class_values(explainer.shap_values(rows, check_additivity=False))
+    present = rows != 0
+    for disease in range(3):
+        for feature in range(rows.shape[1]):
+            expected = values[present[:, feature], feature, disease].mean() if present[:, feature].any() else 0
+            assert table[disease, feature] == pytest.approx(expected, abs=1e-5)
+
+    path = tmp_path / "table.pkl"
+    joblib.dump(table, path)
+    fast = ExplainerService(model, explainer_path="missing.pkl", attribution_path=str(path))
+    classes = model.predict(X[:3])
+    values, method = fast.explain(X[:3], classes, fast=True)
+    assert method == METHOD_TABLE
+    np.testing.assert_allclose(values, np.abs(table[classes] * (X[:3] != 0)))
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from sklearn.ensemble import RandomForestClassifier
+
+from app.services.explainer import tree_path_contributions
+from app.services.forest_engine import FlatForest
+
+
+@pytest.fixture(scope="module")
+def forest():
+    rng = np.random.default_rng(1)
+    X = (rng.random((300, 20)) < 0.25) * rng.random((300, 20))
+    y = (X[:, :4].sum(axis=1) * 3).astype(int) % 4
+    return RandomForestClassifier(n_estimators=15, max_depth=8, random_state=0).fit(X, y), X
+
+
+def test_flat_forest_matches_sklearn(forest):
+    model, X = forest
+    flat = FlatForest.from_sklearn(model)
+
+    np.testing.assert_allclose(flat.predict_proba(X), model.predict_proba(X))
+    np.testing.assert_allclose(flat.predict_proba(csr_matrix(X)), model.predict_proba(X))
+    np.testing.assert_array_equal(flat.predict(X), model.predict(X))
+
+    classes = model.predict(X[:20])
+    np.testing.assert_allclose(flat.path_contributions(X[:20], classes),
+                               tree_path_contributions(model, X[:20], classes), atol=1e-12)
+
+
+def test_saved_forest_is_served_memory_mapped(forest, tmp_path):
+    model, X = forest
+    FlatForest.from_sklearn(model).save(str(tmp_path))
+
+    loaded = FlatForest.load(str(tmp_path), mmap_mode="r")
+    assert isinstance(loaded.value, np.memmap) and isinstance(loaded.feature, np.memmap)
+    assert loaded.n_estimators == 15 and loaded.n_features_in_ == X.shape[1]
+    np.testing.assert_allclose(loaded.predict_proba(X), model.predict_proba(X))
+    np.testing.assert_allclose(loaded.feature_importances_, model.feature_importances_)
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from app.services.inference_scheduler import MicroBatchScheduler
+
+
+def doubled_or_error(requests):
+    return [ValueError(f"bad row in {rows}") if "bad" in rows else [row * 2 for row in rows] for rows in requests]
+
+
+def test_requests_are_batched_and_errors_reach_only_their_caller():
+    scheduler = MicroBatchScheduler(doubled_or_error, max_batch_size=64, max_wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(scheduler.submit([1, 2]), scheduler.submit(["bad"]), scheduler.submit([3]),
+                                    return_exceptions=True)
+
+    first, failed, third = asyncio.run(run())
+    assert first == [2, 4]
+    assert third == [6]
+    assert isinstance(failed, ValueError)
+
+    stats = scheduler.stats()
+    assert stats["batch_size_histogram"]["count"] == 1
+    assert stats["failed_requests"] == 1
+    assert stats["failed_batches"] == 0
+
+
+def test_failing_batch_function_fails_every_caller():
+    def broken(requests):
+        raise RuntimeError("model unavailable")
+
+    scheduler = MicroBatchScheduler(broken, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(scheduler.submit([1]), scheduler.submit([2]), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run()))
+    assert scheduler.failed_batches == 1
@@ -0,0 +1,38 @@
+import hashlib
+
+import pytest
+
+from app.services.merkle import MerkleTree, record_data_hash, root_from_proof, verify_proof
+
+
+def record_hashes(n):
+    return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(n)]
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 5, 8, 13])
+def test_every_leaf_proves_into_the_root(n):
+    hashes = record_hashes(n)
+    tree = MerkleTree(hashes)
+    for i, record_hash in enumerate(hashes):
+        proof = tree.proof(i)
+        assert root_from_proof(record_hash, proof) == tree.root
+        assert verify_proof(record_hash, proof, tree.root)
+
+
+def test_proof_rejects_other_hashes_and_tampered_steps():
+    hashes = record_hashes(5)
+    tree = MerkleTree(hashes)
+    proof = tree.proof(2)
+    assert not verify_proof(hashes[3], proof, tree.root)
+    sibling, side = proof[0]
+    assert not verify_proof(hashes[2], [(sibling, "left" if side == "right" else "right")] + proof[1:], tree.root)
+    assert not verify_proof(hashes[2], [("zz", side)] + proof[1:], tree.root)
+
+
+def test_odd_levels_do_not_duplicate_the_last_leaf():
+    hashes = record_hashes(3)
+    assert MerkleTree(hashes).root != MerkleTree(hashes + hashes[-1:]).root
+
+
+def test_record_hash_ignores_key_order():
+    assert record_data_hash({"a": 1, "b": [2]}) == record_data_hash({"b": [2], "a": 1})
@@ -0,0 +1,74 @@
+import os
+import time
+
+import pytest
+
+from app.services.model_registry import CURRENT_POINTER, ModelRegistry, publish_version
+
+
+@pytest.fixture
+def registry_dir(trained_model_dir, tmp_path):
+    registry = str(tmp_path / "registry")
+    for version in (os.environ["MODEL_VERSION"], "v2", "broken"):
+        publish_version(trained_model_dir, version, registry)
+    with open(os.path.join(registry, "broken", "label_encoder.pkl"), "ab") as f:
+        f.write(b"tampered")
+    return registry
+
+
+def test_activate_swaps_in_a_verified_and_warmed_version(registry_dir):
+    warmed = []
+    registry = ModelRegistry(registry_dir, warm_fn=lambda bundle: warmed.append(bundle.version), poll_seconds=0)
+    before = registry.current
+
+    swap = registry.activate("v2")
+    assert registry.current.version == "v2" and registry.current is not before
+    assert warmed == ["v2"] and swap["from_version"] == before.version
+    with open(os.path.join(registry_dir, CURRENT_POINTER)) as f:
+        assert f.read() == "v2"
+    assert {version["version"] for version in registry.versions()} >= {"v2", "broken"}
+
+
+def test_corrupt_version_is_never_served(registry_dir, trained_model_dir):
+    registry = ModelRegistry(registry_dir, poll_seconds=0)
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        registry.activate("broken")
+    assert registry.current.version == os.environ["MODEL_VERSION"]
+    assert registry.activation["state"] == "failed"
+
+    with pytest.raises(ValueError, match="already exists"):
+        publish_version(trained_model_dir, "v2", registry_dir)
+
+
+def write_pointer(registry_dir, version):
+    with open(os.path.join(registry_dir, CURRENT_POINTER), "w") as f:
+        f.write(version)
+
+
+def test_pinned_version_ignores_the_pointer(registry_dir):
+    write_pointer(registry_dir, "v2")
+    registry = ModelRegistry(registry_dir, poll_seconds=0.05, pinned_version=os.environ["MODEL_VERSION"])
+    time.sleep(0.3)
+    assert registry.current.version == os.environ["MODEL_VERSION"]
+    assert registry.status()["pinned_version"] == os.environ["MODEL_VERSION"]
+
+
+def test_unpinned_worker_follows_the_pointer(registry_dir):
+    write_pointer(registry_dir, os.environ["MODEL_VERSION"])
+    registry = ModelRegistry(registry_dir, poll_seconds=0.05, pinned_version=None)
+    assert registry.current.version == os.environ["MODEL_VERSION"]
+
+    write_pointer(registry_dir, "v2")
+    deadline = time.monotonic() + 10
+    while registry.current.version != "v2" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert registry.current.version == "v2"
+
+
+@pytest.mark.parametrize("version", ["../registry", "..", "v2/../v2", "/tmp", "v2\\..\\x", ".hidden"])
+def test_version_names_cannot_leave_the_registry(registry_dir, version):
+    registry = ModelRegistry(registry_dir, poll_seconds=0)
+    with pytest.raises(ValueError, match="Invalid model version"):
+        registry.activate_in_background(version)
+    with pytest.raises(ValueError, match="Invalid model version"):
+        publish_version(registry_dir, version, registry_dir)
@@ -0,0 +1,89 @@
+import threading
+
+import numpy as np
+
+from app.models import MedicalRecord
+from app.services.patient_index import PatientIndexCache, load_patient_embeddings, patient_record_stamp
+from app.services.record_embeddings import save_record_embeddings
+
+
+def unit_rows(*rows):
+    matrix = np.array(rows, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def add_record(db, patient_name, chunks, embeddings):
+    record = MedicalRecord(patient_name=patient_name, raw_data="{}")
+    db.add(record)
+    db.commit()
+    save_record_embeddings(db, record.id, chunks, embeddings, pages=list(range(1, len(chunks) + 1)))
+    return record.id
+
+
+def test_search_only_covers_the_patients_own_records(db):
+    alice_first = add_record(db, "alice", ["blood pressure 120/80", "no allergies"], unit_rows([1, 0, 0], [0, 1, 0]))
+    alice_second = add_record(db, "alice", ["penicillin allergy"], unit_rows([0, 0.9, 0.1]))
+    add_record(db, "bob", ["bob's allergy to peanuts"], unit_rows([0, 1, 0]))
+    unembedded = MedicalRecord(patient_name="alice", raw_data="{}")
+    db.add(unembedded)
+    db.commit()
+
+    embedded, missing = load_patient_embeddings(db, "alice")
+    assert [record_id for record_id, *_ in embedded] == [alice_first, alice_second]
+    assert [record.id for record in missing] == [unembedded.id]
+
+    indexes = PatientIndexCache()
+    results = indexes.build("alice", embedded).search(unit_rows([0, 1, 0])[0], 5)
+    assert [result["chunk"] for result in results] == ["no allergies", "penicillin allergy", "blood pressure 120/80"]
+    assert {result["record_id"] for result in results} == {alice_first, alice_second}
+    assert results[0]["page"] == 2
+
+
+def test_uploads_are_appended_to_loaded_indexes_only():
+    indexes = PatientIndexCache(max_patients=1)
+    indexes.add_record("alice", 1, ["ignored"], unit_rows([1, 0]))
+    assert indexes.get("alice") is None
+
+    indexes.build("alice", [])
+    indexes.add_record("alice", 2, ["x-ray clear"], unit_rows([1, 0]))
+    assert indexes.get("alice").search(unit_rows([1, 0])[0], 1)[0]["record_id"] == 2
+
+    indexes.build("bob", [])
+    assert indexes.get("alice") is None
+    assert indexes.stats()["evictions"] == 1
+
+
+def test_index_is_rebuilt_when_another_worker_added_records(db):
+    add_record(db, "alice", ["blood pressure 120/80"], unit_rows([1, 0, 0]))
+    indexes = PatientIndexCache()
+    stamp = patient_record_stamp(db, "alice")
+    indexes.build("alice", load_patient_embeddings(db, "alice")[0], stamp=stamp)
+    assert indexes.get("alice", stamp) is not None
+
+    # An upload appended by this worker keeps the index current
+    local = add_record(db, "alice", ["no allergies"], unit_rows([0, 1, 0]))
+    indexes.add_record("alice", local, ["no allergies"], unit_rows([0, 1, 0]))
+    assert indexes.get("alice", patient_record_stamp(db, "alice")) is not None
+
+    # One stored by another worker makes it stale
+    add_record(db, "alice", ["penicillin allergy"], unit_rows([0, 0, 1]))
+    assert indexes.get("alice", patient_record_stamp(db, "alice")) is None
+    assert indexes.stats()["stale_rebuilds"] == 1
+
+
+def test_search_sees_a_consistent_snapshot_while_records_are_appended():
+    index = PatientIndexCache().build("alice", [], dim=2)
+    errors = []
+
+    def search():
+        for _ in range(300):
+            results = index.search(unit_rows([1, 1])[0], 3)
+            if any(result["chunk"] != f"chunk {result['record_id']}" for result in results):
+                errors.append(results)
+
+    searcher = threading.Thread(target=search)
+    searcher.start()
+    for record_id in range(300):
+        index.add(record_id, [f"chunk {record_id}"], unit_rows([record_id % 7 + 1, 1]))
+    searcher.join()
+    assert errors == [] and index.size == 300
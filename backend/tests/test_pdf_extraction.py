@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services import pdf_extraction
+from app.services.pdf_extraction import (PAGE_SOURCE_OCR, PAGE_SOURCE_TEXT, PdfExtractionEngine, join_pages,
+                                         needs_ocr, pdfminer_pages)
+
+PAGES = [
+    "Patient reports persistent cough and mild fever for three days.",
+    "Prescribed amoxicillin 500 mg three times daily for seven days.",
+    "Follow-up visit in two weeks; chest x-ray shows no abnormalities.",
+]
+
+
+def test_pages_are_extracted_in_order_on_the_process_pool(make_pdf):
+    engine = PdfExtractionEngine(workers=2)
+    try:
+        pages = engine.extract_pages(make_pdf(PAGES))
+    finally:
+        engine.shutdown()
+
+    assert [page.page_number for page in pages] == [1, 2, 3]
+    assert [page.text for page in pages] == PAGES
+    assert all(page.source == PAGE_SOURCE_TEXT for page in pages)
+    assert join_pages(pages) == "\n".join(PAGES)
+
+
+def test_text_layer_is_read_through_the_memory_map(make_pdf):
+    assert [text for text, _ in pdfminer_pages(make_pdf(PAGES[:1]))] == PAGES[:1]
+
+
+def test_needs_ocr_for_missing_or_sparse_text_layers():
+    assert needs_ocr("", 0.0)
+    assert needs_ocr("Page 1", 0.0)
+    assert not needs_ocr(PAGES[0], 0.0)
+    # A scanned page with only a caption in its text layer
+    assert needs_ocr(PAGES[0], 0.9)
+    assert not needs_ocr(PAGES[0] * 4, 0.9)
+
+
+def test_only_pages_without_a_text_layer_are_ocrd(make_pdf, monkeypatch):
+    ocr_calls = []
+
+    def fake_ocr(file_path, page_number, dpi):
+        ocr_calls.append(page_number)
+        return "Scanned discharge summary: patient stable, no further treatment needed."
+
+    monkeypatch.setattr(pdf_extraction, "ocr_page", fake_ocr)
+    engine = PdfExtractionEngine(workers=2)
+    # Threads instead of worker processes, so the patched OCR is the one called
+    engine._pool = ThreadPoolExecutor(max_workers=2)
+    try:
+        pages = engine.extract_pages(make_pdf([PAGES[0], "", PAGES[2]]))
+    finally:
+        engine.shutdown()
+
+    assert ocr_calls == [2]
+    assert [page.source for page in pages] == [PAGE_SOURCE_TEXT, PAGE_SOURCE_OCR, PAGE_SOURCE_TEXT]
+    assert pages[1].text.startswith("Scanned discharge summary")
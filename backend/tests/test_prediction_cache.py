@@ -0,0 +1,34 @@
+from app.services.prediction_cache import PredictionCache, symptoms_key
+
+
+def test_symptoms_key_keeps_spelling_order_and_duplicates():
+    assert symptoms_key(["Cough", "chills", "cough"]) != symptoms_key(["chills", "cough"])
+    assert symptoms_key(["cough", "chills"]) != symptoms_key(["chills", "cough"])
+    assert symptoms_key(["cough", "chills"]) == symptoms_key(("cough", "chills"))
+
+
+def test_lru_eviction_and_model_version_change():
+    version = ["v1"]
+    cache = PredictionCache(max_size=2, ttl_seconds=0, version_fn=lambda: version[0], version_check_seconds=0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # Evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    version[0] = "v2"
+    assert cache.get("a") is None
+    assert cache.stats()["invalidations"] == 1 and cache.stats()["size"] == 0
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.prediction_cache.time.monotonic", lambda: now[0])
+    cache = PredictionCache(max_size=4, ttl_seconds=10)
+    cache.put("a", 1)
+    now[0] += 5
+    assert cache.get("a") == 1
+    now[0] += 6
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
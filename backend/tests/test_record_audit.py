@@ -0,0 +1,48 @@
+import json
+
+from app.models import MedicalRecord
+from app.services.merkle import record_data_hash
+from app.services.record_audit import (AUDIT_COMPLETED, OUTCOME_HASH_MISMATCH, OUTCOME_OK, OUTCOME_UNHASHED,
+                                       OUTCOME_UNREADABLE, RecordAuditor)
+
+
+def add_record(db, data, stored_hash=None):
+    raw_data = data if isinstance(data, str) else json.dumps(data)
+    record = MedicalRecord(patient_name="alice", raw_data=raw_data,
+                           hash_value=stored_hash if stored_hash is not None else record_data_hash(json.loads(raw_data)))
+    db.add(record)
+    db.commit()
+    return record.id
+
+
+def reported(auditor):
+    with open(auditor.mismatches_path) as f:
+        return [(entry["record_id"], entry["outcome"]) for entry in map(json.loads, f)]
+
+
+def test_audit_reports_each_bad_record_once_across_a_resume(db, tmp_path):
+    ok = [add_record(db, {"notes": f"visit {i}", "bp": "120/80"}) for i in range(4)]
+    tampered = add_record(db, {"notes": "edited"}, stored_hash=record_data_hash({"notes": "original"}))
+    unreadable = add_record(db, "{not json", stored_hash="00" * 32)
+    add_record(db, {"notes": "never hashed"}, stored_hash="")
+    ok.append(add_record(db, {"b": 1, "a": 2}))  # Keys not in canonical order
+
+    auditor = RecordAuditor(str(tmp_path), workers=1, chunk_size=3)
+    result = auditor.run()
+    assert result["status"] == AUDIT_COMPLETED and result["records"] == 8
+    assert result["counts"] == {OUTCOME_OK: 5, OUTCOME_HASH_MISMATCH: 1, OUTCOME_UNREADABLE: 1, OUTCOME_UNHASHED: 1}
+    expected = [(tampered, OUTCOME_HASH_MISMATCH), (unreadable, OUTCOME_UNREADABLE)]
+    assert reported(auditor) == expected
+
+    # Interrupted after the first chunk, with a report line written past the checkpoint
+    first_chunk_last_id = ok[2]
+    state = dict(result, status="running", last_id=first_chunk_last_id, records=3, report_bytes=0,
+                 counts={OUTCOME_OK: 3})
+    with open(auditor.checkpoint_path, "w") as f:
+        json.dump(state, f)
+    with open(auditor.mismatches_path, "w") as f:
+        f.write(json.dumps({"record_id": tampered, "outcome": OUTCOME_HASH_MISMATCH}) + "\n")
+
+    resumed = RecordAuditor(str(tmp_path), workers=1, chunk_size=3).run()
+    assert resumed["records"] == 8 and resumed["counts"] == result["counts"]
+    assert reported(auditor) == expected
@@ -0,0 +1,40 @@
+import numpy as np
+
+from app.models import MedicalRecord, RecordEmbedding
+from app.services.record_embeddings import (EMBEDDING_DTYPE, encode_chunks, load_record_embeddings,
+                                            save_record_embeddings, top_chunks)
+
+
+class FakeSbert:
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True):
+        vectors = np.array([[len(text), text.count("a"), 1.0] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_embeddings_round_trip_per_model_version(db):
+    record = MedicalRecord(patient_name="alice", raw_data="{}")
+    db.add(record)
+    db.commit()
+    chunks = ["blood pressure normal", "allergic to penicillin", "a"]
+    embeddings = encode_chunks(FakeSbert(), chunks)
+    assert embeddings.dtype == EMBEDDING_DTYPE
+
+    save_record_embeddings(db, record.id, chunks, embeddings, model_version="m1", pages=[1, 1, 2])
+    assert load_record_embeddings(db, record.id, model_version="m2") is None
+
+    stored = load_record_embeddings(db, record.id, model_version="m1")
+    assert stored.chunks == chunks and stored.pages == [1, 1, 2]
+    np.testing.assert_array_equal(stored.embeddings, embeddings)
+
+    # Saving again replaces the row for that version
+    save_record_embeddings(db, record.id, chunks[:1], embeddings[:1], model_version="m1")
+    assert db.query(RecordEmbedding).count() == 1
+    stored = load_record_embeddings(db, record.id, model_version="m1")
+    assert stored.chunks == chunks[:1] and stored.pages is None
+
+
+def test_top_chunks_are_ranked_by_cosine_similarity():
+    embeddings = np.array([[1, 0], [0, 1], [0.8, 0.6]], dtype=EMBEDDING_DTYPE)
+    assert top_chunks(np.array([1.0, 0.0], dtype=np.float32), embeddings, 2).tolist() == [0, 2]
+    assert top_chunks(np.array([0.0, 1.0], dtype=np.float32), embeddings, 5).tolist() == [1, 2, 0]
+    assert top_chunks(np.array([0.0, 1.0], dtype=np.float32), embeddings[:0], 3).tolist() == []
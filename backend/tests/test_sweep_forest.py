@@ -0,0 +1,25 @@
+from benchmarks.sweep_forest import choose_variant, int_list, pareto_front
+
+
+def variant(accuracy, single_ms, size_mb):
+    return {"accuracy": accuracy, "single_ms": single_ms, "size_mb": size_mb}
+
+
+def test_pareto_front_and_export_choice():
+    results = [
+        variant(0.990, 9.0, 40.0),  # Most accurate
+        variant(0.988, 3.0, 10.0),  # Nearly as accurate, much cheaper
+        variant(0.988, 3.1, 6.0),   # As fast within slack, smaller
+        variant(0.950, 1.0, 2.0),   # Fastest, too inaccurate to export
+        variant(0.980, 5.0, 12.0),  # Beaten by the second variant everywhere
+    ]
+    front = pareto_front(results)
+    assert front == [0, 1, 2, 3]
+
+    assert choose_variant(results, front, max_accuracy_drop=0.005, latency_slack=0.1) == 2
+    assert choose_variant(results, front, max_accuracy_drop=0.005, latency_slack=0.0) == 1
+    assert choose_variant(results, front, max_accuracy_drop=0.0, latency_slack=0.1) == 0
+
+
+def test_grid_values_parse_none_as_unlimited():
+    assert int_list("25, none,10") == [25, None, 10]
@@ -0,0 +1,35 @@
+import numpy as np
+
+from app.services.symptom_features import MultiHotSymptomEncoder, SymptomFeatureIndex, load_symptom_vocabulary
+
+
+def test_index_maps_symptoms_to_their_columns():
+    index = SymptomFeatureIndex(["itching", "skin", "rash", "high_fever"], symptoms=["itching", "skin_rash"])
+
+    assert index.lookup("itching") == [(None, 0)]
+    assert index.lookup(" High_Fever ") == [(None, 3)]
+    # No column of its own: credited to the columns of its words
+    assert index.lookup("skin_rash") == [("skin", 1), ("rash", 2)]
+    assert index.lookup("Rash on skin") == [("rash", 2), ("skin", 1)]
+    assert index.lookup("unknown symptom") == []
+
+
+def test_multihot_rows_match_the_training_features():
+    from app.routes.train import multihot_features
+    from conftest import training_frame
+
+    df = training_frame(rows_per_disease=5)
+    vocabulary = load_symptom_vocabulary()
+    columns = sorted(vocabulary, key=vocabulary.get)
+    symptom_lists = [[column for column in columns if row[column] == 1] for _, row in df.iterrows()]
+
+    for use_idf in (False, True):
+        X, config = multihot_features(df, use_idf)
+        encoder = MultiHotSymptomEncoder(vocabulary, idf=config.get("idf"))
+        np.testing.assert_allclose(encoder.transform(symptom_lists).toarray(), X.toarray())
+
+
+def test_multihot_normalizes_and_skips_unknown_symptoms():
+    encoder = MultiHotSymptomEncoder({"itching": 0, "chills": 1, "cough": 2}, idf=[1.0, 2.0, 3.0], dense=True)
+    np.testing.assert_array_equal(encoder.transform([[" Chills", "cough", "cough", "nope"], []]),
+                                  [[0.0, 2.0, 3.0], [0.0, 0.0, 0.0]])
@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.routes.train import LABEL_COLUMN, tfidf_features
+from app.services.model_registry import MODEL_ARTIFACTS
+from conftest import training_frame
+
+
+def test_tfidf_features_match_fitting_on_the_joined_symptom_text():
+    df = training_frame(rows_per_disease=10)
+    # The original feature path: one comma-joined text per row
+    symptoms = df.drop(columns=[LABEL_COLUMN])
+    text = symptoms.apply(lambda row: ",".join(row.index[row == 1]), axis=1)
+    reference = TfidfVectorizer()
+    expected = reference.fit_transform(text)
+
+    X, vectorizer = tfidf_features(df)
+    assert vectorizer.vocabulary_ == reference.vocabulary_
+    np.testing.assert_allclose(vectorizer.idf_, reference.idf_)
+    np.testing.assert_allclose(X.toarray(), expected.toarray())
+    np.testing.assert_allclose(vectorizer.transform(text[:5]).toarray(), expected[:5].toarray())
+
+
+def test_cli_writes_every_serving_artifact(trained_model_dir):
+    missing = [artifact for artifact in MODEL_ARTIFACTS
+               if artifact != "tfidf_vectorizer.pkl" and not os.path.exists(os.path.join(trained_model_dir, artifact))]
+    assert missing == []
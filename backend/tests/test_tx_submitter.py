@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import rlp
+from eth_account import Account
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from app.services.tx_submitter import TransactionSubmitter
+
+KEY = "0x" + "11" * 32
+
+
+class FakeEth:
+    """Node that keeps sent transactions by nonce and can lose the response to a send"""
+
+    def __init__(self):
+        self.account = Account
+        self.gas_price = 1000
+        self.pool = {}  # tx hash -> nonce
+        self.sends = 0
+        self.lose_responses = 0
+
+    def get_transaction_count(self, address, block):
+        return len(self.pool)
+
+    def send_raw_transaction(self, raw):
+        self.sends += 1
+        tx_hash = Web3.keccak(raw)
+        nonce = int.from_bytes(rlp.decode(bytes(raw))[0], "big")  # Legacy transaction: nonce is field 0
+        if Web3.to_hex(tx_hash) in self.pool:
+            raise ValueError("already known")
+        if nonce in self.pool.values():
+            raise ValueError("replacement transaction underpriced")
+        self.pool[Web3.to_hex(tx_hash)] = nonce
+        if self.lose_responses:
+            self.lose_responses -= 1
+            raise TimeoutError("Read timed out")
+        return tx_hash
+
+    def get_transaction(self, tx_hash):
+        if tx_hash not in self.pool:
+            raise TransactionNotFound(tx_hash)
+        return {"hash": tx_hash, "nonce": self.pool[tx_hash]}
+
+
+def submitter(eth):
+    web3 = SimpleNamespace(eth=eth, to_hex=Web3.to_hex)
+    return TransactionSubmitter(web3, Account.from_key(KEY).address, KEY, 1, backoff_seconds=0,
+                                receipt_poll_seconds=3600)
+
+
+def test_lost_send_response_is_not_resent_under_a_new_nonce():
+    eth = FakeEth()
+    eth.lose_responses = 1
+    sender = submitter(eth)
+    try:
+        first = sender.submit("root-1").result(timeout=5)
+        second = sender.submit("root-2").result(timeout=5)
+    finally:
+        sender.stop()
+
+    # Both reached the node once, under consecutive nonces
+    assert sorted(eth.pool.values()) == [0, 1]
+    assert eth.pool[first] == 0 and eth.pool[second] == 1
+    assert eth.sends == 2
+    assert sender.stats()["submitted"] == 2
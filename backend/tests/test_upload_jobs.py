@@ -0,0 +1,93 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+from app.models import MedicalRecord, UploadJob
+from app.services.upload_jobs import JOB_FAILED, JOB_RUNNING, JOB_SUCCEEDED, JobStage, UploadJobPipeline
+
+
+def wait_for_status(db, job_id, statuses=(JOB_SUCCEEDED, JOB_FAILED), timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db.expire_all()
+        job = db.query(UploadJob).filter(UploadJob.id == job_id).first()
+        if job.status in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} is still {job.status}")
+
+
+def store(db, context):
+    # Like the real store stage: the record is linked to its job in the transaction that creates it
+    job = db.query(UploadJob).filter(UploadJob.id == context["job_id"]).first()
+    if job.record_id is None:
+        record = MedicalRecord(patient_name=context["username"], raw_data=json.dumps({"notes": "text"}))
+        db.add(record)
+        db.flush()
+        job.record_id = record.id
+        db.commit()
+    return {"record_id": job.record_id}
+
+
+def test_stale_job_is_resumed_without_a_duplicate_record(db):
+    # A previous process stored the record, then died before finishing the job
+    record = MedicalRecord(patient_name="alice", raw_data=json.dumps({"notes": "text"}))
+    db.add(record)
+    db.flush()
+    db.add(UploadJob(id="abandoned", username="alice", filename="a.pdf", file_path="/tmp/a.pdf",
+                     status=JOB_RUNNING, record_id=record.id,
+                     stages=json.dumps({"store": {"status": "done"}, "finish": {"status": "running"}}), result="{}",
+                     updated_at=datetime.utcnow() - timedelta(minutes=10)))
+    db.add(UploadJob(id="alive", username="bob", filename="b.pdf", file_path="/tmp/b.pdf", status=JOB_RUNNING,
+                     stages="{}", result="{}", updated_at=datetime.utcnow()))
+    db.commit()
+
+    seen = []
+    pipeline = UploadJobPipeline([JobStage("store", store),
+                                  JobStage("finish", lambda db, context: seen.append(context["record_id"]))],
+                                 stale_seconds=60)
+    assert pipeline.resume_stale() == 1
+    # A claimed job is not resumed twice
+    assert pipeline.resume_stale() == 0
+
+    job = wait_for_status(db, "abandoned")
+    assert job.status == JOB_SUCCEEDED
+    assert job.record_id == record.id
+    assert seen == [record.id]
+    assert db.query(MedicalRecord).count() == 1
+    assert wait_for_status(db, "alive", statuses=(JOB_RUNNING,)).status == JOB_RUNNING
+    assert pipeline.stats()["resumed"] == 1
+
+
+def test_retried_stage_keeps_the_record_it_committed(db):
+    attempts = []
+
+    def store_then_fail_once(db, context):
+        outputs = store(db, context)
+        attempts.append(outputs["record_id"])
+        if len(attempts) == 1:
+            raise ConnectionError("lost the database after commit")
+        return outputs
+
+    pipeline = UploadJobPipeline([JobStage("store", store_then_fail_once)], backoff_seconds=0)
+    pipeline.submit(db, UploadJob(id="retried", username="carol", filename="c.pdf", file_path="/tmp/c.pdf"))
+
+    job = wait_for_status(db, "retried")
+    assert job.status == JOB_SUCCEEDED
+    assert attempts == [job.record_id, job.record_id]
+    assert db.query(MedicalRecord).count() == 1
+
+
+def test_monitor_touches_jobs_of_live_workers(db):
+    pipeline = UploadJobPipeline([JobStage("wait", lambda db, context: time.sleep(0.6))], stale_seconds=0.15)
+    pipeline.submit(db, UploadJob(id="slow", username="dave", filename="d.pdf", file_path="/tmp/d.pdf"))
+    other = UploadJobPipeline([], stale_seconds=0.15)
+    pipeline.start()
+    try:
+        time.sleep(0.4)
+        # Running for longer than stale_seconds, but its worker keeps touching it,
+        # so another process never takes it over
+        assert other.resume_stale() == 0
+        assert wait_for_status(db, "slow").status == JOB_SUCCEEDED
+    finally:
+        pipeline.stop()
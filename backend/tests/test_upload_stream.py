@@ -0,0 +1,67 @@
+import asyncio
+import hashlib
+import os
+import threading
+
+import pytest
+from starlette.requests import Request
+
+from app.services import upload_stream
+from app.services.upload_stream import UploadRejected, UploadTooLarge, receive_upload
+
+BOUNDARY = "----medchain-test"
+
+
+def multipart_request(content: bytes, chunk_size: int = 4096, filename: str = "scan.pdf") -> Request:
+    """A multipart upload without Content-Length, delivered in chunk_size pieces"""
+    body = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"username\"\r\n\r\nalice\r\n"
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+    pieces = [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)]
+
+    async def receive():
+        return {"type": "http.request", "body": pieces.pop(0) if pieces else b"", "more_body": bool(pieces)}
+
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    return Request({"type": "http", "method": "POST", "path": "/upload", "headers": headers}, receive)
+
+
+def test_file_is_written_and_hashed_off_the_event_loop(tmp_path, monkeypatch):
+    content = os.urandom(200_000)
+    io_threads = []
+    fsync = os.fsync
+
+    def recording_fsync(fd):
+        io_threads.append(threading.current_thread())
+        fsync(fd)
+
+    def path_for(name):
+        io_threads.append(threading.current_thread())
+        return str(tmp_path / name)
+
+    monkeypatch.setattr(upload_stream.os, "fsync", recording_fsync)
+    upload = asyncio.run(receive_upload(multipart_request(content), "file", path_for, 1024 * 1024))
+
+    assert upload.fields == {"username": "alice"}
+    assert upload.size == len(content)
+    assert upload.content_sha256 == hashlib.sha256(content).hexdigest()
+    assert (tmp_path / "scan.pdf").read_bytes() == content
+    assert len(io_threads) == 2
+    assert threading.main_thread() not in io_threads
+
+
+def test_oversized_upload_is_refused_without_leaving_a_file(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(receive_upload(multipart_request(os.urandom(50_000)), "file",
+                                   lambda name: str(tmp_path / name), 10_000))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rejected_file_name_opens_nothing(tmp_path):
+    def path_for(name):
+        raise UploadRejected(400, "Only .pdf files are supported")
+
+    with pytest.raises(UploadRejected) as rejected:
+        asyncio.run(receive_upload(multipart_request(b"text", filename="notes.txt"), "file", path_for, 10_000))
+    assert rejected.value.status_code == 400
+    assert list(tmp_path.iterdir()) == []
@@ -32,6 +32,41 @@ export const uploadMedicalRecord = async (file, username) => {
   }
 };
 
+// Function to get the status of a background upload job
+export const getUploadJob = async (jobId) => {
+  try {
+    const token = localStorage.getItem('medchain_token');
+    if (!token) {
+      throw new Error('Authentication required');
+    }
+
+    const response = await axios.get(`/medical_chatbot/jobs/${jobId}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`
+      }
+    });
+
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching upload job:', error);
+    throw error;
+  }
+};
+
+// Poll an upload job until it finishes; onProgress receives every status update
+export const waitForUploadJob = async (jobId, onProgress, intervalMs = 1500) => {
+  for (;;) {
+    const job = await getUploadJob(jobId);
+    if (onProgress) {
+      onProgress(job);
+    }
+    if (job.status === 'succeeded' || job.status === 'failed') {
+      return job;
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
 // Function to ask a question about a medical record
 export const askChatbot = async (recordId, query, userId) => {
   try {
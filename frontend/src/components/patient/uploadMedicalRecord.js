@@ -1,12 +1,14 @@
 import React, { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from '../../api/axios';
+import { waitForUploadJob } from '../../api/chatbot';
 import './UploadMedicalRecord.css';
 
 const UploadMedicalRecord = () => {
   const [file, setFile] = useState(null);
   const [isUploading, setIsUploading] = useState(false);
   const [uploadError, setUploadError] = useState('');
+  const [uploadStage, setUploadStage] = useState('');
   const navigate = useNavigate();
 
   const handleFileChange = (e) => {
@@ -24,6 +26,7 @@ const UploadMedicalRecord = () => {
 
     setIsUploading(true);
     setUploadError('');
+    setUploadStage('');
 
     try {
       const formData = new FormData();
@@ -38,8 +41,19 @@ const UploadMedicalRecord = () => {
         }
       });
 
+      // The upload is processed in the background; poll its job until the record exists
+      const job = await waitForUploadJob(response.data.job_id, (progress) => {
+        const running = Object.entries(progress.stages || {}).find(([, stage]) => stage.status === 'running');
+        setUploadStage(running ? running[0] : progress.status);
+      });
+
+      if (job.status !== 'succeeded') {
+        setUploadError(job.error || 'Failed to process medical record');
+        return;
+      }
+
       // Navigate directly to chatbot with the new record ID
-      navigate(`/chatbot/${response.data.record_id}`);
+      navigate(`/chatbot/${job.record_id}`);
     } catch (error) {
       console.error('Upload error:', error);
       setUploadError(error.response?.data?.detail || 'Failed to upload medical record');
@@ -77,7 +91,7 @@ const UploadMedicalRecord = () => {
           className="upload-btn"
           disabled={isUploading || !file}
         >
-          {isUploading ? 'Uploading...' : 'Upload Record'}
+          {isUploading ? (uploadStage ? `Processing (${uploadStage})...` : 'Uploading...') : 'Upload Record'}
         </button>
       </form>
     </div>